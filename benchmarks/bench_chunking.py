@@ -0,0 +1,91 @@
+"""
+Benchmark the chunking strategies on a synthetic Markdown corpus, or on the
+text files given with --files.
+
+Reports throughput and the number and size of chunks for each strategy,
+next to LangChain's RecursiveCharacterTextSplitter as the baseline for the
+fast recursive path, and the number of embedding requests the chunks pack
+into for the provider given with --embedding-model.
+
+    python -m benchmarks.bench_chunking --documents 200 --chunk-size 500 --chunk-overlap 50 --embedding-model openai
+"""
+import argparse
+import random
+import time
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from src.chunking import ChunkingConfig, get_splitter
+from src.tokens import embedding_model_name, get_embedding_limits, get_token_counter, pack_batches
+from src.schemas import chunkingStrategyEnum
+
+WORDS = (
+    "the knowledge base stores source files and splits them into chunks before embedding "
+    "each chunk so that search can return the most relevant passages for a query while "
+    "keeping enough context around every answer"
+).split()
+
+
+def sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(6, 24))
+    return " ".join(words).capitalize() + rng.choice([".", ".", ".", "?", "!"])
+
+
+def document(rng: random.Random) -> str:
+    lines = [f"# Guide {rng.randint(1, 999)}"]
+    for section in range(rng.randint(3, 8)):
+        lines.append(f"\n## Section {section}\n")
+        for _ in range(rng.randint(2, 6)):
+            lines.append(" ".join(sentence(rng) for _ in range(rng.randint(2, 8))))
+            lines.append("")
+        if rng.random() < 0.3:
+            lines.append("```\n" + "\n".join(f"step_{i}()" for i in range(rng.randint(2, 10))) + "\n```\n")
+    return "\n".join(lines)
+
+
+def run(name: str, split_text, texts: list[str], provider: str):
+    start = time.perf_counter()
+    chunks = [chunk for text in texts for chunk in split_text(text)]
+    elapsed = time.perf_counter() - start
+    megabytes = sum(len(text) for text in texts) / 1_000_000
+    average = sum(len(chunk) for chunk in chunks) / len(chunks) if chunks else 0
+    tokens = [get_token_counter(provider, embedding_model_name(provider))(chunk) for chunk in chunks]
+    average_tokens = sum(tokens) / len(tokens) if tokens else 0
+    requests = len(list(pack_batches(tokens, lambda count: count, get_embedding_limits(provider))))
+    print(
+        f"{name:>20} {megabytes / elapsed:>8.2f} {len(chunks) / elapsed:>12.0f} {len(chunks):>8} "
+        f"{average:>10.0f} {average_tokens:>11.0f} {requests:>9}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--files", nargs="*", help="text files to chunk instead of the synthetic corpus")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--embedding-model", default="openai", choices=["openai", "gemini"])
+    args = parser.parse_args()
+    provider = args.embedding_model.upper()
+
+    if args.files:
+        texts = []
+        for path in args.files:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                texts.append(f.read())
+    else:
+        rng = random.Random(0)
+        texts = [document(rng) for _ in range(args.documents)]
+
+    print(f"{'strategy':>20} {'MB/s':>8} {'chunks/s':>12} {'chunks':>8} {'avg chars':>10} {'avg tokens':>11} {'requests':>9}")
+    baseline = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    run("langchain recursive", baseline.split_text, texts, provider)
+
+    for strategy in chunkingStrategyEnum:
+        config = ChunkingConfig(
+            strategy.value, args.chunk_size, args.chunk_overlap,
+            embedding_model=provider, model_name=embedding_model_name(provider),
+        )
+        run(strategy.value, get_splitter(config).split_text, texts, provider)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Benchmark the rate limited embedding client against a local fake embedding
+server that enforces requests and tokens per minute like a provider does,
+answering 429 (with Retry-After) when they are exceeded and failing a share
+of requests with 503.
+
+Compares the bare client, which gives up on the first error, with the rate
+limited one at increasing concurrency.
+
+    python -m benchmarks.bench_embedding_client --chunks 600 --rpm 600 --tpm 600000 --concurrency 1 4 8
+"""
+import json
+import time
+import logging
+import random
+import argparse
+import threading
+import httpx
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.documents import Document
+from src.embeddings import BatchedEmbeddings, RateLimitedEmbeddings, TokenBucket
+from src.vector_stores import insert_chunks
+from benchmarks.bench_ingest import FakeVectorStore
+
+CHARS_PER_TOKEN = 4
+
+
+class FakeEmbeddingServer(ThreadingHTTPServer):
+    """OpenAI style ``POST /v1/embeddings`` with request and token limits per minute."""
+
+    daemon_threads = True
+
+    def __init__(self, rpm: float, tpm: float, latency: float, error_rate: float, dimensions: int = 8):
+        super().__init__(("127.0.0.1", 0), FakeEmbeddingHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.dimensions = dimensions
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.lock = threading.Lock()
+        self.stats = {"ok": 0, "429": 0, "503": 0}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def admit(self, tokens: int) -> float:
+        """Seconds until the request would fit in the limits, 0 to accept it now."""
+        with self.lock:
+            waits = []
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                now = time.monotonic()
+                bucket.available = min(bucket.capacity, bucket.available + (now - bucket.updated_at) * bucket.rate)
+                bucket.updated_at = now
+                needed = min(amount, bucket.capacity)
+                waits.append(max(0.0, (needed - bucket.available) / bucket.rate))
+            if max(waits) > 0:
+                return max(waits)
+            self.requests.available -= 1
+            self.tokens.available -= tokens
+            return 0.0
+
+    def count(self, outcome: str):
+        with self.lock:
+            self.stats[outcome] += 1
+
+
+class FakeEmbeddingHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["input"]
+        tokens = sum(-(-len(text) // CHARS_PER_TOKEN) for text in texts)
+
+        wait = server.admit(tokens)
+        if wait:
+            server.count("429")
+            self._reply(429, {"error": "rate limit exceeded"}, {"Retry-After": f"{wait:.3f}"})
+            return
+        time.sleep(server.latency)
+        if random.random() < server.error_rate:
+            server.count("503")
+            self._reply(503, {"error": "overloaded"})
+            return
+        server.count("ok")
+        data = [
+            {"index": i, "embedding": [float((hash(text) >> shift) & 0xFF) for shift in range(server.dimensions)]}
+            for i, text in enumerate(texts)
+        ]
+        self._reply(200, {"data": data})
+
+
+class HttpEmbeddings:
+    """Minimal embedding client for the fake server."""
+
+    def __init__(self, url: str):
+        self.client = httpx.Client(base_url=url, timeout=30)
+
+    def embed(self, text: str) -> list[float]:
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        response = self.client.post("/v1/embeddings", json={"input": texts})
+        response.raise_for_status()
+        return [item["embedding"] for item in response.json()["data"]]
+
+
+def run(args, rate_limited: bool, concurrency: int):
+    server = FakeEmbeddingServer(args.rpm, args.tpm, args.latency, args.error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    chunks = [
+        Document(page_content=f"chunk {i} " + "lorem ipsum " * 40, metadata={"chunk": i})
+        for i in range(args.chunks)
+    ]
+    model = HttpEmbeddings(server.url)
+    if rate_limited:
+        model = RateLimitedEmbeddings(
+            model,
+            count_tokens=lambda text: -(-len(text) // CHARS_PER_TOKEN),
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm,
+            concurrency=concurrency,
+            backoff_seconds=0.1,
+            max_backoff_seconds=2,
+        )
+    embedding_model = BatchedEmbeddings(model)
+    vector_store = FakeVectorStore(embedding_model, round_trip=0)
+
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        insert_chunks(vector_store, embedding_model, chunks, "bench", args.batch_size, concurrency=concurrency)
+    except Exception as e:
+        outcome = f"failed ({type(e).__name__})"
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    name = f"{'rate limited' if rate_limited else 'bare'} x{concurrency}"
+    stats = server.stats
+    print(
+        f"{name:>16} {elapsed:>9.2f} {len(vector_store.rows):>8} {stats['ok']:>6} "
+        f"{stats['429']:>6} {stats['503']:>6}  {outcome}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=600)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=600, help="server requests per minute")
+    parser.add_argument("--tpm", type=float, default=600_000, help="server tokens per minute")
+    parser.add_argument("--latency", type=float, default=0.25, help="seconds per embedding request")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="share of requests failing with 503")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+    # Every retry is logged as a warning
+    logging.getLogger("kb_service").setLevel(logging.ERROR)
+
+    print(f"{'client':>16} {'seconds':>9} {'written':>8} {'200s':>6} {'429s':>6} {'503s':>6}")
+    run(args, rate_limited=False, concurrency=max(args.concurrency))
+    for concurrency in args.concurrency:
+        run(args, rate_limited=True, concurrency=concurrency)
+
+
+if __name__ == "__main__":
+    main()
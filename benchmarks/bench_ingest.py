@@ -0,0 +1,89 @@
+"""
+Benchmark chunk ingestion against a local fake embedding model and vector store.
+
+Compares one embedding request and one insert per chunk (batch size 1, the old
+behaviour) with batched embedding and bulk inserts.
+
+    python -m benchmarks.bench_ingest --chunks 2000 --batch-sizes 1 64 128 256
+"""
+import argparse
+import time
+from langchain_core.documents import Document
+from src.embeddings import BatchedEmbeddings
+from src.vector_stores import insert_chunks
+
+
+class FakeEmbeddings:
+    """Embedding model with a fixed per-request latency, like a remote API."""
+
+    def __init__(self, request_latency: float, dimensions: int = 8):
+        self.request_latency = request_latency
+        self.dimensions = dimensions
+        self.requests = 0
+
+    def _vector(self, text: str) -> list[float]:
+        return [float((hash(text) >> shift) & 0xFF) for shift in range(self.dimensions)]
+
+    def embed(self, text: str) -> list[float]:
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        self.requests += 1
+        time.sleep(self.request_latency)
+        return [self._vector(text) for text in texts]
+
+
+class FakeVectorStore:
+    """Vector store with a fixed per-statement round trip latency."""
+
+    def __init__(self, embedding_model, round_trip: float):
+        self.embedding_model = embedding_model
+        self.round_trip = round_trip
+        self.rows = []
+        self.round_trips = 0
+
+    def insert(self, data, metadata, workspace_id):
+        self.round_trips += 1
+        time.sleep(self.round_trip)
+        self.rows.append((self.embedding_model.embed(data), data, metadata, workspace_id))
+
+    def insert_many(self, data, metadata, workspace_id):
+        self.round_trips += 1
+        time.sleep(self.round_trip)
+        for text, meta in zip(data, metadata):
+            self.rows.append((self.embedding_model.embed(text), text, meta, workspace_id))
+
+
+def run(chunk_count: int, batch_size: int, request_latency: float, round_trip: float):
+    chunks = [
+        Document(page_content=f"chunk {i} " + "lorem ipsum " * 40, metadata={"chunk": i})
+        for i in range(chunk_count)
+    ]
+    fake_model = FakeEmbeddings(request_latency)
+    embedding_model = BatchedEmbeddings(fake_model)
+    vector_store = FakeVectorStore(embedding_model, round_trip)
+
+    start = time.perf_counter()
+    insert_chunks(vector_store, embedding_model, chunks, "bench", batch_size)
+    elapsed = time.perf_counter() - start
+
+    assert len(vector_store.rows) == chunk_count
+    return elapsed, fake_model.requests, vector_store.round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64, 128, 256])
+    parser.add_argument("--request-latency", type=float, default=0.02, help="seconds per embedding request")
+    parser.add_argument("--round-trip", type=float, default=0.002, help="seconds per vector store write")
+    args = parser.parse_args()
+
+    print(f"{'batch':>6} {'seconds':>9} {'embed calls':>12} {'db round trips':>15}")
+    for batch_size in args.batch_sizes:
+        elapsed, requests, round_trips = run(args.chunks, batch_size, args.request_latency, args.round_trip)
+        print(f"{batch_size:>6} {elapsed:>9.2f} {requests:>12} {round_trips:>15}")
+
+
+if __name__ == "__main__":
+    main()
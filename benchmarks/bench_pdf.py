@@ -0,0 +1,88 @@
+"""
+Benchmark PDF extraction: loading every page with PyPDFLoader, joining and
+splitting the whole text, against splitting page by page as the pages are
+read. Builds a synthetic text-only PDF unless one is given with --file.
+
+Reports time and peak traced memory for each path.
+
+    python -m benchmarks.bench_pdf --pages 1000
+"""
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+from langchain_community.document_loaders import PyPDFLoader
+from src.chunking import ChunkingConfig, get_splitter
+from src.loaders import split_file
+
+LINE = "Section {page}.{line}: the knowledge base splits long manuals into chunks before embedding them."
+
+def write_pdf(path: str, pages: int, lines_per_page: int = 40):
+    """Minimal PDF with one Helvetica text stream per page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(1, pages + 1):
+        text = " ".join(
+            f"({LINE.format(page=page, line=line)}) Tj T*" for line in range(lines_per_page)
+        )
+        stream = f"BT /F1 9 Tf 12 TL 36 800 Td {text} ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 3 0 R >> >> >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+def load_and_join(path: str, config: ChunkingConfig) -> int:
+    text = "".join(doc.page_content for doc in PyPDFLoader(path).load())
+    return len(get_splitter(config).split_text(text))
+
+def page_by_page(path: str, config: ChunkingConfig) -> int:
+    return len(split_file(path, config).chunks)
+
+def measure(name: str, run, path: str, config: ChunkingConfig):
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = run(path, config)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>14} {elapsed:>9.2f} {peak / 2**20:>12.1f} {chunks:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--file", help="PDF to extract instead of a synthetic one")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    args = parser.parse_args()
+
+    config = ChunkingConfig(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.file
+        if path is None:
+            path = os.path.join(tmp_dir, "manual.pdf")
+            write_pdf(path, args.pages)
+        print(f"{os.path.getsize(path) / 2**20:.1f} MiB PDF")
+        print(f"{'path':>14} {'seconds':>9} {'peak MiB':>12} {'chunks':>8}")
+        measure("load and join", load_and_join, path, config)
+        measure("page by page", page_by_page, path, config)
+
+if __name__ == "__main__":
+    main()
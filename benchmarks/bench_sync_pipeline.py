@@ -0,0 +1,82 @@
+"""
+Benchmark the sync pipeline with simulated stage latencies: parsing each
+file, each embedding request and each vector store write.
+
+Compares the phased sync (parse and split everything, then embed and write)
+with the pipelined one, where chunks flow to the embedder through a bounded
+queue while later files are still being parsed.
+
+    python -m benchmarks.bench_sync_pipeline --files 40 --parse-seconds 0.05 --request-latency 0.05
+"""
+import time
+import argparse
+import tracemalloc
+from langchain_core.documents import Document
+from src.embeddings import BatchedEmbeddings, EMBEDDING_CONCURRENCY
+from src.tokens import EmbeddingLimits
+from src.vector_stores import insert_chunks, VectorStoreWriter
+from benchmarks.bench_ingest import FakeEmbeddings, FakeVectorStore
+
+
+def parse(file_number: int, chunks_per_file: int, parse_seconds: float) -> list[Document]:
+    time.sleep(parse_seconds)
+    return [
+        Document(page_content=f"file {file_number} chunk {i} " + "lorem ipsum " * 40, metadata={"file": file_number})
+        for i in range(chunks_per_file)
+    ]
+
+
+def phased(args, vector_store, embedding_model, limits):
+    chunks = []
+    for file_number in range(args.files):
+        chunks.extend(parse(file_number, args.chunks_per_file, args.parse_seconds))
+    insert_chunks(vector_store, embedding_model, chunks, "bench", limits=limits, count_tokens=len)
+
+
+def pipelined(args, vector_store, embedding_model, limits):
+    writer = VectorStoreWriter(vector_store, embedding_model, "bench", limits=limits, count_tokens=len, queue_size=args.queue_size)
+    for file_number in range(args.files):
+        writer.add(str(file_number), parse(file_number, args.chunks_per_file, args.parse_seconds))
+    writer.close()
+
+
+def run(name: str, sync, args):
+    fake_model = FakeEmbeddings(args.request_latency)
+    embedding_model = BatchedEmbeddings(fake_model)
+    vector_store = FakeVectorStore(embedding_model, args.round_trip)
+    limits = EmbeddingLimits(max_input_tokens=8191, max_batch_tokens=10**9, max_batch_size=args.batch_size)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    sync(args, vector_store, embedding_model, limits)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert len(vector_store.rows) == args.files * args.chunks_per_file
+    print(f"{name:>10} {elapsed:>9.2f} {fake_model.requests:>12} {peak / 2**20:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--chunks-per-file", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--queue-size", type=int, default=1024, help="chunks queued between splitting and embedding")
+    parser.add_argument("--parse-seconds", type=float, default=0.05, help="seconds to parse and split a file")
+    parser.add_argument("--request-latency", type=float, default=0.05, help="seconds per embedding request")
+    parser.add_argument("--round-trip", type=float, default=0.01, help="seconds per vector store write")
+    args = parser.parse_args()
+
+    batches = args.files * args.chunks_per_file / args.batch_size
+    print(
+        f"stages: parse {args.files * args.parse_seconds:.2f}s, "
+        f"embed {batches * args.request_latency / EMBEDDING_CONCURRENCY:.2f}s ({EMBEDDING_CONCURRENCY} at once), write {batches * args.round_trip:.2f}s"
+    )
+    print(f"{'sync':>10} {'seconds':>9} {'embed calls':>12} {'peak MiB':>10}")
+    run("phased", phased, args)
+    run("pipelined", pipelined, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from src import models
+from src.database import DATABASE_URL
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = models.Base.metadata
+
+# Held while migrating so that workers starting together don't all migrate
+MIGRATION_LOCK_ID = 0x6B625F6D  # "kb_m"
+
+def database_url() -> str:
+    # sqlalchemy.url in alembic.ini or -x overrides the application database
+    return config.get_main_option("sqlalchemy.url") or DATABASE_URL
+
+def run_migrations_offline():
+    context.configure(
+        url=database_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations(connection):
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        if connection.dialect.name == "postgresql":
+            # Waits for a migration in progress; the version is read after it is done
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        context.run_migrations()
+
+def run_migrations_online():
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run_migrations(connection)
+        return
+    # Own engine without the application's statement timeout, index builds can take a while
+    engine = create_engine(database_url(), poolclass=NullPool)
+    with engine.connect() as connection:
+        run_migrations(connection)
+    engine.dispose()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,85 @@
+"""initial schema
+
+The tables as the service created them with ``create_all`` before migrations
+were introduced. Tables that already exist are left alone, so a database set
+up that way is brought under migration by upgrading it like a new one.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = sa.inspect(op.get_bind()).get_table_names()
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("username", sa.String()),
+            sa.Column("email", sa.String()),
+            sa.Column("full_name", sa.String(), nullable=True),
+            sa.Column("hashed_password", sa.String()),
+            sa.Column("is_active", sa.Boolean()),
+            sa.Column("is_admin", sa.Boolean()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if "knowledge_bases" not in existing:
+        op.create_table(
+            "knowledge_bases",
+            sa.Column("kb_id", sa.String(), primary_key=True),
+            sa.Column("name", sa.String()),
+            sa.Column("description", sa.String()),
+            sa.Column("category", sa.String()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("last_updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("embedding_model", sa.String()),
+            sa.Column("vector_store", sa.String()),
+            sa.Column("status", sa.String()),
+            sa.Column("workspace_id", sa.String(), nullable=True),
+            sa.Column("created_by", sa.String(), sa.ForeignKey("users.username"), nullable=False),
+        )
+        for column in ("kb_id", "name", "description", "category", "embedding_model", "vector_store"):
+            op.create_index(f"ix_knowledge_bases_{column}", "knowledge_bases", [column])
+
+    if "file_metadata" not in existing:
+        op.create_table(
+            "file_metadata",
+            sa.Column("file_id", sa.String(), primary_key=True),
+            sa.Column("filename", sa.String()),
+            sa.Column("file_size", sa.Integer()),
+            sa.Column("file_type", sa.String()),
+            sa.Column("upload_date", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("uploaded_by", sa.String(), sa.ForeignKey("users.username"), nullable=False),
+            sa.Column("kb_id", sa.String(), sa.ForeignKey("knowledge_bases.kb_id")),
+            sa.Column("file_path", sa.String()),
+            sa.Column("url", sa.String(), nullable=True),
+            sa.Column("status", sa.String()),
+        )
+        op.create_index("ix_file_metadata_file_id", "file_metadata", ["file_id"])
+        op.create_index("ix_file_metadata_filename", "file_metadata", ["filename"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("file_metadata")
+    op.drop_table("knowledge_bases")
+    op.drop_table("users")
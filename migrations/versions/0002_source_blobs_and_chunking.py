@@ -0,0 +1,67 @@
+"""source blobs, chunking settings and URL validators
+
+Columns and tables added to the models while the schema was still created
+with ``create_all``, which never altered existing tables. Only what is
+missing is added.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 09:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _add_missing_columns(table: str, columns: list[sa.Column]):
+    existing = {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+    # Batch mode only rebuilds the table on SQLite, which can't add a foreign key with ALTER
+    with op.batch_alter_table(table) as batch_op:
+        for column in columns:
+            if column.name not in existing:
+                batch_op.add_column(column)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if "source_blobs" not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            "source_blobs",
+            sa.Column("content_hash", sa.String(), primary_key=True),
+            sa.Column("file_path", sa.String(), nullable=False),
+            sa.Column("file_size", sa.Integer()),
+            sa.Column("ref_count", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+
+    _add_missing_columns("knowledge_bases", [
+        sa.Column("chunking_strategy", sa.String(), server_default="recursive"),
+        sa.Column("chunk_size", sa.Integer(), server_default="500"),
+        sa.Column("chunk_overlap", sa.Integer(), server_default="50"),
+    ])
+    _add_missing_columns("file_metadata", [
+        sa.Column("content_hash", sa.String(), sa.ForeignKey("source_blobs.content_hash", name="file_metadata_content_hash_fkey"), nullable=True),
+        sa.Column("etag", sa.String(), nullable=True),
+        sa.Column("last_modified", sa.String(), nullable=True),
+        sa.Column("last_fetched_at", sa.DateTime(timezone=True), nullable=True),
+    ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("file_metadata") as batch_op:
+        for column in ("last_fetched_at", "last_modified", "etag", "content_hash"):
+            batch_op.drop_column(column)
+    with op.batch_alter_table("knowledge_bases") as batch_op:
+        for column in ("chunk_overlap", "chunk_size", "chunking_strategy"):
+            batch_op.drop_column(column)
+    op.drop_table("source_blobs")
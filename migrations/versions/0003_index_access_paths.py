@@ -0,0 +1,65 @@
+"""index the access paths, drop indexes no query uses
+
+Drops single column indexes that only slowed down writes: the free text and
+configuration columns of knowledge bases, a filename nothing filters on, and
+indexes duplicating primary keys. Adds composite indexes for the queries the
+service runs: files of a knowledge base by status (sync), by file ID and in
+upload order (source listing), and knowledge bases by creation time within a
+workspace or overall (listings). A knowledge base's files are found through
+the leading kb_id of these indexes.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16 09:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DROPPED_INDEXES = {
+    "knowledge_bases": ["kb_id", "description", "category", "embedding_model", "vector_store"],
+    "file_metadata": ["file_id", "filename"],
+    "users": ["id"],
+}
+
+ADDED_INDEXES = {
+    "knowledge_bases": {
+        "ix_knowledge_bases_workspace_id_created_at": ["workspace_id", "created_at", "kb_id"],
+        "ix_knowledge_bases_created_at": ["created_at", "kb_id"],
+    },
+    "file_metadata": {
+        "ix_file_metadata_kb_id_status": ["kb_id", "status"],
+        "ix_file_metadata_kb_id_file_id": ["kb_id", "file_id"],
+        "ix_file_metadata_kb_id_upload_date": ["kb_id", "upload_date", "file_id"],
+    },
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, columns in DROPPED_INDEXES.items():
+        for column in columns:
+            op.drop_index(f"ix_{table}_{column}", table_name=table, if_exists=True)
+    for table, indexes in ADDED_INDEXES.items():
+        for name, columns in indexes.items():
+            # ix_file_metadata_kb_id_status may already exist from create_all
+            op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, indexes in ADDED_INDEXES.items():
+        for name in indexes:
+            op.drop_index(name, table_name=table, if_exists=True)
+    for table, columns in DROPPED_INDEXES.items():
+        for column in columns:
+            op.create_index(f"ix_{table}_{column}", table, [column], if_not_exists=True)
@@ -0,0 +1,63 @@
+import time
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory LRU cache whose entries also expire after
+    ``ttl_seconds``. The least recently used entry is evicted once the cache
+    holds ``max_entries``.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemoryEmbeddingCache(TTLCache):
+    """In-memory counterpart of EmbeddingCache, for short-lived vectors such as search queries."""
+
+    def get_many(self, model_name: str, texts: list[str]) -> dict[str, list[float]]:
+        found = {}
+        for text in texts:
+            vector = self.get((model_name, text))
+            if vector is not None:
+                found[text] = vector
+        return found
+
+    def put_many(self, model_name: str, vectors: dict[str, list[float]]):
+        for text, vector in vectors.items():
+            self.set((model_name, text), vector)
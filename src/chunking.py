@@ -0,0 +1,274 @@
+import re
+from collections import deque
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from langchain_text_splitters import CharacterTextSplitter
+from .schemas import chunkingStrategyEnum
+from .extraction_cache import splitter_cache_key
+from .tokens import embedding_model_name, get_token_counter, get_embedding_limits
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_CHUNK_OVERLAP = 50
+DEFAULT_SEPARATORS = ["\n\n", "\n", " ", ""]
+# Markdown headings at or above this level start a new section
+MARKDOWN_SECTION_LEVEL = 3
+
+@dataclass(frozen=True)
+class ChunkingConfig:
+    """
+    How a knowledge base splits its sources into chunks. Sizes are in
+    characters except for the token strategy, which counts tokens of the
+    embedding model. No chunk is longer than the model accepts.
+    """
+    strategy: str = chunkingStrategyEnum.RECURSIVE.value
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
+    embedding_model: str = None  # provider, OPENAI or GEMINI
+    model_name: str = None
+
+    @classmethod
+    def from_kb(cls, kb) -> "ChunkingConfig":
+        provider = kb.embedding_model.upper() if kb.embedding_model else None
+        return cls(
+            strategy=kb.chunking_strategy or chunkingStrategyEnum.RECURSIVE.value,
+            chunk_size=kb.chunk_size or DEFAULT_CHUNK_SIZE,
+            chunk_overlap=kb.chunk_overlap if kb.chunk_overlap is not None else DEFAULT_CHUNK_OVERLAP,
+            embedding_model=provider,
+            model_name=embedding_model_name(provider),
+        )
+
+    def cache_key(self) -> str:
+        """Key of the chunk cache, so changing any setting re-splits the sources."""
+        return splitter_cache_key(asdict(self))
+
+class FastRecursiveSplitter:
+    """
+    Same chunks as LangChain's ``RecursiveCharacterTextSplitter`` with its
+    default settings (plain separators kept at the start of each piece,
+    whitespace stripped), without the regex search and split per level, the
+    repeated length calls and the list copies of its merge step.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, separators: list[str] = None, length_function=len):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"Chunk overlap ({chunk_overlap}) is larger than chunk size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators or DEFAULT_SEPARATORS
+        self.length_function = length_function
+
+    def split_text(self, text: str) -> list[str]:
+        chunks = []
+        self._split(text, self.separators, chunks)
+        return chunks
+
+    def _split(self, text: str, separators: list[str], chunks: list[str]):
+        # Split on the first separator present in the text, keeping it at the start of each piece
+        separator = separators[-1]
+        remaining = []
+        for i, candidate in enumerate(separators):
+            if not candidate:
+                separator = candidate
+                break
+            if candidate in text:
+                separator = candidate
+                remaining = separators[i + 1:]
+                break
+
+        if separator:
+            parts = text.split(separator)
+            pieces = [parts[0]] if parts[0] else []
+            pieces.extend(separator + part for part in parts[1:])
+        else:
+            pieces = list(text)
+
+        length = self.length_function
+        small = []
+        for piece in pieces:
+            piece_length = length(piece)
+            if piece_length < self.chunk_size:
+                small.append((piece, piece_length))
+                continue
+            if small:
+                self._merge(small, chunks)
+                small = []
+            if remaining:
+                self._split(piece, remaining, chunks)
+            else:
+                chunks.append(piece)
+        if small:
+            self._merge(small, chunks)
+
+    def _merge(self, pieces: list[tuple[str, int]], chunks: list[str]):
+        # Pack pieces into chunks, carrying up to chunk_overlap of the previous chunk over
+        current = deque()
+        total = 0
+        for piece, piece_length in pieces:
+            if total + piece_length > self.chunk_size and current:
+                chunk = "".join(p for p, _ in current).strip()
+                if chunk:
+                    chunks.append(chunk)
+                while total > self.chunk_overlap or (total + piece_length > self.chunk_size and total > 0):
+                    total -= current.popleft()[1]
+            current.append((piece, piece_length))
+            total += piece_length
+        chunk = "".join(p for p, _ in current).strip()
+        if chunk:
+            chunks.append(chunk)
+
+# Sentence ends followed by whitespace, or blank lines between paragraphs
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?。！？])[\"'”’)\]]*\s+|\n\s*\n")
+
+class SentenceSplitter:
+    """
+    Packs whole sentences into chunks, with whole sentences of overlap.
+    Sentences longer than a chunk are split with the recursive splitter.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, length_function=len):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_function = length_function
+        self._long_sentences = FastRecursiveSplitter(chunk_size, 0, length_function=length_function)
+
+    def sentences(self, text: str):
+        start = 0
+        for boundary in _SENTENCE_BOUNDARY.finditer(text):
+            yield text[start:boundary.end()]
+            start = boundary.end()
+        if start < len(text):
+            yield text[start:]
+
+    def split_text(self, text: str) -> list[str]:
+        length = self.length_function
+        chunks = []
+        current = deque()
+        total = 0
+        for sentence in self.sentences(text):
+            sentence_length = length(sentence)
+            pieces = [(sentence, sentence_length)]
+            if sentence_length > self.chunk_size:
+                pieces = [(piece + " ", length(piece) + 1) for piece in self._long_sentences.split_text(sentence)]
+
+            for piece, piece_length in pieces:
+                if total + piece_length > self.chunk_size and current:
+                    chunks.append("".join(p for p, _ in current).strip())
+                    # Carry the trailing sentences that fit in the overlap into the next chunk
+                    carried = 0
+                    kept = deque()
+                    while current and carried + current[-1][1] <= self.chunk_overlap:
+                        kept.appendleft(current.pop())
+                        carried += kept[0][1]
+                    current, total = kept, carried
+                    while current and total + piece_length > self.chunk_size:
+                        total -= current.popleft()[1]
+                current.append((piece, piece_length))
+                total += piece_length
+        if current:
+            chunks.append("".join(p for p, _ in current).strip())
+        return [chunk for chunk in chunks if chunk]
+
+_MARKDOWN_HEADING = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$")
+_MARKDOWN_FENCE = re.compile(r"^(```|~~~)")
+
+class MarkdownSplitter:
+    """
+    Splits Markdown into sections at headings, then each section with the
+    recursive splitter. Every chunk starts with the headings it sits under,
+    so chunks from deep in a document keep their context.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, section_level: int = MARKDOWN_SECTION_LEVEL, length_function=len):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.section_level = section_level
+        self.length_function = length_function
+        self._splitters = {}
+
+    def sections(self, text: str):
+        """Yield ``(heading path, section text)`` pairs; headings inside code blocks are ignored."""
+        headings = []
+        lines = []
+        in_fence = False
+        for line in text.splitlines():
+            if _MARKDOWN_FENCE.match(line.lstrip()):
+                in_fence = not in_fence
+            heading = None if in_fence else _MARKDOWN_HEADING.match(line)
+            if heading and len(heading.group(1)) <= self.section_level:
+                if lines:
+                    yield list(headings), "\n".join(lines)
+                    lines = []
+                level = len(heading.group(1))
+                headings = [h for h in headings if h[0] < level] + [(level, line.strip())]
+                continue
+            lines.append(line)
+        if lines:
+            yield list(headings), "\n".join(lines)
+
+    def _splitter_for(self, prefix_length: int) -> FastRecursiveSplitter:
+        # Leave room for the heading prefix, but never shrink a chunk below half its size
+        size = max(self.chunk_size - prefix_length, self.chunk_size // 2)
+        if size not in self._splitters:
+            self._splitters[size] = FastRecursiveSplitter(size, min(self.chunk_overlap, size), length_function=self.length_function)
+        return self._splitters[size]
+
+    def split_text(self, text: str) -> list[str]:
+        chunks = []
+        for headings, section in self.sections(text):
+            if not section.strip():
+                continue
+            prefix = "\n".join(heading for _, heading in headings)
+            prefix_length = self.length_function(prefix) + 2 if prefix else 0
+            for chunk in self._splitter_for(prefix_length).split_text(section):
+                chunks.append(f"{prefix}\n\n{chunk}" if prefix else chunk)
+        return chunks
+
+class TokenLimitedSplitter:
+    """
+    Re-splits, by tokens, the chunks of another splitter that are longer
+    than the embedding model accepts, instead of letting the provider
+    truncate or reject them.
+    """
+
+    def __init__(self, splitter, count_tokens, max_tokens: int):
+        self.splitter = splitter
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self._fallback = FastRecursiveSplitter(max_tokens, 0, length_function=count_tokens)
+
+    def split_text(self, text: str) -> list[str]:
+        chunks = []
+        for chunk in self.splitter.split_text(text):
+            # A character is at most 4 UTF-8 bytes and a token at least one, so short chunks aren't counted
+            if len(chunk) * 4 <= self.max_tokens or self.count_tokens(chunk) <= self.max_tokens:
+                chunks.append(chunk)
+            else:
+                chunks.extend(self._fallback.split_text(chunk))
+        return chunks
+
+def _build_splitter(config: ChunkingConfig, count_tokens):
+    strategy = chunkingStrategyEnum(config.strategy)
+    if strategy == chunkingStrategyEnum.RECURSIVE:
+        return FastRecursiveSplitter(config.chunk_size, config.chunk_overlap)
+    if strategy == chunkingStrategyEnum.CHARACTER:
+        return CharacterTextSplitter(separator="\n\n", chunk_size=config.chunk_size, chunk_overlap=config.chunk_overlap)
+    if strategy == chunkingStrategyEnum.TOKEN:
+        return FastRecursiveSplitter(config.chunk_size, config.chunk_overlap, length_function=count_tokens)
+    if strategy == chunkingStrategyEnum.SENTENCE:
+        return SentenceSplitter(config.chunk_size, config.chunk_overlap)
+    if strategy == chunkingStrategyEnum.MARKDOWN:
+        return MarkdownSplitter(config.chunk_size, config.chunk_overlap)
+    raise ValueError(f"Unsupported chunking strategy {config.strategy}")
+
+@lru_cache(maxsize=64)
+def get_splitter(config: ChunkingConfig):
+    """Splitter for a chunking configuration, built once and shared by all syncs."""
+    count_tokens = get_token_counter(config.embedding_model, config.model_name)
+    max_tokens = get_embedding_limits(config.embedding_model).max_input_tokens
+    splitter = _build_splitter(config, count_tokens)
+    if config.strategy == chunkingStrategyEnum.TOKEN.value and config.chunk_size <= max_tokens:
+        return splitter
+    return TokenLimitedSplitter(splitter, count_tokens, max_tokens)
+
+def split_text(text: str, config: ChunkingConfig) -> list[str]:
+    return get_splitter(config).split_text(text)
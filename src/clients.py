@@ -0,0 +1,147 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+logger = logging.getLogger("kb_service")
+
+
+@dataclass
+class _PooledClient:
+    client: object
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    last_checked: float = field(default_factory=time.monotonic)
+    leases: int = 0
+    # Dropped from the registry; closed once the last lease is released
+    retired: bool = False
+    closed: bool = False
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of long-lived clients (vector stores, embedding
+    models), so their connections and auth sessions are reused across syncs
+    and searches instead of being rebuilt on every call.
+
+    Clients are checked out with ``lease`` and never closed while leased.
+    Clients unused for ``idle_seconds`` since their last lease ended are
+    closed and dropped. A client is health checked on checkout at most every
+    ``health_check_seconds`` and replaced if the check fails; leases already
+    held keep the old client, which is closed when the last one ends.
+    """
+
+    def __init__(self, name: str, idle_seconds: float, health_check_seconds: float, health_check=None):
+        self.name = name
+        self.idle_seconds = idle_seconds
+        self.health_check_seconds = health_check_seconds
+        self.health_check = health_check
+        self._clients: dict[tuple, _PooledClient] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self, key: tuple, factory):
+        """Check out the client for ``key``, creating it with ``factory()`` if needed."""
+        pooled = self._acquire(key, factory)
+        try:
+            yield pooled.client
+        finally:
+            self._release(pooled)
+
+    def _acquire(self, key: tuple, factory) -> _PooledClient:
+        self.evict_idle()
+
+        with self._lock:
+            pooled = self._clients.get(key)
+            if pooled is not None:
+                pooled.leases += 1
+
+        if pooled is not None and not self._is_healthy(pooled):
+            logger.warning(f"Dropping unhealthy {self.name} client {key}")
+            self._retire(key, pooled)
+            self._release(pooled)
+            pooled = None
+
+        if pooled is None:
+            client = factory()
+            with self._lock:
+                # Another thread may have created one meanwhile; keep the first
+                pooled = self._clients.setdefault(key, _PooledClient(client))
+                pooled.leases += 1
+            if pooled.client is not client:
+                self._close(client)
+        return pooled
+
+    def _release(self, pooled: _PooledClient):
+        with self._lock:
+            pooled.leases -= 1
+            pooled.last_used = time.monotonic()
+            close = pooled.retired and pooled.leases == 0 and not pooled.closed
+            if close:
+                pooled.closed = True
+        if close:
+            self._close(pooled.client)
+
+    def _retire(self, key: tuple, pooled: _PooledClient):
+        with self._lock:
+            if self._clients.get(key) is pooled:
+                del self._clients[key]
+            pooled.retired = True
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [
+                (key, pooled) for key, pooled in self._clients.items()
+                if pooled.leases == 0 and pooled.last_used < cutoff
+            ]
+            for key, pooled in idle:
+                del self._clients[key]
+                pooled.retired = pooled.closed = True
+        for key, pooled in idle:
+            logger.info(f"Closing idle {self.name} client {key}")
+            self._close(pooled.client)
+
+    def close_all(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            for pooled in clients:
+                pooled.retired = pooled.closed = True
+        for pooled in clients:
+            self._close(pooled.client)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "leased": sum(1 for pooled in self._clients.values() if pooled.leases),
+                "idle_seconds": {
+                    "/".join(str(part) for part in key): round(now - pooled.last_used, 1)
+                    for key, pooled in self._clients.items()
+                },
+            }
+
+    def _is_healthy(self, pooled: _PooledClient) -> bool:
+        if self.health_check is None:
+            return True
+        now = time.monotonic()
+        if now - pooled.last_checked < self.health_check_seconds:
+            return True
+        pooled.last_checked = now
+        try:
+            return self.health_check(pooled.client)
+        except Exception as e:
+            logger.warning(f"{self.name} health check failed: {str(e)}")
+            return False
+
+    def _close(self, client):
+        close = getattr(client, "close", None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception as e:
+            logger.warning(f"Failed to close {self.name} client: {str(e)}")
@@ -0,0 +1,215 @@
+import os
+import logging
+import posixpath
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from urllib.parse import urlsplit, urlunsplit, urljoin, parse_qsl, urlencode
+import anyio
+from bs4 import BeautifulSoup
+from dotenv import load_dotenv
+from .fetcher import url_fetcher, UrlFetcher, FetchResult
+from .storage import new_tmp_path
+
+load_dotenv()
+
+logger = logging.getLogger("kb_service")
+
+# Upper bound on pages a single crawl may add, whatever the request asks for
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "500"))
+
+# Query parameters that never change the page content
+_TRACKING_PARAMS = {"gclid", "fbclid", "ref"}
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+@dataclass
+class CrawledPage:
+    url: str
+    depth: int
+    fetched: FetchResult
+
+def normalize_url(url: str) -> str | None:
+    """
+    Canonical form of a URL used to dedup pages: lower-case scheme and host,
+    no default port, fragment or tracking parameters, resolved ``..`` segments
+    and sorted query parameters. Returns None for non-HTTP URLs and ones
+    that can't be parsed, such as a bad port or IPv6 address.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https") or not parts.hostname:
+            return None
+        port = parts.port
+    except ValueError:
+        return None
+
+    host = parts.hostname.lower()
+    if ":" in host:
+        # hostname drops the brackets of an IPv6 address
+        host = f"[{host}]"
+    if port and not (scheme == "http" and port == 80 or scheme == "https" and port == 443):
+        host = f"{host}:{port}"
+
+    path = parts.path or "/"
+    trailing_slash = path.endswith("/")
+    path = posixpath.normpath(path)
+    if trailing_slash and path != "/":
+        path += "/"
+
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in _TRACKING_PARAMS
+    ))
+    return urlunsplit((scheme, host, path, query, ""))
+
+def _site(url: str) -> str:
+    host = urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+def _is_html(fetched: FetchResult) -> bool:
+    content_type = (fetched.content_type or "").split(";")[0].strip().lower()
+    # Servers that send no content type are given the benefit of the doubt
+    return not content_type or content_type in HTML_CONTENT_TYPES
+
+def extract_links(file_path: str, page_url: str) -> list[str]:
+    """Absolute URLs of the links on a downloaded HTML page."""
+    with open(file_path, "rb") as f:
+        soup = BeautifulSoup(f.read(), "html.parser")
+    base = soup.find("base", href=True)
+    base_url = urljoin(page_url, base["href"]) if base else page_url
+    return [urljoin(base_url, a["href"]) for a in soup.find_all("a", href=True)]
+
+def parse_sitemap(file_path: str) -> tuple[list[str], list[str]]:
+    """Page URLs and nested sitemap URLs listed in a sitemap or sitemap index."""
+    pages, sitemaps = [], []
+    loc = None
+    for _, element in ET.iterparse(file_path):
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "loc":
+            loc = (element.text or "").strip()
+        elif tag == "url" and loc:
+            pages.append(loc)
+            loc = None
+        elif tag == "sitemap" and loc:
+            sitemaps.append(loc)
+            loc = None
+        element.clear()
+    return pages, sitemaps
+
+class SiteCrawler:
+    """
+    Breadth-first crawler for a documentation site. Each depth level is
+    fetched concurrently through the shared UrlFetcher, so its global and
+    per-host limits apply. Pages are deduplicated by normalized URL and by
+    content hash. Downloaded pages are left in blob store temp files for
+    the caller to store.
+    """
+
+    def __init__(
+        self,
+        start_url: str,
+        max_depth: int = 2,
+        max_pages: int = 100,
+        same_domain: bool = True,
+        use_sitemap: bool = True,
+        fetcher: UrlFetcher = None,
+    ):
+        self.start_url = normalize_url(start_url)
+        if self.start_url is None:
+            raise ValueError(f"Cannot crawl {start_url}: only http and https URLs are supported")
+        self.max_depth = max_depth
+        self.max_pages = min(max_pages, CRAWL_MAX_PAGES)
+        self.same_domain = same_domain
+        self.use_sitemap = use_sitemap
+        self.fetcher = fetcher or url_fetcher
+        self.site = _site(self.start_url)
+        self._seen_urls: set[str] = set()
+        self._seen_hashes: set[str] = set()
+
+    def _accept(self, url: str) -> str | None:
+        url = normalize_url(url)
+        if url is None or url in self._seen_urls:
+            return None
+        if self.same_domain and _site(url) != self.site:
+            return None
+        self._seen_urls.add(url)
+        return url
+
+    def _accept_redirect(self, fetched: FetchResult) -> bool:
+        """Whether a page that was redirected is still one to crawl, and not seen under its new URL."""
+        final_url = normalize_url(fetched.final_url or fetched.url)
+        if final_url is None or final_url == normalize_url(fetched.url):
+            return True
+        if normalize_url(fetched.url) == self.start_url:
+            # The site moved; crawl it where the start page redirects to
+            self.site = _site(final_url)
+        return self._accept(final_url) is not None
+
+    async def _fetch_to_tmp(self, urls: list[str]) -> list[FetchResult]:
+        return await self.fetcher.fetch_many([(url, await new_tmp_path()) for url in urls])
+
+    async def _sitemap_urls(self) -> list[str]:
+        parts = urlsplit(self.start_url)
+        queue = [urlunsplit((parts.scheme, parts.netloc, "/sitemap.xml", "", ""))]
+        seen_sitemaps = set()
+        urls = []
+        # Follow sitemap indexes one level at a time until enough pages are listed
+        while queue and len(urls) < self.max_pages:
+            queue = [url for url in queue if url not in seen_sitemaps]
+            seen_sitemaps.update(queue)
+            next_queue = []
+            for fetched in await self._fetch_to_tmp(queue):
+                if not fetched.ok:
+                    continue
+                try:
+                    pages, sitemaps = await anyio.to_thread.run_sync(parse_sitemap, fetched.file_path)
+                    urls.extend(pages)
+                    next_queue.extend(sitemaps)
+                except ET.ParseError as e:
+                    logger.warning(f"Ignoring invalid sitemap {fetched.url}: {str(e)}")
+                finally:
+                    os.remove(fetched.file_path)
+            queue = next_queue
+        return urls
+
+    async def crawl(self) -> list[CrawledPage]:
+        pages: list[CrawledPage] = []
+        self._seen_urls = {self.start_url}
+        level = [self.start_url]
+
+        if self.use_sitemap:
+            # Listed pages are crawled alongside the start page
+            for url in await self._sitemap_urls():
+                url = self._accept(url)
+                if url is not None:
+                    level.append(url)
+
+        depth = 0
+        while level and len(pages) < self.max_pages:
+            level = level[:self.max_pages - len(pages)]
+            next_level = []
+            for fetched in await self._fetch_to_tmp(level):
+                if not fetched.ok:
+                    continue
+                if not _is_html(fetched) or fetched.content_hash in self._seen_hashes or not self._accept_redirect(fetched):
+                    os.remove(fetched.file_path)
+                    continue
+                self._seen_hashes.add(fetched.content_hash)
+                pages.append(CrawledPage(url=fetched.url, depth=depth, fetched=fetched))
+
+                if depth < self.max_depth:
+                    try:
+                        links = await anyio.to_thread.run_sync(extract_links, fetched.file_path, fetched.final_url or fetched.url)
+                    except Exception as e:
+                        logger.warning(f"Failed to parse links of {fetched.url}: {str(e)}")
+                        continue
+                    for link in links:
+                        link = self._accept(link)
+                        if link is not None:
+                            next_level.append(link)
+            level = next_level
+            depth += 1
+
+        logger.info(f"Crawled {len(pages)} pages from {self.start_url}")
+        return pages
@@ -0,0 +1,116 @@
+import os
+import time
+import sqlite3
+import hashlib
+import pathlib
+import threading
+from array import array
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    str(pathlib.Path(__file__).parent / "resources" / "cache" / "embeddings.sqlite3"),
+)
+# Set to 0 to disable the cache
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 500
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by embedding model name and a SHA-256
+    of the chunk text, so unchanged chunks never hit the provider twice.
+
+    Entries live in a local SQLite file and the least recently used ones are
+    evicted once the cache grows past ``max_entries``.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model_name: str, texts: list[str]) -> dict[str, list[float]]:
+        """Return the cached vectors for whichever of ``texts`` are present."""
+        keys = {self.make_key(model_name, text): text for text in texts}
+        found = {}
+        with self._lock:
+            key_list = list(keys)
+            for start in range(0, len(key_list), _QUERY_BATCH):
+                batch = key_list[start:start + _QUERY_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[keys[key]] = vector.tolist()
+
+                hits = [key for key, _ in rows]
+                if hits:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(hits))})",
+                        [time.time(), *hits],
+                    )
+        return found
+
+    def put_many(self, model_name: str, vectors: dict[str, list[float]]):
+        now = time.time()
+        rows = [
+            (self.make_key(model_name, text), array("f", vector).tobytes(), now)
+            for text, vector in vectors.items()
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Process-wide embedding cache, or None when it is disabled."""
+    global _embedding_cache
+    if EMBEDDING_CACHE_MAX_ENTRIES <= 0:
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
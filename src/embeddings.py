@@ -0,0 +1,307 @@
+import os
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from .tokens import TokenCounter
+
+load_dotenv()
+
+logger = logging.getLogger("kb_service")
+
+# Number of chunk texts sent to the embedding provider in a single request, when
+# batches aren't packed by the model's token limits (see tokens.py)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
+# Provider rate limits, shared by every sync and search of a model in this process; 0 disables
+EMBEDDING_REQUESTS_PER_MINUTE = float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+EMBEDDING_TOKENS_PER_MINUTE = float(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+# Embedding requests in flight at once per model, and batches a sync embeds ahead of its writes
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+# Retries of rate limited (429), failed (5xx) and timed out requests, with exponential backoff
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+EMBEDDING_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_BACKOFF_SECONDS", "1"))
+EMBEDDING_MAX_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_MAX_BACKOFF_SECONDS", "60"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# Transport errors of the provider SDKs, matched by name so none of them has to be imported
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError", "APITimeoutError", "ConnectError", "ConnectTimeout", "ReadTimeout",
+    "RemoteProtocolError", "ServiceUnavailable", "DeadlineExceeded", "Timeout",
+}
+
+
+class TokenBucket:
+    """
+    Allows ``rate_per_minute`` units per minute, refilled continuously, with
+    bursts of up to a second's worth since providers enforce their per-minute
+    limits over shorter windows. A request larger than the burst waits for a
+    full bucket and leaves it in debt, so the average rate still holds.
+    ``acquire`` blocks until the units are available, ``take`` charges them
+    without waiting. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(self.rate, 1)
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self, amount: float = 1):
+        """Use ``amount`` units now, going into debt if they aren't available; later ``acquire`` calls wait for it."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.available -= amount
+
+    def acquire(self, amount: float = 1):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                self._refill()
+                needed = min(amount, self.capacity)
+                if self.available >= needed:
+                    self.available -= amount
+                    return
+                wait = (needed - self.available) / self.rate
+            time.sleep(wait)
+
+
+def _status_code(error: Exception) -> int | None:
+    # OpenAI errors have status_code, Google ones code, httpx/requests errors a response
+    for attr in ("status_code", "code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    value = getattr(getattr(error, "response", None), "status_code", None)
+    return value if isinstance(value, int) else None
+
+def is_retryable(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+def _retry_after(error: Exception) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedEmbeddings:
+    """
+    Wrap a provider embedding model so calls stay within its rate limits:
+    request and token buckets per minute, a cap on requests in flight, and
+    retries with exponential backoff and full jitter on 429s, 5xx responses
+    and timeouts. A 429 pauses every caller of the model, not only the one
+    that got it, honouring ``Retry-After`` when the provider sends it.
+
+    Single texts passed to ``embed`` are search queries: they have their own
+    requests in flight and are charged to the buckets without waiting, so
+    a running sync doesn't hold them up; the sync's batches wait instead.
+    """
+
+    def __init__(
+        self,
+        embedding_model,
+        count_tokens=None,
+        requests_per_minute: float = EMBEDDING_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = EMBEDDING_TOKENS_PER_MINUTE,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        backoff_seconds: float = EMBEDDING_BACKOFF_SECONDS,
+        max_backoff_seconds: float = EMBEDDING_MAX_BACKOFF_SECONDS,
+    ):
+        self.embedding_model = embedding_model
+        self.count_tokens = count_tokens or TokenCounter()
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.retries = 0
+        self._in_flight = threading.BoundedSemaphore(max(1, concurrency))
+        self._queries_in_flight = threading.BoundedSemaphore(max(1, concurrency))
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name in ("embedding_model", "_lock"):
+            raise AttributeError(name)
+        return getattr(self.embedding_model, name)
+
+    @property
+    def max_request_tokens(self) -> float:
+        """Largest request the token bucket allows without going into debt."""
+        return self.token_bucket.capacity if self.token_bucket.rate > 0 else float("inf")
+
+    def embed(self, text: str) -> list[float]:
+        return self._call(self.embedding_model.embed, text, self.count_tokens(text), query=True)
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        embed_batch = getattr(self.embedding_model, "embed_batch", None)
+        if embed_batch is None:
+            return [self.embed(text) for text in texts]
+        return self._call(embed_batch, texts, sum(self.count_tokens(text) for text in texts))
+
+    def _wait_for_pause(self):
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = _retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+        if _status_code(error) == 429:
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def _call(self, call, payload, tokens: int, query: bool = False):
+        attempt = 0
+        while True:
+            self._wait_for_pause()
+            if query:
+                self.request_bucket.take(1)
+                self.token_bucket.take(tokens)
+            else:
+                self.request_bucket.acquire(1)
+                self.token_bucket.acquire(tokens)
+            with self._queries_in_flight if query else self._in_flight:
+                try:
+                    return call(payload)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    error = e
+                    delay = self._backoff(attempt, e)
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            logger.warning(f"Embedding request failed ({type(error).__name__}: {str(error)}), retry {attempt} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+class BatchedEmbeddings:
+    """
+    Wrap an embedding model so chunks can be embedded in batches.
+
+    The vector stores embed every record they insert by calling ``embed`` on
+    their embedding model, or ``embed_batch`` for bulk inserts. ``prefetch``
+    embeds a whole batch of texts with one provider request and keeps the
+    vectors so those calls are served from memory. Everything else is delegated to the wrapped model.
+
+    With a ``cache``, vectors already embedded with the same model are read
+    from it and only the misses are sent to the provider.
+
+    Prefetched vectors and cache overrides are per thread, so one wrapper can
+    be shared by concurrent syncs and searches.
+    """
+
+    def __init__(self, embedding_model, model_name: str = None, cache=None):
+        self.embedding_model = embedding_model
+        self.model_name = model_name
+        self.default_cache = cache if model_name else None
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        # Only called for attributes not defined on the wrapper itself
+        if name in ("embedding_model", "_local"):
+            raise AttributeError(name)
+        return getattr(self.embedding_model, name)
+
+    @property
+    def _vectors(self) -> dict:
+        vectors = getattr(self._local, "vectors", None)
+        if vectors is None:
+            vectors = self._local.vectors = {}
+        return vectors
+
+    @property
+    def cache(self):
+        if not self.model_name:
+            return None
+        return getattr(self._local, "cache", self.default_cache)
+
+    @contextmanager
+    def use_cache(self, cache):
+        """Read and store vectors in ``cache`` instead of the default one, for this thread."""
+        previous = getattr(self._local, "cache", self.default_cache)
+        self._local.cache = cache
+        try:
+            yield self
+        finally:
+            self._local.cache = previous
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        """
+        Vectors of ``texts``, served from the ones held for this thread like
+        ``embed``; the rest are fetched with a single request.
+        """
+        held = self._vectors
+        missing = [text for text in dict.fromkeys(texts) if text not in held]
+        fetched = self.fetch(missing) if missing else {}
+        return [held[text] if text in held else fetched[text] for text in texts]
+
+    def _provider_batch(self, texts: list[str]) -> list[list[float]]:
+        embed_batch = getattr(self.embedding_model, "embed_batch", None)
+        if embed_batch is not None:
+            return embed_batch(texts)
+        return [self.embedding_model.embed(text) for text in texts]
+
+    def fetch(self, texts: list[str], query: bool = False) -> dict[str, list[float]]:
+        """
+        Embed texts with a single request for the cache misses and return the
+        vectors by text. Safe to call from any thread; see ``hold``. A
+        ``query`` is embedded on its own, ahead of batches waiting on the
+        rate limits.
+        """
+        vectors = {}
+        cache = self.cache
+        if cache is not None:
+            vectors = cache.get_many(self.model_name, texts)
+            texts = [text for text in texts if text not in vectors]
+        if texts:
+            if query:
+                embedded = {text: self.embedding_model.embed(text) for text in texts}
+            else:
+                embedded = dict(zip(texts, self._provider_batch(texts)))
+            if cache is not None:
+                cache.put_many(self.model_name, embedded)
+            vectors.update(embedded)
+        return vectors
+
+    def prefetch(self, texts: list[str]):
+        """Embed all texts not already held, in a single batch request."""
+        missing = [text for text in dict.fromkeys(texts) if text not in self._vectors]
+        if missing:
+            self._vectors.update(self.fetch(missing))
+
+    def embed(self, text: str) -> list[float]:
+        vector = self._vectors.get(text)
+        if vector is None:
+            # Not part of a batch being written, so a search query
+            vector = self.fetch([text], query=True)[text]
+        return vector
+
+    def hold(self, vectors: dict[str, list[float]]):
+        """Serve ``embed`` calls on this thread from vectors fetched elsewhere with ``fetch``."""
+        self._vectors.update(vectors)
+
+    def release(self):
+        """Drop prefetched vectors once their batch has been written."""
+        self._vectors.clear()
@@ -0,0 +1,109 @@
+import os
+import gzip
+import json
+import uuid
+import hashlib
+import pathlib
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Parsed text and chunks of source files, keyed by content hash so identical
+# and unchanged files are only parsed and split once
+EXTRACTION_CACHE_DIR = pathlib.Path(os.getenv(
+    "EXTRACTION_CACHE_DIR",
+    str(pathlib.Path(__file__).parent / "resources" / "cache" / "extracted"),
+))
+
+def _cache_path(content_hash: str, file_extension: str, suffix: str) -> pathlib.Path:
+    # The loader depends on the extension, so the same bytes may parse differently
+    extension = file_extension.lower().lstrip(".")
+    return EXTRACTION_CACHE_DIR / content_hash[:2] / f"{content_hash}.{extension}.{suffix}"
+
+def _read(path: pathlib.Path) -> str | None:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _write(path: pathlib.Path, text: str):
+    os.makedirs(path.parent, exist_ok=True)
+    # Write to a temporary name first so concurrent readers never see a partial file
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=3) as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def read_extracted_text(content_hash: str, file_extension: str) -> str | None:
+    return _read(_cache_path(content_hash, file_extension, "txt.gz"))
+
+def write_extracted_text(content_hash: str, file_extension: str, text: str):
+    _write(_cache_path(content_hash, file_extension, "txt.gz"), text)
+
+def read_extracted_pages(content_hash: str, file_extension: str, page_break: str):
+    """
+    Pages of text cached with ``extracted_pages_writer``, read lazily one page
+    at a time; None when nothing is cached.
+    """
+    try:
+        f = gzip.open(_cache_path(content_hash, file_extension, "pages.txt.gz"), "rt", encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    return _iter_pages(f, page_break)
+
+def _iter_pages(f, page_break: str):
+    with f:
+        parts = []
+        while block := f.read(1 << 16):
+            pieces = block.split(page_break)
+            parts.append(pieces[0])
+            for piece in pieces[1:]:
+                yield "".join(parts)
+                parts = [piece]
+        yield "".join(parts)
+
+@contextmanager
+def extracted_pages_writer(content_hash: str, file_extension: str):
+    """
+    Text file to write extracted pages to as they are parsed, separated by a
+    page break. It's only stored once the block exits without an error.
+    """
+    path = _cache_path(content_hash, file_extension, "pages.txt.gz")
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=3) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Also reached when a reader stops consuming the pages part way
+        if tmp_path.exists():
+            os.remove(tmp_path)
+        raise
+
+def splitter_cache_key(splitter_params: dict) -> str:
+    """Short digest of the splitter settings, so changing them invalidates cached chunks."""
+    return hashlib.sha256(json.dumps(splitter_params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def read_chunks(content_hash: str, file_extension: str, splitter_key: str) -> dict | None:
+    """
+    Cached split of a file: ``{"content_length": int, "chunks": [str, ...]}``,
+    plus ``"pages": [int, ...]`` with the page of each chunk for paged formats.
+    """
+    data = _read(_cache_path(content_hash, file_extension, f"{splitter_key}.chunks.json.gz"))
+    return json.loads(data) if data is not None else None
+
+def write_chunks(
+    content_hash: str, file_extension: str, splitter_key: str, content_length: int, chunks: list[str], pages: list[int] = None
+):
+    data = {"content_length": content_length, "chunks": chunks}
+    if pages is not None:
+        data["pages"] = pages
+    _write(_cache_path(content_hash, file_extension, f"{splitter_key}.chunks.json.gz"), json.dumps(data))
+
+def discard_extracted(content_hash: str):
+    """Remove every cached extraction and split of the given content."""
+    for path in (EXTRACTION_CACHE_DIR / content_hash[:2]).glob(f"{content_hash}.*"):
+        os.remove(path)
@@ -0,0 +1,185 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from urllib.parse import urlparse
+import anyio
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("kb_service")
+
+# Requests in flight across all hosts
+URL_FETCH_CONCURRENCY = int(os.getenv("URL_FETCH_CONCURRENCY", "16"))
+# Requests in flight to a single host, and the minimum gap between their starts
+URL_FETCH_PER_HOST = int(os.getenv("URL_FETCH_PER_HOST", "4"))
+URL_FETCH_HOST_INTERVAL_SECONDS = float(os.getenv("URL_FETCH_HOST_INTERVAL_SECONDS", "0.1"))
+URL_FETCH_TIMEOUT_SECONDS = float(os.getenv("URL_FETCH_TIMEOUT_SECONDS", "10"))
+# Responses larger than this are abandoned
+URL_FETCH_MAX_BYTES = int(os.getenv("URL_FETCH_MAX_BYTES", str(20 * 1024 * 1024)))
+URL_FETCH_CHUNK_SIZE = 64 * 1024
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+class ResponseTooLarge(Exception):
+    pass
+
+@dataclass
+class FetchResult:
+    url: str
+    file_path: str
+    # URL the content was served from, after redirects
+    final_url: str = None
+    file_size: int = 0
+    content_hash: str = None
+    content_type: str = None
+    etag: str = None
+    last_modified: str = None
+    status_code: int = None
+    # Set when a conditional request was answered with 304; nothing is written then
+    not_modified: bool = False
+    error: str = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+def conditional_headers(etag: str = None, last_modified: str = None) -> dict:
+    """Request headers asking the server to answer 304 if the page is unchanged."""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+class _HostLimiter:
+    """Caps concurrent requests to one host and spaces out their starts."""
+
+    def __init__(self, concurrency: int, interval: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def wait_turn(self):
+        async with self._lock:
+            delay = self._next_start - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_start = time.monotonic() + self.interval
+
+class UrlFetcher:
+    """
+    Async fetcher backed by one pooled HTTP client. Responses are streamed to
+    disk and hashed as they arrive, with a global and a per-host concurrency
+    limit so bulk URL ingestion takes about as long as the slowest page
+    without flooding any one site.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = URL_FETCH_CONCURRENCY,
+        per_host: int = URL_FETCH_PER_HOST,
+        host_interval: float = URL_FETCH_HOST_INTERVAL_SECONDS,
+        timeout: float = URL_FETCH_TIMEOUT_SECONDS,
+        max_bytes: int = URL_FETCH_MAX_BYTES,
+    ):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.host_interval = host_interval
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self._client = None
+        self._loop = None
+        self._semaphore = None
+        self._hosts: dict[str, _HostLimiter] = {}
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        # The client and limiters belong to the event loop that created them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": USER_AGENT},
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency,
+                ),
+            )
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._hosts = {}
+        return self._client
+
+    def _host_limiter(self, url: str) -> _HostLimiter:
+        host = urlparse(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = _HostLimiter(self.per_host, self.host_interval)
+        return self._hosts[host]
+
+    async def fetch(self, url: str, file_path: str, headers: dict = None) -> FetchResult:
+        """
+        Download ``url`` to ``file_path``. Errors are reported on the result
+        rather than raised, and no partial file is left behind. Pass the
+        validators of a previous fetch via ``conditional_headers()`` in
+        ``headers`` to skip the download when the page hasn't changed.
+        """
+        client = self._ensure_client()
+        result = FetchResult(url=url, file_path=file_path)
+        host = self._host_limiter(url)
+        try:
+            async with self._semaphore, host.semaphore:
+                await host.wait_turn()
+                async with client.stream("GET", url, headers=headers) as response:
+                    result.status_code = response.status_code
+                    result.final_url = str(response.url)
+                    result.etag = response.headers.get("etag")
+                    result.last_modified = response.headers.get("last-modified")
+                    if response.status_code == 304:
+                        result.not_modified = True
+                        return result
+                    response.raise_for_status()
+                    result.content_type = response.headers.get("content-type")
+
+                    content_length = response.headers.get("content-length")
+                    if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                        raise ResponseTooLarge(f"Response is {content_length} bytes, limit is {self.max_bytes}")
+
+                    digest = hashlib.sha256()
+                    size = 0
+                    async with await anyio.open_file(file_path, "wb") as f:
+                        async for chunk in response.aiter_bytes(URL_FETCH_CHUNK_SIZE):
+                            size += len(chunk)
+                            if size > self.max_bytes:
+                                raise ResponseTooLarge(f"Response exceeds {self.max_bytes} bytes")
+                            digest.update(chunk)
+                            await f.write(chunk)
+
+                    result.file_size = size
+                    result.content_hash = digest.hexdigest()
+        except Exception as e:
+            logger.error(f"Failed to fetch URL {url}: {str(e)}")
+            result.error = str(e)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        return result
+
+    async def fetch_many(self, requests: list[tuple]) -> list[FetchResult]:
+        """
+        Fetch ``(url, file_path)`` or ``(url, file_path, headers)`` tuples
+        concurrently; results keep the input order.
+        """
+        return await asyncio.gather(*(self.fetch(*request) for request in requests))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+url_fetcher = UrlFetcher()
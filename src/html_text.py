@@ -0,0 +1,160 @@
+import re
+import logging
+from bs4 import BeautifulSoup, NavigableString, CData
+from langchain_core.documents import Document
+from langchain_core.document_loaders import BaseLoader
+from .extraction_cache import write_extracted_text
+
+logger = logging.getLogger("kb_service")
+
+# Never part of the readable content
+_DROP_TAGS = ["script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "form", "button", "select", "input"]
+# Page chrome around the main content; headers and footers of an article are kept
+_BOILERPLATE_TAGS = ["nav", "aside"]
+_PAGE_CHROME_TAGS = ["header", "footer"]
+_BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "menu", "menubar"}
+_BOILERPLATE_NAME = re.compile(
+    r"(^|[-_ ])(nav|navbar|navigation|menu|footer|sidebar|breadcrumbs?|cookies?|consent|banner|"
+    r"advert|ads|share|social|related|pagination|skip-link|toc)([-_ ]|$)",
+    re.IGNORECASE,
+)
+# Containers made up mostly of links are menus or link lists
+_LINK_DENSITY_TAGS = ["ul", "ol", "div", "section", "table"]
+_MAX_LINK_DENSITY = 0.6
+
+_BLOCK_TAGS = [
+    "p", "div", "section", "article", "main", "li", "dt", "dd", "blockquote", "figcaption",
+    "h1", "h2", "h3", "h4", "h5", "h6", "tr", "table", "ul", "ol", "dl", "pre", "hr",
+]
+# Paragraph and line separators survive whitespace collapsing, newlines from the source don't
+_BLOCK_BREAK = "\u2029"
+_LINE_BREAK = "\u2028"
+_WHITESPACE = re.compile(r"[ \t\n\r\f\v\xa0]+")
+
+def _decomposed(tag) -> bool:
+    # Tag.decomposed looks the flag up with getattr, which searches the subtree for a tag of that name when unset
+    return vars(tag).get("_decomposed", False)
+
+def _is_boilerplate(tag) -> bool:
+    if tag.get("role", "").lower() in _BOILERPLATE_ROLES:
+        return True
+    names = " ".join(tag.get("class", [])) + " " + (tag.get("id") or "")
+    return bool(_BOILERPLATE_NAME.search(names))
+
+def _wraps_content(tag) -> bool:
+    # Layout wrappers named after a sidebar or menu may still hold the whole page
+    return tag.find(["main", "article", "h1"]) is not None
+
+# String types get_text() returns; comments and doctypes are left out
+_TEXT_TYPES = (NavigableString, CData)
+
+def _link_densities(root) -> dict[int, float]:
+    """
+    Share of each element's text that sits in links, by element id, in one
+    bottom-up pass. Lengths are those of ``get_text(" ", strip=True)``.
+    """
+    # Per element: characters and strings of its text, and length of the text in its links
+    totals = {}
+    densities = {}
+    # Reversed document order visits every node after all of its descendants
+    for node in reversed([root, *root.descendants]):
+        parent = totals.setdefault(id(node.parent), [0, 0, 0])
+        if type(node) in _TEXT_TYPES:
+            text = node.strip()
+            if text:
+                parent[0] += len(text)
+                parent[1] += 1
+            continue
+        if getattr(node, "name", None) is None:
+            continue
+        characters, strings, link_length = totals.pop(id(node), [0, 0, 0])
+        # Strings are joined by one space
+        text_length = characters + max(strings - 1, 0)
+        if node.name == "a":
+            link_length = text_length
+        densities[id(node)] = link_length / text_length if text_length else 0.0
+        parent[0] += characters
+        parent[1] += strings
+        parent[2] += link_length
+    return densities
+
+def _main_element(soup):
+    main = soup.find("main") or soup.find(attrs={"role": "main"})
+    if main is not None:
+        return main
+    articles = soup.find_all("article")
+    if len(articles) == 1:
+        return articles[0]
+    return soup.body or soup
+
+def extract_main_text(html) -> str:
+    """
+    Readable main content of an HTML page, without scripts, navigation,
+    headers, footers, sidebars and other boilerplate. Blocks are separated
+    by blank lines so the splitter can cut between paragraphs.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.get_text(" ", strip=True) if soup.title else ""
+
+    for tag in soup.find_all(_DROP_TAGS):
+        tag.decompose()
+
+    root = _main_element(soup)
+    for tag in root.find_all(_BOILERPLATE_TAGS):
+        tag.decompose()
+    for tag in root.find_all(_PAGE_CHROME_TAGS):
+        if not _decomposed(tag) and tag.find_parent("article") is None and not tag.find(["main", "article"]):
+            tag.decompose()
+    for tag in root.find_all(True):
+        if _decomposed(tag):
+            continue
+        if _is_boilerplate(tag) and not _wraps_content(tag):
+            tag.decompose()
+    link_densities = _link_densities(root)
+    for tag in root.find_all(_LINK_DENSITY_TAGS):
+        if not _decomposed(tag) and link_densities[id(tag)] > _MAX_LINK_DENSITY:
+            tag.decompose()
+
+    # Keep the line structure of code blocks, collapse everything else
+    for pre in root.find_all("pre"):
+        pre.replace_with(NavigableString(_BLOCK_BREAK + pre.get_text().replace("\n", _LINE_BREAK) + _BLOCK_BREAK))
+    for br in root.find_all("br"):
+        br.replace_with(NavigableString(_LINE_BREAK))
+    for tag in root.find_all(_BLOCK_TAGS):
+        tag.insert_before(NavigableString(_BLOCK_BREAK))
+        tag.insert_after(NavigableString(_BLOCK_BREAK))
+
+    blocks = []
+    for block in root.get_text().split(_BLOCK_BREAK):
+        lines = [_WHITESPACE.sub(" ", line).strip() for line in block.split(_LINE_BREAK)]
+        block = "\n".join(line for line in lines if line)
+        if block:
+            blocks.append(block)
+
+    if title and (not blocks or title not in blocks[0]):
+        blocks.insert(0, title)
+    return "\n\n".join(blocks)
+
+class MainContentHTMLLoader(BaseLoader):
+    """Document loader for HTML files using ``extract_main_text``."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def lazy_load(self):
+        with open(self.file_path, "rb") as f:
+            text = extract_main_text(f.read())
+        yield Document(page_content=text, metadata={"source": str(self.file_path)})
+
+def cache_main_text(file_path: str, content_hash: str):
+    """
+    Extract a fetched page once, at ingest time, and store the text next to
+    the blob in the extraction cache so sync doesn't parse it again.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            text = extract_main_text(f.read())
+        write_extracted_text(content_hash, ".html", text)
+    except Exception as e:
+        # Sync extracts the page itself if this fails
+        logger.warning(f"Failed to extract text from {file_path}: {str(e)}")
@@ -0,0 +1,123 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+from .database import SessionLocal
+from .sync import SyncProgress, sync_knowledge_base
+
+load_dotenv()
+
+logger = logging.getLogger("kb_service")
+
+SYNC_JOB_WORKERS = int(os.getenv("SYNC_JOB_WORKERS", "2"))
+# Finished jobs are kept this long so clients can still poll their result
+SYNC_JOB_RETENTION_SECONDS = int(os.getenv("SYNC_JOB_RETENTION_SECONDS", "3600"))
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+@dataclass
+class SyncJob:
+    kb_id: str
+    job_id: str = field(default_factory=lambda: f"job_{uuid.uuid4()}")
+    status: str = JobStatus.QUEUED
+    progress: SyncProgress = field(default_factory=SyncProgress)
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    result: dict | None = None
+    done: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until the job has finished; False if ``timeout`` passed first."""
+        return self.done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        eta = None if self.is_finished else self.progress.eta_seconds()
+        return {
+            "job_id": self.job_id,
+            "kb_id": self.kb_id,
+            "job_status": self.status,
+            "files_total": self.progress.files_total,
+            "files_done": self.progress.files_done,
+            "chunks_total": self.progress.chunks_total,
+            "chunks_embedded": self.progress.chunks_embedded,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "result": self.result,
+        }
+
+
+class SyncJobQueue:
+    """
+    In-process queue that runs knowledge base syncs on a pool of worker
+    threads. Each job gets its own database session. Only one job per
+    knowledge base is queued or running at a time.
+    """
+
+    def __init__(self, max_workers: int = SYNC_JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kb-sync")
+        self._jobs: dict[str, SyncJob] = {}
+        self._active_by_kb: dict[str, SyncJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kb_id: str) -> SyncJob:
+        with self._lock:
+            self._prune()
+            active = self._active_by_kb.get(kb_id)
+            if active is not None:
+                return active
+
+            job = SyncJob(kb_id=kb_id)
+            self._jobs[job.job_id] = job
+            self._active_by_kb[kb_id] = job
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> SyncJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: SyncJob):
+        job.status = JobStatus.RUNNING
+        job.progress.started_at = time.time()
+        db = SessionLocal()
+        status = JobStatus.FAILED
+        try:
+            job.result = sync_knowledge_base(db, job.kb_id, job.progress)
+            if job.result.get("status") == "success":
+                status = JobStatus.COMPLETED
+        except Exception as e:
+            logger.error(f"Sync job {job.job_id} for KB {job.kb_id} failed: {str(e)}")
+            job.result = {"status": "error", "message": f"Sync job failed: {str(e)}"}
+        finally:
+            db.close()
+            # finished_at is set before the status that makes the job count as finished
+            job.finished_at = time.time()
+            job.status = status
+            with self._lock:
+                self._active_by_kb.pop(job.kb_id, None)
+            job.done.set()
+
+    def _prune(self):
+        cutoff = time.time() - SYNC_JOB_RETENTION_SECONDS
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.is_finished and job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+sync_jobs = SyncJobQueue()
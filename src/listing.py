@@ -0,0 +1,117 @@
+import os
+import json
+import base64
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy import DateTime, and_, or_
+from sqlalchemy.orm import load_only, selectinload
+
+load_dotenv()
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+class ListQueryError(ValueError):
+    """A cursor or field list that can't be used for the requested listing."""
+
+def parse_fields(fields: str | None, allowed) -> list[str] | None:
+    """
+    Split a ``fields=name,status`` sparse fieldset into field names, None
+    when all fields are wanted.
+    """
+    if not fields:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ListQueryError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+def encode_cursor(sort: str, order: str, values: list) -> str:
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    data = json.dumps({"sort": sort, "order": order, "after": values}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str, order: str, columns) -> list:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if data["sort"] != sort or data["order"] != order:
+            raise ListQueryError("Cursor belongs to a listing with a different sort order")
+        values = data["after"]
+        if len(values) != len(columns):
+            raise ValueError("wrong number of cursor values")
+        return [
+            datetime.fromisoformat(value) if value is not None and isinstance(column.type, DateTime) else value
+            for column, value in zip(columns, values)
+        ]
+    except ListQueryError:
+        raise
+    except Exception:
+        raise ListQueryError("Invalid cursor")
+
+def _after(column, key, value, key_value, descending: bool):
+    """Rows past ``(value, key_value)`` in the listing order; NULLs sort last ascending, first descending."""
+    if column is key:
+        return key < key_value if descending else key > key_value
+    if value is None:
+        if descending:
+            return or_(column.isnot(None), and_(column.is_(None), key < key_value))
+        return and_(column.is_(None), key > key_value)
+    if descending:
+        return or_(column < value, and_(column == value, key < key_value))
+    return or_(column > value, and_(column == value, key > key_value), column.is_(None))
+
+def page_query(query, model, sort: str, order: str, key: str, limit: int, cursor: str = None, fields: list[str] = None):
+    """
+    Order ``query`` by the sort column, then by the primary ``key`` so rows
+    with equal sort values keep a stable order, and continue after the
+    ``cursor`` row. Seeking past the last row seen stays as cheap on the
+    hundredth page as on the first, unlike an offset. Rows with no value
+    for the sort column come last, or first in descending order, which is
+    how a PostgreSQL index on the column stores them.
+
+    Only the columns of ``fields`` are loaded, and the ``creator``
+    relationship only when it is asked for.
+    """
+    descending = order == "desc"
+    column, key_column = getattr(model, sort), getattr(model, key)
+    columns = [column] if sort == key else [column, key_column]
+    if cursor:
+        after = decode_cursor(cursor, sort, order, columns)
+        query = query.where(_after(column, key_column, after[0], after[-1], descending))
+    if descending:
+        query = query.order_by(*(c.desc().nulls_first() for c in columns))
+    else:
+        query = query.order_by(*(c.asc().nulls_last() for c in columns))
+
+    mapper_columns = model.__mapper__.columns.keys()
+    if fields is not None:
+        wanted = {name for name in fields if name in mapper_columns} | {sort, key}
+        query = query.options(load_only(*(getattr(model, name) for name in wanted)))
+    if (fields is None or "creator" in fields) and "creator" in model.__mapper__.relationships:
+        query = query.options(selectinload(model.creator))
+    # One row past the page tells whether there is a next one
+    return query.limit(limit + 1)
+
+def next_cursor(rows: list, sort: str, order: str, key: str, limit: int) -> str | None:
+    """Cursor of the page after ``rows``; None on the last page."""
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    values = [getattr(last, sort)] if sort == key else [getattr(last, sort), getattr(last, key)]
+    return encode_cursor(sort, order, values)
+
+def project(row, schema, fields: list[str] = None) -> dict:
+    """Serialise ``row`` with ``schema``, keeping only ``fields`` when given."""
+    if fields is None:
+        return schema.model_validate(row).model_dump()
+    data = {}
+    for name in fields:
+        value = getattr(row, name)
+        if getattr(value, "__table__", None) is not None:
+            # A related row such as creator, serialised with its own schema
+            annotation = schema.model_fields[name].annotation
+            nested_schema = next(arg for arg in getattr(annotation, "__args__", (annotation,)) if arg is not type(None))
+            value = nested_schema.model_validate(value).model_dump()
+        data[name] = value
+    return data
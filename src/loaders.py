@@ -0,0 +1,168 @@
+import os
+import threading
+import multiprocessing
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from langchain_community.document_loaders.csv_loader import CSVLoader
+from langchain_community.document_loaders import UnstructuredMarkdownLoader
+from langchain_community.document_loaders.word_document import Docx2txtLoader
+from langchain_community.document_loaders.text import TextLoader
+from .extraction_cache import read_extracted_text, write_extracted_text, read_extracted_pages, extracted_pages_writer
+from .html_text import MainContentHTMLLoader
+from .pdf_text import iter_pdf_pages, PAGE_BREAK
+from .chunking import ChunkingConfig, get_splitter
+
+load_dotenv()
+
+# Number of processes parsing source files during a sync; 1 parses inline
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+
+LOADERS = {
+    ".csv": CSVLoader,
+    ".md": UnstructuredMarkdownLoader,
+    ".markdown": UnstructuredMarkdownLoader,
+    # Main content only, without navigation and other page boilerplate
+    ".html": MainContentHTMLLoader,
+    ".htm": MainContentHTMLLoader,
+    ".docx": Docx2txtLoader,
+    ".doc": Docx2txtLoader,
+    ".txt": TextLoader,
+    # ".pptx": UnstructuredPowerPointLoader,
+    # ".xlsx": UnstructuredExcelLoader,
+}
+
+# Formats read and split one page at a time, with the page number kept on each chunk
+PAGED_LOADERS = {
+    ".pdf": iter_pdf_pages,
+}
+
+@dataclass
+class SplitFile:
+    """Chunks of a source file, with the page of each chunk for paged formats."""
+    content_length: int
+    chunks: list[str]
+    pages: list[int] = None
+
+def is_supported(file_path: str) -> bool:
+    file_extension = os.path.splitext(file_path)[1].lower()
+    return file_extension in LOADERS or file_extension in PAGED_LOADERS
+
+def extract_text(file_path: str) -> str:
+    """Parse a source file and return its text content."""
+    file_extension = os.path.splitext(file_path)[1].lower()
+    loader = LOADERS[file_extension](file_path)
+    return "".join(doc.page_content for doc in loader.load())
+
+def iter_pages(file_path: str, content_hash: str = None):
+    """
+    Yield ``(page number, text)`` of a paged source as it is parsed, never
+    holding more than a page. Pages are written to the extraction cache on
+    the way, and read back from it one at a time for known content.
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if not content_hash:
+        yield from PAGED_LOADERS[file_extension](file_path)
+        return
+
+    cached = read_extracted_pages(content_hash, file_extension, PAGE_BREAK)
+    if cached is not None:
+        yield from enumerate(cached, start=1)
+        return
+    with extracted_pages_writer(content_hash, file_extension) as cache:
+        for page_number, text in PAGED_LOADERS[file_extension](file_path):
+            if page_number > 1:
+                cache.write(PAGE_BREAK)
+            cache.write(text)
+            yield page_number, text
+
+def split_file(file_path: str, chunking: ChunkingConfig, content_hash: str = None) -> SplitFile:
+    """
+    Parse and split a source file. Paged formats are split page by page as
+    they are read, so a long PDF never exists as a single string.
+    """
+    text_splitter = get_splitter(chunking)
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension in PAGED_LOADERS:
+        split = SplitFile(content_length=0, chunks=[], pages=[])
+        for page_number, text in iter_pages(file_path, content_hash):
+            split.content_length += len(text)
+            for chunk in text_splitter.split_text(text):
+                split.chunks.append(chunk)
+                split.pages.append(page_number)
+        return split
+
+    text = read_extracted_text(content_hash, file_extension) if content_hash else None
+    if text is None:
+        text = extract_text(file_path)
+        if content_hash:
+            write_extracted_text(content_hash, file_extension, text)
+    return SplitFile(content_length=len(text), chunks=text_splitter.split_text(text))
+
+def _extract(key, file_path: str, chunking: ChunkingConfig, content_hash: str = None):
+    try:
+        return key, split_file(file_path, chunking, content_hash), None
+    except Exception as e:
+        return key, None, e
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all syncs in this process, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawn rather than fork: syncs run on worker threads of a server process
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+def iter_extracted(files: list[tuple], chunking: ChunkingConfig):
+    """
+    Extract and split ``files``, a list of ``(key, file_path, content_hash)``
+    tuples, yielding ``(key, SplitFile, error)`` as each file finishes so the
+    caller can use it while the remaining files are still being parsed. Parsing
+    and splitting run on a process pool since the PDF and Unstructured parsers
+    are CPU bound, and only the chunks are sent back. Files with a content hash
+    reuse text already extracted from the same content, including copies
+    uploaded to other knowledge bases.
+    """
+    if EXTRACTION_WORKERS <= 1 or len(files) <= 1:
+        for key, file_path, content_hash in files:
+            yield _extract(key, file_path, chunking, content_hash)
+        return
+
+    pool = get_extraction_pool()
+    remaining = iter(files)
+    running = set()
+
+    def submit_next():
+        for key, file_path, content_hash in remaining:
+            running.add(pool.submit(_extract, key, file_path, chunking, content_hash))
+            return
+
+    try:
+        # Only a few files ahead of the caller, so parsed files don't pile up while it is busy
+        for _ in range(EXTRACTION_WORKERS * 2):
+            submit_next()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.remove(future)
+                submit_next()
+                yield future.result()
+    except BrokenProcessPool:
+        # A crashed worker (e.g. killed for memory) breaks the pool for good; start fresh next time
+        _discard_pool(pool)
+        raise
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
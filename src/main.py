@@ -1,10 +1,17 @@
-from fastapi import FastAPI
+import pathlib
+from fastapi import FastAPI, Depends
+from alembic import command
+from alembic.config import Config
 from src.routers import knowledgebase, auth  # Use absolute import path
-from src.database import engine  # Use absolute import path
-import src.models as models  # Use absolute import path
+from src.database import get_pool_metrics  # Use absolute import path
+from src.vector_stores import close_clients, get_client_stats
+from src.fetcher import url_fetcher
+from src.security.authUtils import validate_admin
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Create or upgrade the database tables, see migrations/
+alembic_config = Config(str(pathlib.Path(__file__).parent.parent / "alembic.ini"))
+alembic_config.attributes["configure_logger"] = False
+command.upgrade(alembic_config, "head")
 
 app = FastAPI(title="Knowledge Base Service")
 
@@ -12,6 +19,19 @@ app = FastAPI(title="Knowledge Base Service")
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])  # Add auth router
 app.include_router(knowledgebase.router, prefix="/api", tags=["Knowledge Base"])
 
+@app.on_event("shutdown")
+async def close_pooled_clients():
+    close_clients()
+    await url_fetcher.aclose()
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Knowledge Base Service"}
+
+@app.get("/metrics")
+def read_metrics(current_user = Depends(validate_admin)):
+    """Connection pool and pooled client usage, for sizing the pools. Admin only."""
+    return {
+        "database": get_pool_metrics(),
+        "clients": get_client_stats(),
+    }
@@ -1,45 +1,78 @@
-from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Boolean
+from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Boolean, Index
 from sqlalchemy.sql import func
 from .database import Base
-from .schemas import statusEnum
+from .schemas import statusEnum, chunkingStrategyEnum
 from sqlalchemy.orm import relationship
 
 class KnowledgeBase(Base):
     __tablename__ = "knowledge_bases"
     
-    kb_id = Column(String, primary_key=True, index=True)
+    kb_id = Column(String, primary_key=True)
     name = Column(String, index=True)
-    description = Column(String,index=True)  # Optional description field
-    category = Column(String, index=True)  # Optional category field
+    description = Column(String)  # Optional description field
+    category = Column(String)  # Optional category field
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
-    embedding_model = Column(String, index=True)
-    vector_store = Column(String, index=True)
+    embedding_model = Column(String)
+    vector_store = Column(String)
     status = Column(String, default=statusEnum.UNSYNCED)  # Default status set to "unsynced"
     workspace_id = Column(String, nullable=True)  # Optional field for workspace ID
     created_by = Column(String, ForeignKey("users.username"), nullable=False)  # Track who created the KB
+    # How sources are split into chunks, see chunking.py
+    chunking_strategy = Column(String, default=chunkingStrategyEnum.RECURSIVE, server_default=chunkingStrategyEnum.RECURSIVE.value)
+    chunk_size = Column(Integer, default=500, server_default="500")
+    chunk_overlap = Column(Integer, default=50, server_default="50")
     
     # Relationship to User
     creator = relationship("User", back_populates="knowledge_bases")
     
+    # Indexes are created by the migrations in migrations/versions
+    __table_args__ = (
+        # Listings, newest or oldest first, optionally within a workspace
+        Index("ix_knowledge_bases_workspace_id_created_at", "workspace_id", "created_at", "kb_id"),
+        Index("ix_knowledge_bases_created_at", "created_at", "kb_id"),
+    )
+    
 class FileMetadata(Base):
     __tablename__ = "file_metadata"
     
-    file_id = Column(String, primary_key=True, index=True)
-    filename = Column(String, index=True)
+    file_id = Column(String, primary_key=True)
+    filename = Column(String)
     file_size = Column(Integer)
+    content_hash = Column(String, ForeignKey("source_blobs.content_hash"), nullable=True)  # SHA-256 of the file content
     file_type = Column(String)
     upload_date = Column(DateTime(timezone=True), server_default=func.now())
     uploaded_by = Column(String, ForeignKey("users.username"), nullable=False)  # Track who uploaded the file
     kb_id = Column(String, ForeignKey("knowledge_bases.kb_id"))
     file_path = Column(String)  # Added column for storing file path
     url = Column(String, nullable=True)  # URL for accessing the file (optional)
+    etag = Column(String, nullable=True)  # Validators of the last fetch of a URL source, for conditional re-fetches
+    last_modified = Column(String, nullable=True)
+    last_fetched_at = Column(DateTime(timezone=True), nullable=True)
     status = Column(String, default=statusEnum.UNSYNCED)  # Default status set to "unsynced"
+    
+    __table_args__ = (
+        # Sync selects the changed files of a knowledge base by status
+        Index("ix_file_metadata_kb_id_status", "kb_id", "status"),
+        # Single files are looked up within their knowledge base
+        Index("ix_file_metadata_kb_id_file_id", "kb_id", "file_id"),
+        # Source listings, in upload order
+        Index("ix_file_metadata_kb_id_upload_date", "kb_id", "upload_date", "file_id"),
+    )
+
+class SourceBlob(Base):
+    __tablename__ = "source_blobs"
+    
+    content_hash = Column(String, primary_key=True)  # SHA-256 of the content, also the storage key
+    file_path = Column(String, nullable=False)
+    file_size = Column(Integer)
+    ref_count = Column(Integer, nullable=False, default=0)  # Number of FileMetadata rows using this blob
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class User(Base):
     __tablename__ = "users"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     username = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True)
     full_name = Column(String, nullable=True)
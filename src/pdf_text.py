@@ -0,0 +1,43 @@
+import os
+import gc
+import logging
+from dotenv import load_dotenv
+from pypdf import PdfReader
+
+load_dotenv()
+
+logger = logging.getLogger("kb_service")
+
+# The PDF reader keeps every object it has parsed; once memory has grown by this
+# much while reading a document, the reader is reopened to let go of them
+PDF_MEMORY_BUDGET_MB = float(os.getenv("PDF_MEMORY_BUDGET_MB", "256"))
+# Separates pages in extracted text
+PAGE_BREAK = "\f"
+
+def _resident_mb() -> float | None:
+    # Current resident set size; only available on Linux, where the service runs
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def iter_pdf_pages(file_path: str):
+    """
+    Yield ``(page number, text)`` for each page of a PDF, starting at 1,
+    extracting one page at a time. The file is read from disk as needed
+    rather than loaded whole.
+    """
+    with open(file_path, "rb") as f:
+        reader = PdfReader(f)
+        baseline = _resident_mb()
+        for index in range(len(reader.pages)):
+            text = reader.pages[index].extract_text() or ""
+            yield index + 1, text.strip().replace(PAGE_BREAK, "\n")
+
+            if baseline is not None and _resident_mb() - baseline > PDF_MEMORY_BUDGET_MB:
+                logger.info(f"PDF reader for {file_path} over its memory budget at page {index + 1}, reopening")
+                del reader
+                gc.collect()
+                reader = PdfReader(f)
+                baseline = _resident_mb()
@@ -2,25 +2,27 @@ import os
 import uuid
 import pathlib
 import shutil
-import requests
 import logging
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse
-from fastapi import APIRouter, Depends, UploadFile, File, Form, Body
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Body, Query, Response
+from fastapi.concurrency import run_in_threadpool
 import json
-from sqlalchemy.orm import Session
-from ..database import get_db
+from pydantic import ValidationError
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_db, get_async_db
 from .. import models, schemas
 from datetime import datetime
-from typing import List
-from langchain_community.document_loaders.csv_loader import CSVLoader
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.document_loaders import UnstructuredMarkdownLoader
-from langchain_community.document_loaders import UnstructuredHTMLLoader
-from langchain_community.document_loaders.word_document import Docx2txtLoader
-from langchain_community.document_loaders.text import TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from ..vector_stores import add_to_vectorStore
+from typing import List, Optional
+from ..vector_stores import remove_from_vectorStore, get_vector_store_config
+from ..search import search_knowledge_base, invalidate_search_cache
+from ..jobs import sync_jobs
+from ..storage import stage_upload, discard_staged, store_file, new_tmp_path, release_blob, source_savepoint
+from ..fetcher import url_fetcher, conditional_headers, FetchResult
+from ..crawler import SiteCrawler
+from ..html_text import cache_main_text
+from ..listing import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ListQueryError, parse_fields, page_query, next_cursor, project
 from ..security.authUtils import get_current_active_user, validate_admin
 from ..schemas import statusEnum
 # from langchain_community.document_loaders import JSONLoader
@@ -39,17 +41,125 @@ if not logger.handlers:
 
 router = APIRouter()
 
-@router.get("/knowledgebases", response_model=List[schemas.KnowledgeBase])
-def get_all_knowledge_bases(
-    db: Session = Depends(get_db),
+async def get_knowledge_base(db: AsyncSession, kb_id: str, with_creator: bool = False):
+    query = select(models.KnowledgeBase).where(models.KnowledgeBase.kb_id == kb_id)
+    if with_creator:
+        # Relationships can't be lazy loaded on an async session
+        query = query.options(selectinload(models.KnowledgeBase.creator)).execution_options(populate_existing=True)
+    return (await db.execute(query)).scalars().first()
+
+async def get_next_kb_id(db: AsyncSession) -> str:
+    # Get the next KB ID (simple implementation)
+    last_kb = (await db.execute(
+        select(models.KnowledgeBase).order_by(models.KnowledgeBase.kb_id.desc()).limit(1)
+    )).scalars().first()
+    
+    if last_kb:
+        # Extract the number from kb_id and increment
+        last_id = int(last_kb.kb_id.split('_')[1])
+        new_id = last_id + 1
+    else:
+        new_id = 1
+    
+    return f"kb_{new_id}"
+
+async def list_knowledge_bases(
+    db: AsyncSession,
+    status: statusEnum = None,
+    category: str = None,
+    workspace_id: str = None,
+    sort: schemas.knowledgeBaseSortEnum = schemas.knowledgeBaseSortEnum.CREATED_AT,
+    order: schemas.sortOrderEnum = schemas.sortOrderEnum.ASC,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str = None,
+    fields: str = None,
+) -> tuple[list[dict], str | None]:
+    """One page of knowledge bases matching the filters, and the cursor of the next."""
+    fields = parse_fields(fields, schemas.KnowledgeBase.model_fields)
+    query = select(models.KnowledgeBase)
+    if status:
+        query = query.where(models.KnowledgeBase.status == status.value)
+    if category:
+        query = query.where(models.KnowledgeBase.category == category)
+    if workspace_id:
+        query = query.where(models.KnowledgeBase.workspace_id == workspace_id)
+    query = page_query(query, models.KnowledgeBase, sort.value, order.value, "kb_id", limit, cursor, fields)
+    rows = (await db.execute(query)).scalars().all()
+    return (
+        [project(row, schemas.KnowledgeBase, fields) for row in rows[:limit]],
+        next_cursor(rows, sort.value, order.value, "kb_id", limit),
+    )
+
+async def store_fetched_page(
+    db: AsyncSession,
+    kb_id: str,
+    sources_dir,
+    fetched: FetchResult,
+    uploaded_by: str,
+    file_id: str = None,
+) -> models.FileMetadata:
+    """
+    Move a fetched page into the blob store, link it into the sources
+    directory and add its FileMetadata row to the session, in a savepoint
+    so that a failure leaves the session as it was.
+    """
+    file_id = file_id or f"file_{uuid.uuid4()}"
+    # Generate a filename based on the domain
+    file_name = f"{file_id}_{urlparse(fetched.url).netloc}.html"
+    file_path = os.path.join(sources_dir, file_name)
+    async with source_savepoint(db, file_path):
+        await store_file(db, fetched.file_path, fetched.file_size, fetched.content_hash, file_path)
+        # Strip the page down to its main text now, so sync doesn't have to parse the HTML
+        await run_in_threadpool(cache_main_text, file_path, fetched.content_hash)
+
+        file_metadata = models.FileMetadata(
+            file_id=file_id,
+            filename=file_name,
+            file_size=fetched.file_size,
+            content_hash=fetched.content_hash,
+            file_type="html",
+            kb_id=kb_id,
+            file_path=str(file_path),
+            uploaded_by=uploaded_by,
+            url=fetched.url,
+            etag=fetched.etag,
+            last_modified=fetched.last_modified,
+            last_fetched_at=datetime.now()
+        )
+        db.add(file_metadata)
+    return file_metadata
+
+@router.get("/knowledgebases")
+async def get_all_knowledge_bases(
+    response: Response,
+    status: Optional[statusEnum] = None,
+    category: Optional[str] = None,
+    workspace_id: Optional[str] = None,
+    sort: schemas.knowledgeBaseSortEnum = schemas.knowledgeBaseSortEnum.CREATED_AT,
+    order: schemas.sortOrderEnum = schemas.sortOrderEnum.ASC,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get all knowledge bases with their details.
+    Get knowledge bases with their details, a page at a time. The cursor of
+    the next page is returned in the ``X-Next-Cursor`` header.
     """
     try:
-        knowledge_bases = db.query(models.KnowledgeBase).all()
+        knowledge_bases, cursor = await list_knowledge_bases(
+            db, status, category, workspace_id, sort, order, limit, cursor, fields
+        )
+        if cursor:
+            response.headers["X-Next-Cursor"] = cursor
         return knowledge_bases
+    except ListQueryError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+            "data": []
+        }
     except Exception as e:
         logger.error(f"Failed to retrieve knowledge bases: {str(e)}")
         return {
@@ -59,23 +169,13 @@ def get_all_knowledge_bases(
         }
 
 @router.post("/knowledgebases", response_model=schemas.KnowledgeBase)
-def create_knowledge_base(
+async def create_knowledge_base(
     kb: schemas.KnowledgeBaseCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     try:
-        # Get the next KB ID (simple implementation)
-        last_kb = db.query(models.KnowledgeBase).order_by(models.KnowledgeBase.kb_id.desc()).first()
-        
-        if last_kb:
-            # Extract the number from kb_id and increment
-            last_id = int(last_kb.kb_id.split('_')[1])
-            new_id = last_id + 1
-        else:
-            new_id = 1
-        
-        kb_id = f"kb_{new_id}"
+        kb_id = await get_next_kb_id(db)
         
         # Create KB directory structure
         base_path = pathlib.Path(__file__).parent.parent
@@ -100,6 +200,9 @@ def create_knowledge_base(
             created_at=datetime.now(),
             embedding_model=kb.embedding_model,
             vector_store=kb.vector_store,
+            chunking_strategy=kb.chunking_strategy,
+            chunk_size=kb.chunk_size,
+            chunk_overlap=kb.chunk_overlap,
             
             # status=kb.status,
             workspace_id = kb.workspace_id,  # Optional field for workspace ID
@@ -107,13 +210,12 @@ def create_knowledge_base(
         )
         
         db.add(db_kb)
-        db.commit()
-        db.refresh(db_kb)
+        await db.commit()
         
-        return db_kb
+        return await get_knowledge_base(db, kb_id, with_creator=True)
     except Exception as e:
         logger.error(f"Failed to create knowledge base: {str(e)}")
-        db.rollback()
+        await db.rollback()
         return {
             "status": "error",
             "message": f"Failed to create knowledge base: {str(e)}"
@@ -123,11 +225,11 @@ def create_knowledge_base(
 async def upload_files(
     kb_id: str, 
     files: List[UploadFile] = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     # Check if knowledge base exists
-    kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.kb_id == kb_id).first()
+    kb = await get_knowledge_base(db, kb_id)
     if not kb:
         logger.warning(f"Knowledge base with ID {kb_id} not found")
         return {
@@ -150,9 +252,19 @@ async def upload_files(
         }
     
     uploaded_files = []
+    staged = []
     
     try:
+        # End the lookup's transaction, so the connection goes back to the
+        # pool while the upload bodies are streamed to scratch files
+        await db.commit()
         for file in files:
+            try:
+                staged.append((file, *await stage_upload(file)))
+            except Exception as e:
+                logger.error(f"Failed to upload file {file.filename}: {str(e)}")
+        
+        for file, tmp_path, file_size, content_hash in staged:
             # Generate unique file ID
             file_id = f"file_{uuid.uuid4()}"
             
@@ -165,26 +277,25 @@ async def upload_files(
             
             # Save the file
             try:
-                # Read file content
-                contents = await file.read()
-                
-                # Write file to disk
-                with open(file_path, "wb") as f:
-                    f.write(contents)
-                
-                # Create file metadata entry
-                file_metadata = models.FileMetadata(
-                    file_id=file_id,
-                    filename=file.filename,
-                    file_size=len(contents),
-                    file_type=file_extension.replace(".", ""),
-                    kb_id=kb_id,
-                    file_path=str(file_path),
-                    uploaded_by=current_user.username,
-                )
-                
-                # Add to database
-                db.add(file_metadata)
+                # A failed file rolls back to here, without its blob reference
+                async with source_savepoint(db, file_path):
+                    # Move the staged upload into the shared blob store and link it here
+                    await store_file(db, tmp_path, file_size, content_hash, file_path)
+                    
+                    # Create file metadata entry
+                    file_metadata = models.FileMetadata(
+                        file_id=file_id,
+                        filename=file.filename,
+                        file_size=file_size,
+                        content_hash=content_hash,
+                        file_type=file_extension.replace(".", ""),
+                        kb_id=kb_id,
+                        file_path=str(file_path),
+                        uploaded_by=current_user.username,
+                    )
+                    
+                    # Add to database
+                    db.add(file_metadata)
                 uploaded_files.append(file_metadata)
                 
             except Exception as e:
@@ -205,11 +316,11 @@ async def upload_files(
         kb.status = schemas.statusEnum.UPDATED
         
         # Commit all changes to the database
-        db.commit()
+        await db.commit()
         
         # Refresh to get the updated records
         for file_metadata in uploaded_files:
-            db.refresh(file_metadata)
+            await db.refresh(file_metadata)
         
         return {
             "status": "success",
@@ -219,267 +330,182 @@ async def upload_files(
         
     except Exception as e:
         logger.error(f"Failed to upload files to KB {kb_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         return {
             "status": "error",
             "message": f"Failed to upload files: {str(e)}",
             "files_uploaded": []
         }
+    finally:
+        discard_staged([tmp_path for _, tmp_path, _, _ in staged])
 
-@router.get("/knowledgebases/{kb_id}/embeddings")
-def make_embeddings(
-    kb_id: str, 
-    db: Session = Depends(get_db),
+@router.put("/knowledgebases/{kb_id}/chunking")
+async def update_chunking_settings(
+    kb_id: str,
+    settings: schemas.ChunkingSettings,
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
-):  
-    # Check if knowledge base exists
-    kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.kb_id == kb_id).first()
+):
+    """
+    Change how the sources of a knowledge base are chunked. Sources that
+    were already embedded are marked as updated so the next sync re-chunks
+    and re-embeds them with the new settings.
+    """
+    kb = await get_knowledge_base(db, kb_id)
     if not kb:
         logger.warning(f"Knowledge base with ID {kb_id} not found")
         return {
             "status": "error",
             "message": "Knowledge base not found"
-        }   
+        }
     
-    # Get path to resources directory for this knowledge base
-    base_path = pathlib.Path(__file__).parent.parent
-    sources_dir = base_path /"resources"/f"workspace_{kb.workspace_id}"/kb_id / "sources"
+    unchanged = (
+        kb.chunking_strategy == settings.chunking_strategy
+        and kb.chunk_size == settings.chunk_size
+        and kb.chunk_overlap == settings.chunk_overlap
+    )
+    if unchanged:
+        return {
+            "status": "success",
+            "kb_id": kb_id,
+            "files_to_resync": 0,
+            "message": f"Chunking settings of knowledge base {kb_id} are unchanged"
+        }
     
-    if not os.path.exists(sources_dir):
-        logger.warning(f"Sources directory for knowledge base {kb_id} not found")
+    try:
+        kb.chunking_strategy = settings.chunking_strategy
+        kb.chunk_size = settings.chunk_size
+        kb.chunk_overlap = settings.chunk_overlap
+        
+        result = await db.execute(
+            update(models.FileMetadata)
+            .where(models.FileMetadata.kb_id == kb_id, models.FileMetadata.status == statusEnum.SYNCED)
+            .values(status=statusEnum.UPDATED)
+        )
+        if result.rowcount:
+            kb.status = statusEnum.UPDATED
+        kb.last_updated_at = datetime.now()
+        await db.commit()
+    except Exception as e:
+        logger.error(f"Failed to update chunking settings of KB {kb_id}: {str(e)}")
+        await db.rollback()
         return {
             "status": "error",
-            "message": f"Sources directory for knowledge base {kb_id} not found"
+            "message": f"Failed to update chunking settings: {str(e)}"
         }
     
-    all_documents = []
-    processed_files = []
-    all_chunks=[]
-    failed_files = []
-    
-    try:
-        kb.status = statusEnum.SYNCING
-        # kb.last_updated_at = datetime.now()
+    return {
+        "status": "success",
+        "kb_id": kb_id,
+        "files_to_resync": result.rowcount,
+        "message": f"Updated chunking settings of knowledge base {kb_id}"
+    }
 
-        try:
-            db.commit()
-            db.refresh(kb)
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Error updating knowledge base status to SYNCING: {str(e)}")
-            return {
-                "status": "error",
-                "message": f"Error updating knowledge base status: {str(e)}"
-            }    
-        
-        for filename in os.listdir(sources_dir):
-            
-            file_path = os.path.join(sources_dir, filename)
-            
-            # Skip directories
-            if os.path.isdir(file_path):
-                continue
-                
-            # Get file extension
-            name_without_ext,file_extension = os.path.splitext(filename)
-            file_extension = file_extension.lower()
-            
-            main_parts = name_without_ext.split('_', 2)[:2]
-            file_id = '_'.join(main_parts)
-            loader = None
-            
-            # get file data
-            file_metadata = db.query(models.FileMetadata).filter(
-                models.FileMetadata.file_id == file_id,
-                models.FileMetadata.kb_id == kb_id
-            ).first()
-            
-            if not file_metadata:
-                logger.warning(f"File with ID {file_id} not found in knowledge base {kb_id}")
-                continue  # Skip this file and continue
-            
-            file_name = file_metadata.filename
-            file_size = file_metadata.file_size
-            file_type = file_metadata.file_type
-            file_path = file_metadata.file_path
-            file_url = file_metadata.url if file_metadata.url else None
-            kb_id = kb.kb_id
-            kb_name = kb.name
-            upload_date = file_metadata.upload_date
-            uploaded_by = file_metadata.uploaded_by
-            file_status = file_metadata.status
-            
-            # Select appropriate loader based on file extension
-            try:
-                # if file_extension in ['.txt', '.py', '.js', '.css', '.java', '.c', '.cpp', '.ts']:
-                #     loader = TextLoader(file_path)
-                if file_extension in ['.csv']:
-                    loader = CSVLoader(file_path)
-                elif file_extension in ['.md', '.markdown']:
-                    loader = UnstructuredMarkdownLoader(file_path)
-                elif file_extension in ['.html', '.htm']:
-                    loader = UnstructuredHTMLLoader(file_path)
-                elif file_extension in ['.pdf']:
-                    loader = PyPDFLoader(file_path)
-                elif file_extension in ['.docx', '.doc']:
-                    loader = Docx2txtLoader(file_path)
-                elif file_extension in ['.txt']:
-                    loader = TextLoader(file_path)
-                # elif file_extension in ['.pptx', '.ppt']:
-                #     loader = UnstructuredPowerPointLoader(file_path)
-                # elif file_extension in ['.xlsx', '.xls']:
-                #     loader = UnstructuredExcelLoader(file_path)
-                
-                # If we have a supported loader, load the document
-                if loader:
-                    documents = loader.load()
-                    all_documents.extend(documents)
-                    processed_files.append(filename)
-                    
-                    # Extract text from documents and add to all_content
-                    all_content = ""
-                    for doc in documents:
-                        all_content += doc.page_content
+@router.get("/knowledgebases/{kb_id}/embeddings")
+def make_embeddings(
+    kb_id: str, 
+    current_user: models.User = Depends(get_current_active_user)
+):  
+    # Runs as a sync job, so it never overlaps another sync of the same KB
+    job = sync_jobs.submit(kb_id)
+    job.wait()
+    return job.result
 
-                text_splitter = RecursiveCharacterTextSplitter(
-                        chunk_size=500,
-                        chunk_overlap=50,
-                        length_function=len,
-                        is_separator_regex=False,
-                        separators=["\n\n", "\n", " ", ""],)    
-                
-                texts = text_splitter.create_documents([all_content])
-                for doc in texts:
-                    meta = doc.metadata
-                    meta['file_name'] = file_name
-                    meta['file_id'] = file_id
-                    meta['file_size'] = file_size
-                    meta['file_type'] = file_type
-                    meta['file_url'] = file_url
-                    meta["kb_id"] = kb_id
-                    meta["kb_name"] = kb_name
-                    meta["upload_date"] = upload_date.isoformat() 
-                    meta["uploaded_by"] = uploaded_by
-                    # meta["file_status"] = file_status
-                    doc.metadata = meta   
-                      
-                all_chunks.extend([doc for doc in texts])
-                file_metadata.status = statusEnum.SYNCING
-                
-                try:
-                    db.commit()
-                    db.refresh(file_metadata)
-                except Exception as e:
-                    db.rollback()
-                    logger.error(f"Error updating file metadata for {filename}: {str(e)}")
-                    return {
-                        "status": "error",
-                        "message": f"Error updating file metadata: {str(e)}",
-                        "processed_files": processed_files
-                    }
-            
-            except Exception as e:
-                logger.error(f"Error processing {filename}: {str(e)}")
-                file_metadata.status = statusEnum.FAILED
-                # failed_files.append(convert_file_metadata_to_schema(file_metadata))
-                failed_files.append(file_metadata)
-                try:
-                    db.commit()
-                    db.refresh(file_metadata)
-                except Exception as e:
-                    db.rollback()
-                    print(e)
-                
-      
-        if not processed_files:
-            logger.warning(f"No files were successfully processed for KB {kb_id}")
-            return {
-                "status": "error",
-                "message": "No files were successfully processed",
-                "unprocessed_files": [f.filename for f in failed_files],
-            }
-            
-        config ={
-            "knowledge_base": kb.name,
-            "embedding_model": kb.embedding_model.upper(),
-            "vector_store": kb.vector_store.upper(),
-            "workspace_id": kb.workspace_id
-        } 
-        
-        try:
-            add_to_vectorStore(config=config, chunk_list=all_chunks)
-            
-            kb.status = schemas.statusEnum.SYNCED
-            kb.last_updated_at = datetime.now()
-            try:
-                db.commit()
-                db.refresh(kb)
-                
-                # Update file statuses to SYNCED for successfully processed files
-                files = db.query(models.FileMetadata).filter(models.FileMetadata.kb_id==kb.kb_id).all()
-                # Don't convert to schema objects - work directly with database models
-                for file in files:
-                    # Skip files that failed to process
-                    if file.file_id not in [f.file_id for f in failed_files]:
-                        file.status = statusEnum.SYNCED
-                
-                # Commit all file status updates at once
-                db.commit()
-                        
-            except Exception as e:
-                db.rollback()
-                logger.error(f"Error updating knowledge base status to SYNCED: {str(e)}")
-                return {
-                    "status": "error",
-                    "message": f"Error updating knowledge base status: {str(e)}"
-                }
-            logger.info(f"Successfully added {len(all_chunks)} chunks to vector store for KB {kb_id}")
-                
-        except Exception as e:
-            # Log the error and return a meaningful message
-            logger.error(f"Error adding chunks to vector store for KB {kb_id}: {str(e)}")
-            return {
-                "status": "error",
-                "message": f"Error creating embeddings: {str(e)}",
-                "processed_files": processed_files
-            }
+@router.post("/knowledgebases/{kb_id}/sync")
+def start_sync_job(
+    kb_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Queue a background sync of the knowledge base and return its job ID.
+    Poll GET /knowledgebases/{kb_id}/sync/{job_id} for progress.
+    """
+    kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.kb_id == kb_id).first()
+    if not kb:
+        logger.warning(f"Knowledge base with ID {kb_id} not found")
+        return {
+            "status": "error",
+            "message": "Knowledge base not found"
+        }
     
-    except Exception as e:
-        logger.error(f"Error processing files for KB {kb_id}: {str(e)}")
-        
-        try:
-            kb.status = statusEnum.FAILED
-            db.commit()
-            db.refresh(db)
-        except:
-            db.rollback()    
-            
+    job = sync_jobs.submit(kb_id)
+    return {
+        "status": "success",
+        **job.to_dict(),
+        "message": f"Sync job {job.job_id} queued for knowledge base {kb_id}"
+    }
+
+@router.get("/knowledgebases/{kb_id}/sync/{job_id}")
+def get_sync_job(
+    kb_id: str,
+    job_id: str,
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Get the status and progress of a sync job.
+    """
+    job = sync_jobs.get(job_id)
+    if not job or job.kb_id != kb_id:
+        logger.warning(f"Sync job {job_id} not found for knowledge base {kb_id}")
         return {
             "status": "error",
-            "message": f"Error processing files: {str(e)}",
-            "processed_files": processed_files
+            "message": f"Sync job {job_id} not found"
         }
     
     return {
         "status": "success",
-        "kb_id": kb_id,
-        "file_count": len(processed_files),
-        "total_content_length": len(all_content),
-        "processed_files": processed_files,
-        "message": f"Processed {len(processed_files)} files from knowledge base {kb_id}"
+        **job.to_dict()
     }
 
+@router.post("/knowledgebases/{kb_id}/search")
+def search_knowledge_base_chunks(
+    kb_id: str,
+    search: schemas.SearchRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Semantic search over a knowledge base. Returns the top-k most similar
+    chunks with their metadata.
+    """
+    kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.kb_id == kb_id).first()
+    if not kb:
+        logger.warning(f"Knowledge base with ID {kb_id} not found")
+        return {
+            "status": "error",
+            "message": "Knowledge base not found",
+            "results": []
+        }
+    
+    try:
+        results, cached = search_knowledge_base(kb, search.query, search.top_k)
+        return {
+            "status": "success",
+            "kb_id": kb_id,
+            "query": search.query,
+            "results": results,
+            "cached": cached
+        }
+    except Exception as e:
+        logger.error(f"Search failed for KB {kb_id}: {str(e)}")
+        return {
+            "status": "error",
+            "message": f"Search failed: {str(e)}",
+            "results": []
+        }
+
 @router.delete("/knowledgebases/{kb_id}")
-def delete_knowledge_base(
+async def delete_knowledge_base(
     kb_id: str, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(validate_admin)  # Only admins can delete knowledge bases
 ):
     """
     Delete a knowledge base and all its associated files and metadata.
     """
     # Check if knowledge base exists
-    kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.kb_id == kb_id).first()
+    kb = await get_knowledge_base(db, kb_id)
     if not kb:
         logger.warning(f"Knowledge base with ID {kb_id} not found")
         return {
@@ -488,18 +514,25 @@ def delete_knowledge_base(
         }
     
     try:
-        # Get all file metadata records for this KB
-        file_records = db.query(models.FileMetadata).filter(models.FileMetadata.kb_id == kb_id).all()
-        file_count = len(file_records)
+        # Get the content hashes of all files in this KB
+        content_hashes = (await db.execute(
+            select(models.FileMetadata.content_hash).where(models.FileMetadata.kb_id == kb_id)
+        )).scalars().all()
+        file_count = len(content_hashes)
         
         # Delete all file metadata records
-        db.query(models.FileMetadata).filter(models.FileMetadata.kb_id == kb_id).delete()
+        await db.execute(delete(models.FileMetadata).where(models.FileMetadata.kb_id == kb_id))
+        
+        # Release the shared blobs the files pointed at
+        for content_hash in content_hashes:
+            await release_blob(db, content_hash)
         
         # Delete the knowledge base record
-        db.delete(kb)
+        await db.delete(kb)
         
         # Commit database changes
-        db.commit()
+        await db.commit()
+        invalidate_search_cache(kb_id)
         
         # Delete the directory and all files
         base_path = pathlib.Path(__file__).parent.parent
@@ -507,7 +540,7 @@ def delete_knowledge_base(
         
         if os.path.exists(kb_dir):
             try:
-                shutil.rmtree(kb_dir)
+                await run_in_threadpool(shutil.rmtree, kb_dir)
             except Exception as e:
                 logger.error(f"Failed to delete directory for KB {kb_id}: {str(e)}")
                 # Continue execution even if we couldn't delete the directory
@@ -521,24 +554,24 @@ def delete_knowledge_base(
         
     except Exception as e:
         logger.error(f"Failed to delete knowledge base {kb_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         return {
             "status": "error",
             "message": f"Failed to delete knowledge base: {str(e)}"
         }
 
 @router.delete("/knowledgebases/{kb_id}/files/{file_id}")
-def delete_file(
+async def delete_file(
     kb_id: str, 
     file_id: str, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
     Delete a specific file from a knowledge base.
     """
     # Check if knowledge base exists
-    kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.kb_id == kb_id).first()
+    kb = await get_knowledge_base(db, kb_id)
     if not kb:
         logger.warning(f"Knowledge base with ID {kb_id} not found")
         return {
@@ -547,10 +580,10 @@ def delete_file(
         }
     
     # Check if file exists and belongs to this knowledge base
-    file_metadata = db.query(models.FileMetadata).filter(
+    file_metadata = (await db.execute(select(models.FileMetadata).where(
         models.FileMetadata.file_id == file_id,
         models.FileMetadata.kb_id == kb_id
-    ).first()
+    ))).scalars().first()
     
     if not file_metadata:
         logger.warning(f"File with ID {file_id} not found in knowledge base {kb_id}")
@@ -563,6 +596,15 @@ def delete_file(
         # Store values before deletion for response
         filename = file_metadata.filename
         
+        # Remove the file's vectors so they stop showing up in the knowledge base
+        if file_metadata.status != statusEnum.UNSYNCED:
+            try:
+                await run_in_threadpool(remove_from_vectorStore, get_vector_store_config(kb), [file_id])
+                invalidate_search_cache(kb_id)
+            except Exception as e:
+                logger.error(f"Failed to delete vectors for file {file_id}: {str(e)}")
+                # Continue execution even if we couldn't delete the vectors
+        
         # Delete the file from the file system if it exists
         if os.path.exists(file_metadata.file_path):
             try:
@@ -572,15 +614,17 @@ def delete_file(
                 # Continue execution even if we couldn't delete the file
         
         # Delete the file metadata from the database
-        db.delete(file_metadata)
+        await db.delete(file_metadata)
+        await db.flush()
+        await release_blob(db, file_metadata.content_hash)
         
         # Update the knowledge base last_updated_at timestamp
         kb.last_updated_at = datetime.now()
         
         # If this was the last file, set status back to EMPTY
-        remaining_files = db.query(models.FileMetadata).filter(
-            models.FileMetadata.kb_id == kb_id
-        ).count()
+        remaining_files = await db.scalar(
+            select(func.count()).select_from(models.FileMetadata).where(models.FileMetadata.kb_id == kb_id)
+        )
         
         if remaining_files == 0:
             kb.status = schemas.statusEnum.EMPTY
@@ -588,7 +632,7 @@ def delete_file(
             kb.status = schemas.statusEnum.UPDATED
         
         # Commit the changes
-        db.commit()
+        await db.commit()
         
         return {
             "status": "success",
@@ -600,17 +644,17 @@ def delete_file(
         
     except Exception as e:
         logger.error(f"Failed to delete file {file_id} from KB {kb_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         return {
             "status": "error",
             "message": f"Failed to delete file: {str(e)}"
         }
 
 @router.post("/knowledgebases/{kb_id}/url")
-def add_url_source(
+async def add_url_source(
     kb_id: str,
     url_submission: schemas.UrlSubmission,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
@@ -618,7 +662,7 @@ def add_url_source(
     The website will be scraped and its content saved.
     """
     # Check if knowledge base exists
-    kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.kb_id == kb_id).first()
+    kb = await get_knowledge_base(db, kb_id)
     if not kb:
         logger.warning(f"Knowledge base with ID {kb_id} not found")
         return {
@@ -629,18 +673,6 @@ def add_url_source(
     try:
         url = str(url_submission.url)
         
-        # Parse URL to get domain for filename
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc
-        
-        # Generate a filename based on the domain
-        get_domain = f"{domain}.html"
-        
-        # Generate unique file ID
-        file_id = f"file_{uuid.uuid4()}"
-        
-        file_name= f"{file_id}_{get_domain}"
-        
         # Define path to save file
         base_path = pathlib.Path(__file__).parent.parent  #src directory
         sources_dir = base_path /"resources"/f"workspace_{kb.workspace_id}"/kb_id/ "sources"
@@ -656,101 +688,250 @@ def add_url_source(
                 "message": f"Failed to create sources directory: {str(e)}"
             }
         
-        file_path = os.path.join(sources_dir, file_name)
-        
-        # Fetch website content
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to fetch URL {url}: {str(e)}")
+        # Stream the page into the blob store, then link it into the sources directory
+        fetched = await url_fetcher.fetch(url, await new_tmp_path())
+        if not fetched.ok:
             return {
                 "status": "error",
-                "message": f"Failed to fetch URL: {str(e)}"
+                "message": f"Failed to fetch URL: {fetched.error}"
             }
         
-        # Get the HTML content
-        html_content = response.text
-        
-        # Use BeautifulSoup to extract and clean text content
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.extract()
-        
-        # Save original HTML for complete reference
         try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(html_content)
+            file_metadata = await store_fetched_page(db, kb_id, sources_dir, fetched, current_user.username)
         except Exception as e:
-            logger.error(f"Failed to save HTML content to {file_path}: {str(e)}")
+            logger.error(f"Failed to save HTML content for {url}: {str(e)}")
+            await db.rollback()
             return {
                 "status": "error",
                 "message": f"Failed to save HTML content: {str(e)}"
             }
         
-        # Create file metadata
-        file_metadata = models.FileMetadata(
-            file_id=file_id,
-            filename=file_path,
-            file_size=len(html_content),
-            file_type="html",
-            kb_id=kb_id,
-            file_path=str(file_path),
-            url=url
-        )
-        
-        # Add to database
-        db.add(file_metadata)
-        
         # Update the knowledge base last_updated_at timestamp and status
         kb.last_updated_at = datetime.now()
         kb.status = schemas.statusEnum.UPDATED
         
         # Commit changes
-        db.commit()
-        db.refresh(file_metadata)
+        await db.commit()
         
         return {
             "status": "success",
             "kb_id": kb_id,
-            "file_id": file_id,
+            "file_id": file_metadata.file_id,
             "url": url,
-            "filename": file_name,
-            "file_size": len(html_content),
+            "filename": file_metadata.filename,
+            "file_size": fetched.file_size,
             "message": f"Successfully scraped and added {url} to knowledge base {kb_id}"
         }
         
     except Exception as e:
         logger.error(f"Failed to process URL for KB {kb_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         return {
             "status": "error",
             "message": f"Failed to process URL: {str(e)}"
         }
 
+@router.post("/knowledgebases/{kb_id}/crawl")
+async def crawl_site_source(
+    kb_id: str,
+    crawl_submission: schemas.CrawlSubmission,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Crawl a website from the given URL and add every page found as a source.
+    Links are followed up to ``max_depth`` levels and pages listed in the
+    site's sitemap.xml are included.
+    """
+    kb = await get_knowledge_base(db, kb_id)
+    if not kb:
+        logger.warning(f"Knowledge base with ID {kb_id} not found")
+        return {
+            "status": "error",
+            "message": "Knowledge base not found"
+        }
+    
+    url = str(crawl_submission.url)
+    base_path = pathlib.Path(__file__).parent.parent
+    sources_dir = base_path /"resources"/f"workspace_{kb.workspace_id}"/kb_id/ "sources"
+    
+    try:
+        os.makedirs(sources_dir, exist_ok=True)
+        crawler = SiteCrawler(
+            url,
+            max_depth=crawl_submission.max_depth,
+            max_pages=crawl_submission.max_pages,
+            same_domain=crawl_submission.same_domain,
+            use_sitemap=crawl_submission.use_sitemap,
+        )
+        pages = await crawler.crawl()
+    except Exception as e:
+        logger.error(f"Failed to crawl {url} for KB {kb_id}: {str(e)}")
+        return {
+            "status": "error",
+            "message": f"Failed to crawl site: {str(e)}"
+        }
+    
+    added_pages = []
+    try:
+        for page in pages:
+            try:
+                file_metadata = await store_fetched_page(db, kb_id, sources_dir, page.fetched, current_user.username)
+            except Exception as e:
+                logger.error(f"Failed to save crawled page {page.url}: {str(e)}")
+                continue
+            added_pages.append({"url": page.url, "file_id": file_metadata.file_id, "depth": page.depth})
+        
+        if added_pages:
+            kb.last_updated_at = datetime.now()
+            kb.status = schemas.statusEnum.UPDATED
+        await db.commit()
+    except Exception as e:
+        logger.error(f"Failed to add crawled pages to KB {kb_id}: {str(e)}")
+        await db.rollback()
+        return {
+            "status": "error",
+            "message": f"Failed to add crawled pages: {str(e)}"
+        }
+    
+    return {
+        "status": "success",
+        "kb_id": kb_id,
+        "url": url,
+        "pages_added": len(added_pages),
+        "pages": added_pages,
+        "message": f"Crawled {len(added_pages)} pages from {url} into knowledge base {kb_id}"
+    }
+
+@router.post("/knowledgebases/{kb_id}/refresh")
+async def refresh_url_sources(
+    kb_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Re-fetch the URL sources of a knowledge base with conditional requests.
+    Only sources whose content changed are replaced and marked as updated,
+    so the next sync re-embeds just those.
+    """
+    kb = await get_knowledge_base(db, kb_id)
+    if not kb:
+        logger.warning(f"Knowledge base with ID {kb_id} not found")
+        return {
+            "status": "error",
+            "message": "Knowledge base not found"
+        }
+    
+    url_files = (await db.execute(
+        select(models.FileMetadata).where(
+            models.FileMetadata.kb_id == kb_id,
+            models.FileMetadata.url.isnot(None)
+        )
+    )).scalars().all()
+    
+    # Pages that still match their ETag / Last-Modified are answered with 304 and not downloaded
+    fetched_pages = await url_fetcher.fetch_many([
+        (file.url, await new_tmp_path(), conditional_headers(file.etag, file.last_modified))
+        for file in url_files
+    ])
+    
+    changed_files = []
+    unchanged_files = []
+    failed_files = []
+    try:
+        for file, fetched in zip(url_files, fetched_pages):
+            if not fetched.ok:
+                failed_files.append({"file_id": file.file_id, "url": file.url, "error": fetched.error})
+                continue
+            
+            file.last_fetched_at = datetime.now()
+            file.etag = fetched.etag or file.etag
+            file.last_modified = fetched.last_modified or file.last_modified
+            
+            # Servers that ignore conditional requests resend the page; compare the content instead
+            if fetched.not_modified or fetched.content_hash == file.content_hash:
+                if os.path.exists(fetched.file_path):
+                    os.remove(fetched.file_path)
+                unchanged_files.append(file.file_id)
+                continue
+            
+            try:
+                # The link is replaced atomically, a failure keeps the old page and its blob reference
+                async with db.begin_nested():
+                    await store_file(db, fetched.file_path, fetched.file_size, fetched.content_hash, file.file_path)
+            except Exception as e:
+                logger.error(f"Failed to save refreshed page {file.url}: {str(e)}")
+                failed_files.append({"file_id": file.file_id, "url": file.url, "error": str(e)})
+                continue
+            
+            # The new page is linked in, so the row points at it from here on
+            previous_hash = file.content_hash
+            file.content_hash = fetched.content_hash
+            file.file_size = fetched.file_size
+            if file.status != statusEnum.UNSYNCED:
+                file.status = statusEnum.UPDATED
+            await release_blob(db, previous_hash)
+            changed_files.append(file.file_id)
+            # Best effort, sync extracts the page itself if there is no cached text
+            await run_in_threadpool(cache_main_text, file.file_path, fetched.content_hash)
+        
+        if changed_files:
+            kb.status = statusEnum.UPDATED
+            kb.last_updated_at = datetime.now()
+        await db.commit()
+    except Exception as e:
+        logger.error(f"Failed to refresh URL sources of KB {kb_id}: {str(e)}")
+        await db.rollback()
+        return {
+            "status": "error",
+            "message": f"Failed to refresh URL sources: {str(e)}"
+        }
+    
+    return {
+        "status": "success",
+        "kb_id": kb_id,
+        "checked": len(url_files),
+        "changed_files": changed_files,
+        "unchanged": len(unchanged_files),
+        "failed_files": failed_files,
+        "message": f"{len(changed_files)} of {len(url_files)} URL sources changed in knowledge base {kb_id}"
+    }
+
 @router.get("/workspaces/{workspace_id}/knowledgebases")
-def get_workspace_knowledge_bases(
+async def get_workspace_knowledge_bases(
     workspace_id: str,
-    db: Session = Depends(get_db),
+    status: Optional[statusEnum] = None,
+    category: Optional[str] = None,
+    sort: schemas.knowledgeBaseSortEnum = schemas.knowledgeBaseSortEnum.CREATED_AT,
+    order: schemas.sortOrderEnum = schemas.sortOrderEnum.ASC,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get all knowledge bases related to a specific workspace.
+    Get the knowledge bases of a specific workspace, a page at a time.
     """
     try:
-        knowledge_bases = db.query(models.KnowledgeBase).filter(
-            models.KnowledgeBase.workspace_id == workspace_id
-        ).all()
+        # The creator is only included when asked for in fields
+        knowledge_bases, next_page = await list_knowledge_bases(
+            db, status, category, workspace_id, sort, order, limit, cursor,
+            fields or ",".join(name for name in schemas.KnowledgeBase.model_fields if name != "creator")
+        )
         
         return {
             "status": "success",
             "workspace_id": workspace_id,
-            "knowledge_bases": knowledge_bases or []
+            "knowledge_bases": knowledge_bases,
+            "next_cursor": next_page
+        }
+    except ListQueryError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+            "workspace_id": workspace_id,
+            "knowledge_bases": []
         }
     except Exception as e:
         logger.error(f"Failed to retrieve knowledge bases for workspace {workspace_id}: {str(e)}")
@@ -762,16 +943,23 @@ def get_workspace_knowledge_bases(
         }
 
 @router.get("/knowledgebases/{kb_id}/sources")
-def get_knowledge_base_sources(
+async def get_knowledge_base_sources(
     kb_id: str,
-    db: Session = Depends(get_db),
+    status: Optional[statusEnum] = None,
+    file_type: Optional[str] = None,
+    sort: schemas.sourceSortEnum = schemas.sourceSortEnum.UPLOAD_DATE,
+    order: schemas.sortOrderEnum = schemas.sortOrderEnum.ASC,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
-    Get all source details for a specific knowledge base.
+    Get the source details of a specific knowledge base, a page at a time.
     """
     # Check if knowledge base exists
-    kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.kb_id == kb_id).first()
+    kb = await get_knowledge_base(db, kb_id)
     if not kb:
         logger.warning(f"Knowledge base with ID {kb_id} not found")
         return {
@@ -781,19 +969,38 @@ def get_knowledge_base_sources(
         }
     
     try:
-        # Query for all files associated with this knowledge base
-        file_metadata = db.query(models.FileMetadata).filter(
-            models.FileMetadata.kb_id == kb_id
-        ).all()
+        fields = parse_fields(fields, schemas.FileMetaData.model_fields)
+        conditions = [models.FileMetadata.kb_id == kb_id]
+        if status:
+            conditions.append(models.FileMetadata.status == status.value)
+        if file_type:
+            conditions.append(models.FileMetadata.file_type == file_type)
+        
+        query = page_query(
+            select(models.FileMetadata).where(*conditions), models.FileMetadata,
+            sort.value, order.value, "file_id", limit, cursor, fields
+        )
+        file_metadata = (await db.execute(query)).scalars().all()
+        source_count = (await db.execute(
+            select(func.count()).select_from(models.FileMetadata).where(*conditions)
+        )).scalar()
         
         return {
             "status": "success",
             "kb_id": kb_id,
             "kb_name": kb.name,
-            "sources": file_metadata or [],
-            "source_count": len(file_metadata) if file_metadata else 0
+            "sources": [project(row, schemas.FileMetaData, fields) for row in file_metadata[:limit]],
+            "source_count": source_count,
+            "next_cursor": next_cursor(file_metadata, sort.value, order.value, "file_id", limit)
         }
         
+    except ListQueryError as e:
+        return {
+            "status": "error",
+            "message": str(e),
+            "kb_id": kb_id,
+            "sources": []
+        }
     except Exception as e:
         # Log the error instead of raising an exception
         logger.error(f"Error retrieving sources for knowledge base {kb_id}: {str(e)}")
@@ -809,12 +1016,13 @@ def get_knowledge_base_sources(
 async def create_knowledge_base_with_sources(
     kb_data: str = Form(None),  # Changed to accept form data as string
     files: List[UploadFile] = File(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """
     Create a knowledge base, upload files, and add URLs in a single operation.
     """
+    staged = []
     try:
         # Parse kb_data from JSON string to dict
         if not kb_data:
@@ -831,13 +1039,21 @@ async def create_knowledge_base_with_sources(
             kb_details = kb_data_dict.get("kb", {})
             urls = kb_data_dict.get("urls", [])
             
+            # Chunking settings are optional and fall back to the schema defaults
+            chunking = {
+                key: kb_details[key]
+                for key in schemas.ChunkingSettings.model_fields
+                if kb_details.get(key) is not None
+            }
+            
             # Create a KnowledgeBaseCreate object
             kb = schemas.KnowledgeBaseCreate(
                 name=kb_details.get("name", ""),
                 description=kb_details.get("description"),
                 embedding_model=kb_details.get("embedding_model"),
                 vector_store=kb_details.get("vector_store"),
-                workspace_id=kb_details.get("workspace_id")
+                workspace_id=kb_details.get("workspace_id"),
+                **chunking
             )
             
         except json.JSONDecodeError as e:
@@ -846,17 +1062,25 @@ async def create_knowledge_base_with_sources(
                 "status": "error",
                 "message": f"Invalid JSON format: {str(e)}"
             }
+        except ValidationError as e:
+            logger.error(f"Invalid knowledge base details: {str(e)}")
+            return {
+                "status": "error",
+                "message": f"Invalid knowledge base details: {str(e)}"
+            }
         
-        # Step 1: Create the knowledge base
-        last_kb = db.query(models.KnowledgeBase).order_by(models.KnowledgeBase.kb_id.desc()).first()
-        
-        if last_kb:
-            last_id = int(last_kb.kb_id.split('_')[1])
-            new_id = last_id + 1
-        else:
-            new_id = 1
+        # Stream the uploads to scratch files before any database work, so
+        # no connection is held while the bodies are copied
+        for file in files or []:
+            if not file:
+                continue
+            try:
+                staged.append((file, *await stage_upload(file)))
+            except Exception as e:
+                logger.error(f"Failed to upload file {file.filename}: {str(e)}")
         
-        kb_id = f"kb_{new_id}"
+        # Step 1: Create the knowledge base
+        kb_id = await get_next_kb_id(db)
         
         # Create KB directory structure
         base_path = pathlib.Path(__file__).parent.parent
@@ -881,21 +1105,21 @@ async def create_knowledge_base_with_sources(
             created_by = current_user.username,
             embedding_model=kb.embedding_model,
             vector_store=kb.vector_store,
+            chunking_strategy=kb.chunking_strategy,
+            chunk_size=kb.chunk_size,
+            chunk_overlap=kb.chunk_overlap,
             workspace_id=kb.workspace_id
         )
         
         db.add(db_kb)
-        db.commit()
-        db.refresh(db_kb)
+        await db.commit()
+        await db.refresh(db_kb)
         
         # Step 2: Upload files if provided
         uploaded_files = []
         
-        if files:
-            for file in files:
-                if not file:
-                    continue
-                    
+        if staged:
+            for file, tmp_path, file_size, content_hash in staged:
                 # Generate unique file ID
                 file_id = f"file_{uuid.uuid4()}"
                 
@@ -908,25 +1132,24 @@ async def create_knowledge_base_with_sources(
                 
                 # Save the file
                 try:
-                    # Read file content
-                    contents = await file.read()
-                    
-                    # Write file to disk
-                    with open(file_path, "wb") as f:
-                        f.write(contents)
-                    
-                    # Create file metadata entry
-                    file_metadata = models.FileMetadata(
-                        file_id=file_id,
-                        filename=file.filename,
-                        file_size=len(contents),
-                        file_type=file_extension.replace(".", ""),
-                        kb_id=kb_id,
-                        file_path=str(file_path),
-                        uploaded_by= current_user.username
-                    )
-                    
-                    db.add(file_metadata)
+                    # A failed file rolls back to here, without its blob reference
+                    async with source_savepoint(db, file_path):
+                        # Move the staged upload into the shared blob store and link it here
+                        await store_file(db, tmp_path, file_size, content_hash, file_path)
+                        
+                        # Create file metadata entry
+                        file_metadata = models.FileMetadata(
+                            file_id=file_id,
+                            filename=file.filename,
+                            file_size=file_size,
+                            content_hash=content_hash,
+                            file_type=file_extension.replace(".", ""),
+                            kb_id=kb_id,
+                            file_path=str(file_path),
+                            uploaded_by= current_user.username
+                        )
+                        
+                        db.add(file_metadata)
                     uploaded_files.append(file_metadata)
                     
                 except Exception as e:
@@ -937,52 +1160,18 @@ async def create_knowledge_base_with_sources(
         processed_urls = []
         
         if urls:
-            for url in urls:
+            # Fetch all pages concurrently, then record them one by one on the session
+            fetched_pages = await url_fetcher.fetch_many([(url, await new_tmp_path()) for url in urls])
+            
+            for fetched in fetched_pages:
+                if not fetched.ok:
+                    continue
                 try:
-                    # Parse URL to get domain for filename
-                    parsed_url = urlparse(url)
-                    domain = parsed_url.netloc
-                    
-                    # Generate unique file ID
-                    file_id = f"file_{uuid.uuid4()}"
-                    file_name = f"{file_id}_{domain}.html"
-                    file_path = os.path.join(sources_dir, file_name)
-                    
-                    # Fetch website content
-                    try:
-                        headers = {
-                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-                        }
-                        response = requests.get(url, headers=headers, timeout=10)
-                        response.raise_for_status()
-                    except requests.exceptions.RequestException as e:
-                        logger.error(f"Failed to fetch URL {url}: {str(e)}")
-                        continue
-                    
-                    # Get the HTML content
-                    html_content = response.text
-                    
-                    # Save original HTML
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        f.write(html_content)
-                    
-                    # Create file metadata
-                    file_metadata = models.FileMetadata(
-                        file_id=file_id,
-                        filename=file_name,
-                        file_size=len(html_content),
-                        file_type="html",
-                        kb_id=kb_id,
-                        file_path=str(file_path),
-                        uploaded_by=current_user.username,
-                        url=url
-                    )
-                    
-                    db.add(file_metadata)
-                    processed_urls.append({"url": url, "file_id": file_id})
+                    file_metadata = await store_fetched_page(db, kb_id, sources_dir, fetched, current_user.username)
+                    processed_urls.append({"url": fetched.url, "file_id": file_metadata.file_id})
                     
                 except Exception as e:
-                    logger.error(f"Failed to process URL {url}: {str(e)}")
+                    logger.error(f"Failed to process URL {fetched.url}: {str(e)}")
                     continue
         
         # Update KB status based on whether files were uploaded
@@ -993,8 +1182,8 @@ async def create_knowledge_base_with_sources(
             db_kb.status = schemas.statusEnum.EMPTY
             
         # Commit all changes
-        db.commit()
-        db.refresh(db_kb)
+        await db.commit()
+        await db.refresh(db_kb)
         
         return {
             "status": "success",
@@ -1007,9 +1196,11 @@ async def create_knowledge_base_with_sources(
         
     except Exception as e:
         logger.error(f"Failed to create knowledge base with sources: {str(e)}")
-        db.rollback()
+        await db.rollback()
         return {
             "status": "error",
             "message": f"Failed to create knowledge base with sources: {str(e)}"
         }
+    finally:
+        discard_staged([tmp_path for _, tmp_path, _, _ in staged])
 
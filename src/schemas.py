@@ -1,4 +1,4 @@
-from pydantic import BaseModel, HttpUrl, EmailStr
+from pydantic import BaseModel, HttpUrl, EmailStr, Field, model_validator
 from datetime import datetime
 from typing import Optional, List, Dict
 from enum import Enum
@@ -10,6 +10,31 @@ class statusEnum(str, Enum):
     SYNCED = "synced"
     SYNCING = "syncing"
     FAILED = "failed"
+    EMPTY = "empty"
+    SKIPPED = "skipped"  # a file type no loader reads; not synced again until it is replaced
+
+class chunkingStrategyEnum(str, Enum):
+    RECURSIVE = "recursive"  # paragraphs, then lines, then words
+    CHARACTER = "character"  # paragraphs only
+    TOKEN = "token"  # sizes counted in tokens
+    SENTENCE = "sentence"  # whole sentences
+    MARKDOWN = "markdown"  # sections under Markdown headings
+
+class sortOrderEnum(str, Enum):
+    ASC = "asc"
+    DESC = "desc"
+
+class knowledgeBaseSortEnum(str, Enum):
+    CREATED_AT = "created_at"
+    LAST_UPDATED_AT = "last_updated_at"
+    NAME = "name"
+    KB_ID = "kb_id"
+
+class sourceSortEnum(str, Enum):
+    UPLOAD_DATE = "upload_date"
+    FILENAME = "filename"
+    FILE_SIZE = "file_size"
+    FILE_ID = "file_id"
 
 class UserBase(BaseModel):
     username: str
@@ -42,7 +67,18 @@ class KnowledgeBaseBase(BaseModel):
     category: Optional[str] = None  # Make category optional with default None
     status : statusEnum = statusEnum.UNSYNCED
     
-class KnowledgeBaseCreate(KnowledgeBaseBase):
+class ChunkingSettings(BaseModel):
+    chunking_strategy: chunkingStrategyEnum = chunkingStrategyEnum.RECURSIVE
+    chunk_size: int = Field(500, ge=1)
+    chunk_overlap: int = Field(50, ge=0)
+
+    @model_validator(mode="after")
+    def check_overlap(self):
+        if self.chunk_overlap >= self.chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        return self
+
+class KnowledgeBaseCreate(KnowledgeBaseBase, ChunkingSettings):
     embedding_model: Optional[str] = None
     vector_store: Optional[str] = None
     workspace_id: Optional[str] = None  # Optional field for workspace ID
@@ -65,11 +101,15 @@ class FileMetadataCreate(BaseModel):
     file_path: str  # Added field for file path
     status : statusEnum = statusEnum.UNSYNCED  # Default status set to "unsynced"
     url: Optional[str] = None  # Optional URL field
+    content_hash: Optional[str] = None  # SHA-256 of the file content
 
 class FileMetaData(FileMetadataCreate):
     file_id: str
     upload_date: datetime
     uploaded_by: str  # Username of the uploader
+    etag: Optional[str] = None  # Validators of the last fetch, URL sources only
+    last_modified: Optional[str] = None
+    last_fetched_at: Optional[datetime] = None
     class Config:
         from_attributes = True
 
@@ -98,6 +138,13 @@ class DeleteFileResponse(BaseModel):
 class UrlSubmission(BaseModel):
     url: HttpUrl
     
+class CrawlSubmission(BaseModel):
+    url: HttpUrl
+    max_depth: int = Field(2, ge=0, le=10)
+    max_pages: int = Field(100, ge=1)
+    same_domain: bool = True
+    use_sitemap: bool = True
+
 
 class UrlSubmissionResponse(BaseModel):
     kb_id: str
@@ -106,3 +153,7 @@ class UrlSubmissionResponse(BaseModel):
     filename: str
     file_size: int
     message: str
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    top_k: int = Field(5, ge=1, le=100)
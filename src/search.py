@@ -0,0 +1,41 @@
+import os
+import threading
+from dotenv import load_dotenv
+from . import models
+from .cache import TTLCache, MemoryEmbeddingCache
+from .vector_stores import search_vectorStore, get_vector_store_config
+
+load_dotenv()
+
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "300"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "10000"))
+
+query_embedding_cache = MemoryEmbeddingCache(QUERY_EMBEDDING_CACHE_MAX_ENTRIES, QUERY_EMBEDDING_CACHE_TTL_SECONDS)
+search_result_cache = TTLCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS)
+
+# Bumped whenever a knowledge base's vectors change; cached results of older
+# generations can no longer be looked up and age out of the cache
+_kb_generations: dict[str, int] = {}
+_generations_lock = threading.Lock()
+
+def invalidate_search_cache(kb_id: str):
+    with _generations_lock:
+        _kb_generations[kb_id] = _kb_generations.get(kb_id, 0) + 1
+
+def search_knowledge_base(kb: models.KnowledgeBase, query: str, top_k: int) -> tuple[list[dict], bool]:
+    """
+    Search a knowledge base, serving repeated queries from the result cache.
+    Returns the results and whether they came from the cache.
+    """
+    key = (kb.kb_id, _kb_generations.get(kb.kb_id, 0), query, top_k)
+    results = search_result_cache.get(key)
+    if results is not None:
+        return results, True
+
+    results = search_vectorStore(
+        get_vector_store_config(kb), query, top_k, embedding_cache=query_embedding_cache
+    )
+    search_result_cache.set(key, results)
+    return results, False
@@ -0,0 +1,253 @@
+import os
+import uuid
+import pathlib
+import hashlib
+import shutil
+import logging
+import anyio
+from contextlib import asynccontextmanager
+from fastapi import UploadFile
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from dotenv import load_dotenv
+from . import models
+from .extraction_cache import discard_extracted
+
+load_dotenv()
+
+logger = logging.getLogger("kb_service")
+
+# Bytes read from an upload and written to disk at a time
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Content-addressed store shared by all knowledge bases
+BLOBS_DIR = pathlib.Path(__file__).parent / "resources" / "blobs"
+
+async def save_upload(file: UploadFile, file_path: str) -> tuple[int, str]:
+    """
+    Stream an uploaded file to disk in fixed-size chunks, so memory use stays
+    bounded whatever the file size. Returns the size in bytes and the SHA-256
+    hex digest of the content.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(file_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+                await f.write(chunk)
+    except BaseException:
+        # Don't leave a truncated file behind
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    return size, digest.hexdigest()
+
+def hash_file(file_path: str) -> str:
+    """SHA-256 of a file on disk, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def blob_path(content_hash: str) -> pathlib.Path:
+    return BLOBS_DIR / content_hash[:2] / content_hash
+
+def _link(source: pathlib.Path, link_path: str):
+    # Link under a temporary name and rename, so an existing source is replaced atomically
+    tmp_link = f"{link_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(source, tmp_link)
+    except OSError:
+        # Hard links need the same filesystem
+        os.symlink(source, tmp_link)
+    os.replace(tmp_link, link_path)
+
+async def new_tmp_path() -> str:
+    """Path in the blob store's scratch directory to write incoming content to."""
+    tmp_dir = BLOBS_DIR / "tmp"
+    await anyio.to_thread.run_sync(lambda: os.makedirs(tmp_dir, exist_ok=True))
+    return str(tmp_dir / uuid.uuid4().hex)
+
+async def stage_upload(file: UploadFile) -> tuple[str, int, str]:
+    """
+    Stream an upload to a file in the blob store's scratch directory, for
+    ``store_file`` to move into the store. Done before any database work so
+    no connection or transaction is held while the body is copied.
+    Returns the scratch path, the size in bytes and the SHA-256 of the content.
+    """
+    tmp_path = await new_tmp_path()
+    file_size, content_hash = await save_upload(file, tmp_path)
+    return tmp_path, file_size, content_hash
+
+def discard_staged(tmp_paths: list[str]):
+    """Remove scratch files that were never handed to ``store_file``."""
+    for tmp_path in tmp_paths:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+async def store_file(db: AsyncSession, tmp_path: str, file_size: int, content_hash: str, file_path: str):
+    """
+    Move a file written to ``new_tmp_path()`` into the blob store, or drop it
+    if the content is already stored, and link the blob at ``file_path``.
+    Identical content added to several knowledge bases is stored once; the
+    blob's reference count is incremented for each FileMetadata row
+    pointing at it.
+    """
+    try:
+        path = blob_path(content_hash)
+        blob = await db.get(models.SourceBlob, content_hash)
+        if blob is None:
+            try:
+                async with db.begin_nested():
+                    blob = models.SourceBlob(
+                        content_hash=content_hash,
+                        file_path=str(path),
+                        file_size=file_size,
+                        ref_count=0,
+                    )
+                    db.add(blob)
+            except IntegrityError:
+                # Another request stored the same content first
+                blob = await db.get(models.SourceBlob, content_hash)
+
+        if path.exists():
+            os.remove(tmp_path)
+        else:
+            os.makedirs(path.parent, exist_ok=True)
+            os.replace(tmp_path, path)
+
+        blob.ref_count = models.SourceBlob.ref_count + 1
+        await db.flush()
+        # Referenced again, so keep the file even if this transaction released it before
+        db.sync_session.info.get(_RELEASED_BLOBS, {}).pop(content_hash, None)
+        _link(path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def adopt_file(db: Session, file_path: str) -> str:
+    """
+    Add a source stored before the blob store existed to it: hash it, link
+    the content into the blob store and take a reference to the blob for
+    the caller to record on the FileMetadata row. The source stays at
+    ``file_path``. Doesn't commit. Returns the SHA-256 of the content.
+    """
+    content_hash = hash_file(file_path)
+    path = blob_path(content_hash)
+    blob = db.get(models.SourceBlob, content_hash)
+    if blob is None:
+        try:
+            with db.begin_nested():
+                blob = models.SourceBlob(
+                    content_hash=content_hash,
+                    file_path=str(path),
+                    file_size=os.path.getsize(file_path),
+                    ref_count=0,
+                )
+                db.add(blob)
+        except IntegrityError:
+            # Another sync adopted the same content first
+            blob = db.get(models.SourceBlob, content_hash)
+
+    if not path.exists():
+        os.makedirs(path.parent, exist_ok=True)
+        try:
+            os.link(file_path, path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Hard links need the same filesystem; copy under a temporary name so the blob appears whole
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(file_path, tmp_path)
+            os.replace(tmp_path, path)
+
+    blob.ref_count = models.SourceBlob.ref_count + 1
+    db.flush()
+    # Referenced again, so keep the file even if this transaction released it before
+    db.info.get(_RELEASED_BLOBS, {}).pop(content_hash, None)
+    return content_hash
+
+@asynccontextmanager
+async def source_savepoint(db: AsyncSession, file_path: str):
+    """
+    Savepoint around storing one new source file and adding its FileMetadata
+    row. If anything in the block fails, the blob reference taken for the
+    file is rolled back with the row and the link at ``file_path`` is
+    removed, so the caller can skip the file and commit the others.
+    """
+    try:
+        async with db.begin_nested():
+            yield
+    except BaseException:
+        if os.path.lexists(file_path):
+            os.remove(file_path)
+        raise
+
+# Session.info key of the blobs whose last reference was dropped, by the
+# transaction or savepoint that dropped it
+_RELEASED_BLOBS = "released_blobs"
+
+async def release_blob(db: AsyncSession, content_hash: str | None):
+    """
+    Drop one reference to a blob, deleting the blob row once no FileMetadata
+    row uses it. Its file and extracted text are removed only after the
+    transaction commits, so rows stay readable if it is rolled back.
+    """
+    if not content_hash:
+        return
+    blob = await db.get(models.SourceBlob, content_hash)
+    if blob is None:
+        return
+
+    blob.ref_count = models.SourceBlob.ref_count - 1
+    await db.flush()
+    await db.refresh(blob)
+    if blob.ref_count > 0:
+        return
+
+    await db.delete(blob)
+    session = db.sync_session
+    transaction = session.get_nested_transaction() or session.get_transaction()
+    session.info.setdefault(_RELEASED_BLOBS, {})[content_hash] = transaction
+
+def _remove_blob_files(content_hash: str):
+    try:
+        path = blob_path(content_hash)
+        if path.exists():
+            os.remove(path)
+        discard_extracted(content_hash)
+    except Exception as e:
+        logger.error(f"Failed to delete blob {content_hash}: {str(e)}")
+
+def _within(transaction, ancestor) -> bool:
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+@event.listens_for(Session, "after_commit")
+def _remove_released_blobs(session: Session):
+    # Also fires when a savepoint is released; wait for the outer commit
+    if session.in_nested_transaction():
+        return
+    for content_hash in session.info.pop(_RELEASED_BLOBS, {}):
+        _remove_blob_files(content_hash)
+
+@event.listens_for(Session, "after_rollback")
+def _keep_released_blobs(session: Session):
+    savepoint = session.get_nested_transaction()
+    if savepoint is None:
+        session.info.pop(_RELEASED_BLOBS, None)
+        return
+    released = session.info.get(_RELEASED_BLOBS, {})
+    for content_hash, transaction in list(released.items()):
+        if _within(transaction, savepoint):
+            del released[content_hash]
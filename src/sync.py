@@ -0,0 +1,365 @@
+import os
+import time
+import itertools
+import logging
+from contextlib import suppress
+from dataclasses import dataclass, field
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from langchain_core.documents import Document
+from . import models, schemas
+from .schemas import statusEnum
+from .vector_stores import VectorStoreWriter, get_vector_store_config
+from .search import invalidate_search_cache
+from .loaders import is_supported, iter_extracted
+from .storage import adopt_file
+from .extraction_cache import read_chunks, write_chunks
+from .chunking import ChunkingConfig
+
+logger = logging.getLogger("kb_service")
+
+# Files in these states have no up to date vectors and are picked up by the next sync.
+# SYNCING and FAILED cover syncs that were interrupted or errored part way through.
+PENDING_SYNC_STATUSES = {
+    statusEnum.UNSYNCED,
+    statusEnum.UPDATED,
+    statusEnum.SYNCING,
+    statusEnum.FAILED,
+}
+
+# File ids per UPDATE or SELECT statement, keeping the IN list well within the bind parameter limits
+STATUS_UPDATE_BATCH_SIZE = 1000
+
+@dataclass
+class SyncProgress:
+    """Counters a running sync updates as it goes, used to report progress and ETA."""
+    files_total: int = 0
+    files_done: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    started_at: float = field(default_factory=time.time)
+
+    def eta_seconds(self) -> float | None:
+        if not self.files_total or not self.files_done:
+            return None
+        # Extrapolate the final chunk count from the files loaded so far
+        expected_chunks = self.chunks_total * self.files_total / self.files_done
+        done = self.files_done + self.chunks_embedded
+        total = self.files_total + expected_chunks
+        if done >= total:
+            return 0.0
+        elapsed = time.time() - self.started_at
+        return elapsed * (total - done) / done
+
+    def add_embedded(self, chunk_count: int):
+        self.chunks_embedded += chunk_count
+
+def set_file_status(db: Session, kb_id: str, file_ids: list[str], status: statusEnum):
+    """Set the status of many files of a knowledge base with set-based UPDATEs, without committing."""
+    for start in range(0, len(file_ids), STATUS_UPDATE_BATCH_SIZE):
+        db.execute(
+            update(models.FileMetadata)
+            .where(
+                models.FileMetadata.kb_id == kb_id,
+                models.FileMetadata.file_id.in_(file_ids[start:start + STATUS_UPDATE_BATCH_SIZE]),
+            )
+            .values(status=status)
+        )
+
+def load_files(db: Session, kb_id: str, file_ids: list[str]) -> list[models.FileMetadata]:
+    """FileMetadata rows of a knowledge base by id, in a few IN queries."""
+    files = []
+    for start in range(0, len(file_ids), STATUS_UPDATE_BATCH_SIZE):
+        files.extend(db.query(models.FileMetadata).filter(
+            models.FileMetadata.kb_id == kb_id,
+            models.FileMetadata.file_id.in_(file_ids[start:start + STATUS_UPDATE_BATCH_SIZE]),
+        ))
+    return files
+
+def sync_knowledge_base(db: Session, kb_id: str, progress: SyncProgress = None) -> dict:
+    """
+    Load, split and embed the new and changed sources of a knowledge base.
+    Returns the response body reported to the client.
+    """
+    if progress is None:
+        progress = SyncProgress()
+
+    # Check if knowledge base exists
+    kb = db.query(models.KnowledgeBase).filter(models.KnowledgeBase.kb_id == kb_id).first()
+    if not kb:
+        logger.warning(f"Knowledge base with ID {kb_id} not found")
+        return {
+            "status": "error",
+            "message": "Knowledge base not found"
+        }   
+    
+    processed_files = []
+    failed_files = []
+    skipped_files = []
+    synced_files = []
+    total_content_length = 0
+    writer = None
+    
+    try:
+        kb.status = statusEnum.SYNCING
+        # kb.last_updated_at = datetime.now()
+
+        try:
+            db.commit()
+            db.refresh(kb)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error updating knowledge base status to SYNCING: {str(e)}")
+            return {
+                "status": "error",
+                "message": f"Error updating knowledge base status: {str(e)}"
+            }    
+        
+        # Only the files changed since the last sync, selected through the (kb_id, status)
+        # index in one query; statuses are then tracked in memory and written back with
+        # a few set-based UPDATEs
+        pending_rows = db.query(models.FileMetadata).filter(
+            models.FileMetadata.kb_id == kb_id,
+            models.FileMetadata.status.in_(PENDING_SYNC_STATUSES)
+        ).all()
+        progress.files_total = len(pending_rows)
+        
+        # Collect the pending files first so they can be parsed in parallel
+        pending_files = {}
+        cached_chunks = {}
+        chunking = ChunkingConfig.from_kb(kb)
+        splitter_key = chunking.cache_key()
+        for file_metadata in pending_rows:
+            file_id = file_metadata.file_id
+            file_path = file_metadata.file_path
+            # Sources are opened by their stored path; the loader follows the stored file's extension
+            filename = os.path.basename(file_path) if file_path else file_metadata.filename
+            file_extension = os.path.splitext(filename)[1].lower()
+            
+            if not is_supported(filename):
+                logger.warning(f"Unsupported file type {file_extension} for {filename}")
+                skipped_files.append(file_metadata)
+                progress.files_done += 1
+                continue
+            
+            if not file_path or not os.path.exists(file_path):
+                logger.warning(f"Source file of {file_id} not found in knowledge base {kb_id}")
+                failed_files.append(file_metadata)
+                progress.files_done += 1
+                continue
+            
+            # Uploads are hashed when stored; sources from before the blob store are hashed and
+            # added to it once, here, so they can be cached too
+            content_hash = file_metadata.content_hash
+            if not content_hash:
+                try:
+                    content_hash = adopt_file(db, file_path)
+                    file_metadata.content_hash = content_hash
+                except OSError as e:
+                    logger.warning(f"Failed to hash source file of {file_id}: {str(e)}")
+            
+            pending_files[file_id] = (filename, file_extension, file_metadata, content_hash)
+            
+            # Unchanged content already split with the same settings skips parsing entirely
+            if content_hash:
+                cached = read_chunks(content_hash, file_extension, splitter_key)
+                if cached is not None:
+                    cached_chunks[file_id] = cached
+        
+        extraction_queue = [
+            (file_id, file_metadata.file_path, content_hash)
+            for file_id, (filename, file_extension, file_metadata, content_hash) in pending_files.items()
+            if file_id not in cached_chunks
+        ]
+        
+        # Files synced before may already have vectors in the store which must be replaced
+        replaced_file_ids = {
+            file_id for file_id, (_, _, file_metadata, _) in pending_files.items()
+            if file_metadata.status != statusEnum.UNSYNCED
+        }
+        # Marked before any vector is written, so an interrupted sync replaces them next time
+        try:
+            set_file_status(db, kb_id, list(pending_files), statusEnum.SYNCING)
+            db.commit()
+            # The commit expired the loaded rows; reload them in bulk rather than one lazy load per row
+            load_files(db, kb_id, list(pending_files))
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error updating file statuses to SYNCING for KB {kb_id}: {str(e)}")
+            return {
+                "status": "error",
+                "message": f"Error updating file metadata: {str(e)}"
+            }
+        
+        # Embeds and writes chunks in the background while later files are still parsed
+        if pending_files:
+            writer = VectorStoreWriter.for_config(get_vector_store_config(kb), on_batch=progress.add_embedded)
+        
+        # Cached files first, then the rest in the order they finish parsing
+        extracted = itertools.chain(
+            ((file_id, None, None) for file_id in list(cached_chunks)),
+            iter_extracted(extraction_queue, chunking),
+        )
+        for file_id, split, error in extracted:
+            filename, file_extension, file_metadata, content_hash = pending_files[file_id]
+            
+            file_name = file_metadata.filename
+            file_size = file_metadata.file_size
+            file_type = file_metadata.file_type
+            file_url = file_metadata.url if file_metadata.url else None
+            kb_id = kb.kb_id
+            kb_name = kb.name
+            upload_date = file_metadata.upload_date
+            uploaded_by = file_metadata.uploaded_by
+            
+            try:
+                if error is not None:
+                    raise error
+                
+                processed_files.append(filename)
+                
+                if file_id in cached_chunks:
+                    cached = cached_chunks.pop(file_id)
+                    total_content_length += cached["content_length"]
+                    texts = [Document(page_content=chunk) for chunk in cached["chunks"]]
+                    pages = cached.get("pages")
+                else:
+                    total_content_length += split.content_length
+                    texts = [Document(page_content=chunk) for chunk in split.chunks]
+                    pages = split.pages
+                    if content_hash:
+                        write_chunks(
+                            content_hash, file_extension, splitter_key,
+                            split.content_length, split.chunks, pages
+                        )
+                
+                for i, doc in enumerate(texts):
+                    meta = doc.metadata
+                    meta['file_name'] = file_name
+                    meta['file_id'] = file_id
+                    meta['file_size'] = file_size
+                    meta['file_type'] = file_type
+                    meta['file_url'] = file_url
+                    meta["kb_id"] = kb_id
+                    meta["kb_name"] = kb_name
+                    meta["upload_date"] = upload_date.isoformat() 
+                    meta["uploaded_by"] = uploaded_by
+                    if pages is not None:
+                        meta["page_number"] = pages[i]
+                    doc.metadata = meta   
+                      
+                progress.chunks_total += len(texts)
+                progress.files_done += 1
+                synced_files.append(file_metadata)
+                # Blocks while the embedding side is behind
+                writer.add(file_id, texts, replace=file_id in replaced_file_ids)
+            
+            except Exception as e:
+                if writer.error is not None:
+                    # Embedding failed; stop parsing and report it below
+                    break
+                logger.error(f"Error processing {filename}: {str(e)}")
+                failed_files.append(file_metadata)
+                progress.files_done += 1
+        
+        if failed_files or skipped_files:
+            try:
+                set_file_status(db, kb_id, [f.file_id for f in failed_files], statusEnum.FAILED)
+                set_file_status(db, kb_id, [f.file_id for f in skipped_files], statusEnum.SKIPPED)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error updating file statuses to FAILED for KB {kb_id}: {str(e)}")
+        skipped_filenames = [f.filename for f in skipped_files]
+      
+        if not processed_files and not failed_files:
+            logger.info(f"No changed files to sync for KB {kb_id}")
+            kb.status = statusEnum.SYNCED
+            db.commit()
+            return {
+                "status": "success",
+                "kb_id": kb_id,
+                "file_count": 0,
+                "total_content_length": 0,
+                "processed_files": [],
+                "skipped_files": skipped_filenames,
+                "message": f"Knowledge base {kb_id} is already up to date"
+            }
+        
+        if not processed_files:
+            logger.warning(f"No files were successfully processed for KB {kb_id}")
+            kb.status = statusEnum.FAILED
+            db.commit()
+            return {
+                "status": "error",
+                "message": "No files were successfully processed",
+                "unprocessed_files": [f.filename for f in failed_files],
+                "skipped_files": skipped_filenames,
+            }
+            
+        try:
+            try:
+                # Waits for the chunks still queued or being embedded
+                writer.close()
+            finally:
+                # The vectors changed, even if only partially, so cached search results are stale
+                invalidate_search_cache(kb_id)
+            
+            kb.status = schemas.statusEnum.SYNCED
+            kb.last_updated_at = datetime.now()
+            try:
+                # The files embedded in this run and the knowledge base in one commit
+                set_file_status(db, kb_id, [f.file_id for f in synced_files], statusEnum.SYNCED)
+                db.commit()
+                        
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error updating knowledge base status to SYNCED: {str(e)}")
+                return {
+                    "status": "error",
+                    "message": f"Error updating knowledge base status: {str(e)}"
+                }
+            logger.info(f"Successfully added {writer.chunks_written} chunks to vector store for KB {kb_id}")
+                
+        except Exception as e:
+            # Log the error and return a meaningful message
+            logger.error(f"Error adding chunks to vector store for KB {kb_id}: {str(e)}")
+            kb.status = statusEnum.FAILED
+            db.commit()
+            return {
+                "status": "error",
+                "message": f"Error creating embeddings: {str(e)}",
+                "processed_files": processed_files
+            }
+    
+    except Exception as e:
+        logger.error(f"Error processing files for KB {kb_id}: {str(e)}")
+        
+        try:
+            kb.status = statusEnum.FAILED
+            db.commit()
+            db.refresh(kb)
+        except Exception:
+            db.rollback()
+            
+        return {
+            "status": "error",
+            "message": f"Error processing files: {str(e)}",
+            "processed_files": processed_files
+        }
+    finally:
+        if writer is not None:
+            # Stops the writer on early returns; a no-op once it was closed above
+            with suppress(Exception):
+                writer.close()
+    
+    return {
+        "status": "success",
+        "kb_id": kb_id,
+        "file_count": len(processed_files),
+        "total_content_length": total_content_length,
+        "processed_files": processed_files,
+        "skipped_files": skipped_filenames,
+        "message": f"Processed {len(processed_files)} files from knowledge base {kb_id}"
+    }
@@ -0,0 +1,118 @@
+import os
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("kb_service")
+
+# Encoding used when the model has no tiktoken mapping of its own
+DEFAULT_ENCODING = "cl100k_base"
+# Rough characters per token for models without a local tokenizer
+CHARS_PER_TOKEN = 4
+# Estimated counts can be low, so only this share of an estimated limit is used
+ESTIMATE_SAFETY = 0.9
+
+@dataclass(frozen=True)
+class EmbeddingLimits:
+    """Request limits of an embedding API, in tokens and number of inputs."""
+    max_input_tokens: int
+    max_batch_tokens: int
+    max_batch_size: int
+
+# Published limits of the embedding endpoints, per provider
+PROVIDER_LIMITS = {
+    "OPENAI": EmbeddingLimits(max_input_tokens=8191, max_batch_tokens=300_000, max_batch_size=2048),
+    "GEMINI": EmbeddingLimits(max_input_tokens=2048, max_batch_tokens=100 * 2048, max_batch_size=100),
+}
+# Used for unknown providers, the smallest of the above
+DEFAULT_LIMITS = EmbeddingLimits(max_input_tokens=2048, max_batch_tokens=100 * 2048, max_batch_size=100)
+
+def embedding_model_name(provider: str) -> str:
+    """Model configured for a provider with ``EMBEDDING_MODEL_OPENAI`` / ``EMBEDDING_MODEL_GEMINI``."""
+    if not provider:
+        return None
+    return os.getenv(f"EMBEDDING_MODEL_{provider.upper()}")
+
+class TokenCounter:
+    """
+    Counts tokens the way the embedding model does. Without a tokenizer for
+    the model, the count is estimated from the number of characters.
+    """
+
+    def __init__(self, encoding=None):
+        self.encoding = encoding
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def __call__(self, text: str) -> int:
+        if self.encoding is None:
+            return -(-len(text) // CHARS_PER_TOKEN)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+@lru_cache(maxsize=16)
+def get_token_counter(provider: str = None, model_name: str = None) -> TokenCounter:
+    """
+    Token counter for an embedding model. OpenAI models are counted with
+    their tiktoken encoding; Gemini has no local tokenizer and is estimated.
+    """
+    if provider and provider.upper() == "GEMINI":
+        return TokenCounter()
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model_name) if model_name else tiktoken.get_encoding(DEFAULT_ENCODING)
+        except KeyError:
+            encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        # The encoding files are downloaded on first use and may be unreachable
+        logger.warning(f"Token encoding for {model_name or DEFAULT_ENCODING} unavailable, estimating token counts: {str(e)}")
+        return TokenCounter()
+    return TokenCounter(encoding)
+
+def _env_int(name: str):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+def get_embedding_limits(provider: str = None) -> EmbeddingLimits:
+    """
+    Limits used to size chunks and pack embedding batches for a provider.
+    ``EMBEDDING_MAX_INPUT_TOKENS``, ``EMBEDDING_MAX_BATCH_TOKENS`` and
+    ``EMBEDDING_BATCH_SIZE`` lower them, e.g. for an account with a smaller quota.
+    """
+    provider = (provider or "").upper()
+    limits = PROVIDER_LIMITS.get(provider, DEFAULT_LIMITS)
+    max_input_tokens = min(limits.max_input_tokens, _env_int("EMBEDDING_MAX_INPUT_TOKENS") or limits.max_input_tokens)
+    max_batch_tokens = min(limits.max_batch_tokens, _env_int("EMBEDDING_MAX_BATCH_TOKENS") or limits.max_batch_tokens)
+    max_batch_size = min(limits.max_batch_size, _env_int("EMBEDDING_BATCH_SIZE") or limits.max_batch_size)
+    if not get_token_counter(provider, embedding_model_name(provider)).exact:
+        max_input_tokens = int(max_input_tokens * ESTIMATE_SAFETY)
+        max_batch_tokens = int(max_batch_tokens * ESTIMATE_SAFETY)
+    return EmbeddingLimits(max_input_tokens, max_batch_tokens, max_batch_size)
+
+def pack_batches(items, count_tokens, limits: EmbeddingLimits):
+    """
+    Group ``items`` into consecutive batches carrying as many tokens as a
+    request allows, within the input count limit. Items can be streamed; a
+    ``None`` item ends the current batch early, for when no more input is
+    ready. With no batch to end, ``None`` is passed on to tell the consumer.
+    """
+    batch = []
+    total = 0
+    for item in items:
+        if item is None:
+            yield batch or None
+            batch, total = [], 0
+            continue
+        count = count_tokens(item)
+        if batch and (total + count > limits.max_batch_tokens or len(batch) >= limits.max_batch_size):
+            yield batch
+            batch, total = [], 0
+        batch.append(item)
+        total += count
+    if batch:
+        yield batch
@@ -1,4 +1,11 @@
 import os
+import queue
+import dataclasses
+import threading
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from langchain_core.documents import Document
 import time
@@ -8,9 +15,41 @@ from dialdeskai_vs.vector_stores.base import VectorStore
 from dialdeskai_vs.embeddings.openai import OpenAIEmbeddings
 from dialdeskai_vs.embeddings.google import GoogleGeminiEmbeddings
 from dialdeskai_vs.shared.types import EmbeddingModelType, VectorStoreType
+from .embeddings import BatchedEmbeddings, RateLimitedEmbeddings, EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY
+from .tokens import EmbeddingLimits, get_embedding_limits, get_token_counter, pack_batches
+from .embedding_cache import get_embedding_cache
+from .clients import ClientRegistry
 
 load_dotenv()
 
+# Pooled clients unused for this long are closed
+VECTOR_STORE_IDLE_SECONDS = float(os.getenv("VECTOR_STORE_IDLE_SECONDS", "900"))
+VECTOR_STORE_HEALTH_CHECK_SECONDS = float(os.getenv("VECTOR_STORE_HEALTH_CHECK_SECONDS", "60"))
+# Chunks a sync may have split but not yet embedded; splitting waits when the queue is full
+SYNC_QUEUE_CHUNKS = int(os.getenv("SYNC_QUEUE_CHUNKS", "4096"))
+
+def _check_vector_store(vector_store) -> bool:
+    # Stores that expose a ping are checked; others are trusted until a call fails
+    ping = getattr(vector_store, "ping", None)
+    if ping is None:
+        return True
+    ping()
+    return True
+
+embedding_clients = ClientRegistry("embedding", VECTOR_STORE_IDLE_SECONDS, VECTOR_STORE_HEALTH_CHECK_SECONDS)
+vector_store_clients = ClientRegistry(
+    "vector store", VECTOR_STORE_IDLE_SECONDS, VECTOR_STORE_HEALTH_CHECK_SECONDS, health_check=_check_vector_store
+)
+
+def get_vector_store_config(kb) -> dict:
+    """Vector store settings of a KnowledgeBase row."""
+    return {
+        "knowledge_base": kb.name,
+        "embedding_model": kb.embedding_model.upper(),
+        "vector_store": kb.vector_store.upper(),
+        "workspace_id": kb.workspace_id
+    }
+
 def get_embedding_model(config: dict):
     if config.get("embedding_model") == EmbeddingModelType.OPENAI:
         embedding_model = OpenAIEmbeddings(
@@ -29,8 +68,62 @@ def get_embedding_model(config: dict):
 
     return embedding_model
 
-def get_vector_store(config: dict) -> VectorStore:
-    embedding_model = get_embedding_model(config)
+def get_embedding_model_name(config: dict) -> str:
+    if config.get("embedding_model") == EmbeddingModelType.OPENAI:
+        return os.getenv("EMBEDDING_MODEL_OPENAI")
+    elif config.get("embedding_model") == EmbeddingModelType.GEMINI:
+        return os.getenv("EMBEDDING_MODEL_GEMINI")
+    raise ValueError("Unsupported embedding model type")
+
+@contextmanager
+def lease_embedding_model(config: dict):
+    """
+    Shared embedding client that batches requests, keeps them within the
+    provider's rate limits and reuses vectors from the persistent embedding
+    cache. It stays open until the ``with`` block ends.
+    """
+    provider = config.get("embedding_model")
+    model_name = f"{provider}:{get_embedding_model_name(config)}"
+    with embedding_clients.lease(
+        (model_name,),
+        lambda: BatchedEmbeddings(
+            RateLimitedEmbeddings(
+                get_embedding_model(config),
+                count_tokens=get_token_counter(provider, get_embedding_model_name(config)),
+            ),
+            model_name=model_name,
+            cache=get_embedding_cache(),
+        ),
+    ) as embedding_model:
+        yield embedding_model
+
+@contextmanager
+def lease_vector_store(config: dict):
+    """
+    Shared vector store client for a knowledge base, keyed by store type,
+    table/collection and embedding model, with its embedding client. Both
+    stay open until the ``with`` block ends.
+    """
+    with lease_embedding_model(config) as embedding_model:
+        key = (config.get("vector_store"), f"{config.get('knowledge_base')}_vector", embedding_model.model_name)
+        with vector_store_clients.lease(
+            key, lambda: get_vector_store(config, embedding_model=embedding_model)
+        ) as vector_store:
+            yield vector_store, embedding_model
+
+def close_clients():
+    vector_store_clients.close_all()
+    embedding_clients.close_all()
+
+def get_client_stats() -> dict:
+    return {
+        "vector_stores": vector_store_clients.stats(),
+        "embeddings": embedding_clients.stats(),
+    }
+
+def get_vector_store(config: dict, embedding_model=None) -> VectorStore:
+    if embedding_model is None:
+        embedding_model = get_embedding_model(config)
 
     if config.get("vector_store") == VectorStoreType.PGVECTOR:
         table_name = f"{config.get('knowledge_base')}_vector"
@@ -57,19 +150,251 @@ def get_vector_store(config: dict) -> VectorStore:
         raise ValueError("Unsupported vector store type")
     return vector_store    
 
-def add_to_vectorStore(config: dict, chunk_list: list[Document]):
+def insert_chunks(
+    vector_store: VectorStore,
+    embedding_model: BatchedEmbeddings,
+    chunk_list: Iterable[Document],
+    workspace_id: str,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    on_batch=None,
+    limits: EmbeddingLimits = None,
+    count_tokens=None,
+    concurrency: int = EMBEDDING_CONCURRENCY,
+    input_ready=None,
+):
+    """
+    Embed and insert chunks batch by batch: one embedding request and one
+    bulk write per batch instead of one of each per chunk. Batches hold
+    ``batch_size`` chunks, or with ``limits`` as many chunks as fit in the
+    token and input limits of one request, counted with ``count_tokens``.
+    Up to ``concurrency`` batches are embedded ahead while earlier ones are
+    written, in order. ``on_batch`` is called with the number of chunks
+    after each batch is written.
+
+    ``chunk_list`` may be a stream, see ``pack_batches``. ``input_ready``
+    tells whether the stream has more chunks without blocking; while it
+    doesn't, batches already embedded are written instead of waiting on it.
+    """
+    insert_many = getattr(vector_store, "insert_many", None)
+
+    if limits is None:
+        limits = EmbeddingLimits(max_input_tokens=0, max_batch_tokens=float("inf"), max_batch_size=batch_size)
+        batches = pack_batches(chunk_list, lambda chunk: 0, limits)
+    else:
+        count_tokens = count_tokens or get_token_counter()
+        batches = pack_batches(chunk_list, lambda chunk: count_tokens(chunk.page_content), limits)
+
+    window = max(1, concurrency)
+    pool = ThreadPoolExecutor(max_workers=window, thread_name_prefix="embed")
+    embedding = deque()
+    exhausted = False
+
+    def embed_ahead():
+        nonlocal exhausted
+        while not exhausted and len(embedding) < window:
+            # Only wait for input when there is nothing to write meanwhile
+            if embedding and input_ready is not None and not input_ready():
+                return
+            batch = next(batches, _DONE)
+            if batch is _DONE:
+                exhausted = True
+            elif batch is not None:
+                embedding.append((batch, pool.submit(embedding_model.fetch, [chunk.page_content for chunk in batch])))
+            elif embedding:
+                return
+
     try:
-        workspace_id = config.get("workspace_id", os.getenv("WORKSPACE_ID"))
-        vector_store = get_vector_store(config)
-        vector_store.clear(workspace_id=workspace_id)
-        for chunk in chunk_list:
-            vector_store.insert(
-                data=chunk.page_content, 
-                metadata=chunk.metadata, 
-                workspace_id=workspace_id
+        embed_ahead()
+        while embedding:
+            batch, vectors = embedding.popleft()
+            embedding_model.hold(vectors.result())
+            _write_batch(vector_store, insert_many, embedding_model, batch, workspace_id)
+            if on_batch is not None:
+                on_batch(len(batch))
+            embed_ahead()
+    finally:
+        # Don't wait for batches embedded ahead of a failed one
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _write_batch(vector_store: VectorStore, insert_many, embedding_model: BatchedEmbeddings, batch: list[Document], workspace_id: str):
+    try:
+        if insert_many is not None:
+            insert_many(
+                data=[chunk.page_content for chunk in batch],
+                metadata=[chunk.metadata for chunk in batch],
+                workspace_id=workspace_id,
             )
-            
-        print("Data inserted successfully")
+        else:
+            # Stores without a bulk API still get the vectors from the batch
+            for chunk in batch:
+                vector_store.insert(
+                    data=chunk.page_content,
+                    metadata=chunk.metadata,
+                    workspace_id=workspace_id
+                )
+    finally:
+        embedding_model.release()
+
+def delete_file_vectors(vector_store: VectorStore, file_ids: list[str], workspace_id: str):
+    """Remove the vectors of the given source files from the store."""
+    for file_id in file_ids:
+        vector_store.delete(metadata={"file_id": file_id}, workspace_id=workspace_id)
+
+def remove_from_vectorStore(config: dict, file_ids: list[str]):
+    workspace_id = config.get("workspace_id", os.getenv("WORKSPACE_ID"))
+    with lease_vector_store(config) as (vector_store, _):
+        delete_file_vectors(vector_store, file_ids, workspace_id)
+
+class _ReplaceFile:
+    def __init__(self, file_id: str):
+        self.file_id = file_id
+
+_DONE = object()
+
+class VectorStoreWriter:
+    """
+    Embeds and writes chunks on a background thread while the caller is still
+    producing them, so a sync embeds the first files while later ones are
+    parsed. Chunks pass through a queue of at most ``queue_size`` chunks, and
+    ``add`` blocks while it is full, which keeps memory bounded when embedding
+    is the slower side. Use ``for_config`` to write to a knowledge base's store.
+    ``on_done`` is called once the writer has stopped using the store.
+    """
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        embedding_model: BatchedEmbeddings,
+        workspace_id: str,
+        limits: EmbeddingLimits = None,
+        count_tokens=None,
+        on_batch=None,
+        queue_size: int = SYNC_QUEUE_CHUNKS,
+        on_done=None,
+    ):
+        self.vector_store = vector_store
+        self.embedding_model = embedding_model
+        self.workspace_id = workspace_id
+        self.limits = limits
+        self.count_tokens = count_tokens
+        self.on_batch = on_batch
+        self.on_done = on_done
+        self.chunks_written = 0
+        self.error = None
+        self._closed = False
+        self._drained = False
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._thread = threading.Thread(target=self._run, name="vector-store-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def for_config(cls, config: dict, on_batch=None) -> "VectorStoreWriter":
+        # The pooled clients stay leased until the writer is done with them
+        leases = ExitStack()
+        try:
+            vector_store, embedding_model = leases.enter_context(lease_vector_store(config))
+            provider = config.get("embedding_model")
+            limits = get_embedding_limits(provider)
+            # A batch larger than the token bucket's burst leaves it in debt for every other caller
+            max_request_tokens = getattr(embedding_model, "max_request_tokens", None)
+            if max_request_tokens is not None and max_request_tokens < limits.max_batch_tokens:
+                limits = dataclasses.replace(limits, max_batch_tokens=int(max_request_tokens))
+            return cls(
+                vector_store,
+                embedding_model,
+                config.get("workspace_id", os.getenv("WORKSPACE_ID")),
+                limits=limits,
+                count_tokens=get_token_counter(provider, get_embedding_model_name(config)),
+                on_batch=on_batch,
+                on_done=leases.close,
+            )
+        except BaseException:
+            leases.close()
+            raise
+
+    def add(self, file_id: str, chunks: list[Document], replace: bool = False):
+        """
+        Queue the chunks of a file. With ``replace``, the file's existing
+        vectors are deleted before its new chunks are written.
+        """
+        if self.error is not None:
+            raise self.error
+        if replace:
+            self._queue.put(_ReplaceFile(file_id))
+        for chunk in chunks:
+            self._queue.put(chunk)
+
+    def close(self):
+        """Wait until every queued chunk is written; raises the first error of the writer."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_DONE)
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _written(self, chunk_count: int):
+        self.chunks_written += chunk_count
+        if self.on_batch is not None:
+            self.on_batch(chunk_count)
+
+    def _chunks(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                # Nothing else ready: embed the partial batch now instead of idling
+                yield None
+                item = self._queue.get()
+            if item is _DONE:
+                self._drained = True
+                return
+            if isinstance(item, _ReplaceFile):
+                delete_file_vectors(self.vector_store, [item.file_id], self.workspace_id)
+                continue
+            yield item
+
+    def _run(self):
+        try:
+            insert_chunks(
+                self.vector_store,
+                self.embedding_model,
+                self._chunks(),
+                self.workspace_id,
+                on_batch=self._written,
+                limits=self.limits,
+                count_tokens=self.count_tokens,
+                input_ready=lambda: not self._queue.empty(),
+            )
+        except Exception as e:
+            self.error = e
+            # Keep draining so a producer blocked on a full queue is released
+            while not self._drained:
+                self._drained = self._queue.get() is _DONE
+        finally:
+            if self.on_done is not None:
+                self.on_done()
+
+def _to_search_hit(result) -> dict:
+    if isinstance(result, dict):
+        return {
+            "content": result.get("content", result.get("data")),
+            "metadata": result.get("metadata", {}),
+            "score": result.get("score"),
+        }
+    return {
+        "content": getattr(result, "content", getattr(result, "data", None)),
+        "metadata": getattr(result, "metadata", {}),
+        "score": getattr(result, "score", None),
+    }
 
-    except Exception as e:
-        print("Error is ", e)
+def search_vectorStore(config: dict, query: str, top_k: int, embedding_cache=None) -> list[dict]:
+    """Top-k similarity search; returns the matching chunks with metadata and score."""
+    workspace_id = config.get("workspace_id", os.getenv("WORKSPACE_ID"))
+    with lease_vector_store(config) as (vector_store, embedding_model):
+        if embedding_cache is not None:
+            with embedding_model.use_cache(embedding_cache):
+                results = vector_store.search(query=query, top_k=top_k, workspace_id=workspace_id)
+        else:
+            results = vector_store.search(query=query, top_k=top_k, workspace_id=workspace_id)
+    return [_to_search_hit(result) for result in results]
@@ -0,0 +1,167 @@
+"""
+Crawler tests against a small site served from a local fixture server.
+
+    python -m unittest tests.test_crawler
+"""
+import os
+import shutil
+import pathlib
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from src import storage
+from src.crawler import SiteCrawler, normalize_url
+from src.fetcher import UrlFetcher
+
+# Served on 127.0.0.1; "localhost" on the same port is another site to the crawler
+PAGES = {
+    "/": (
+        '<a href="/docs/">docs</a> <a href="about?utm_source=home">about</a> <a href="/old">old</a> '
+        '<a href="/moved">moved</a> <a href="http://127.0.0.2:{port}/external">external</a> '
+        '<a href="#top">top</a> <a href="mailto:docs@example.com">mail</a>'
+    ),
+    "/docs/": '<a href="a.html">a</a> <a href="./b.html#intro">b</a> <a href="../docs/a.html">a again</a> <a href="/file.pdf">pdf</a>',
+    "/docs/a.html": '<a href="deep/c.html">c</a>',
+    "/docs/b.html": "B",
+    "/docs/deep/c.html": "C",
+    "/about": "ABOUT",
+    "/mirror": "ABOUT",
+    "/only-in-sitemap": "SITEMAP ONLY",
+    "/elsewhere": "ELSEWHERE",
+}
+REDIRECTS = {
+    "/old": "/about",
+    "/moved": "http://localhost:{port}/elsewhere",
+    "/start-moved": "http://localhost:{port}/",
+}
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        port = self.server.server_address[1]
+        path = self.path.split("?")[0]
+        self.server.requests.append(f"{self.headers['Host'].split(':')[0]}{path}")
+        if path in REDIRECTS:
+            self.send_response(301)
+            self.send_header("Location", REDIRECTS[path].format(port=port))
+            self.end_headers()
+            return
+        if path == "/sitemap.xml":
+            body = (
+                '<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                f'<sitemap><loc>http://127.0.0.1:{port}/sitemap-pages.xml</loc></sitemap></sitemapindex>'
+            )
+            content_type = "application/xml"
+        elif path == "/sitemap-pages.xml":
+            body = '<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">' + "".join(
+                f"<url><loc>http://127.0.0.1:{port}{page}</loc></url>" for page in ("/only-in-sitemap", "/mirror", "/")
+            ) + "</urlset>"
+            content_type = "application/xml"
+        elif path == "/file.pdf":
+            body, content_type = "%PDF-1.4", "application/pdf"
+        elif path in PAGES:
+            body = f"<html><body>{PAGES[path].format(port=port)}</body></html>"
+            content_type = "text/html; charset=utf-8"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class NormalizeUrlTest(unittest.TestCase):
+    def test_canonical_form(self):
+        self.assertEqual(
+            normalize_url("HTTP://Example.COM:80/a/../b/?b=2&a=1&utm_source=x#top"),
+            "http://example.com/b/?a=1&b=2",
+        )
+        self.assertEqual(normalize_url("https://example.com"), "https://example.com/")
+        self.assertIsNone(normalize_url("mailto:docs@example.com"))
+
+    def test_ipv6_hosts_keep_their_brackets(self):
+        self.assertEqual(normalize_url("http://[::1]:8080/x"), "http://[::1]:8080/x")
+        self.assertEqual(normalize_url("https://[2001:DB8::1]:443/"), "https://[2001:db8::1]/")
+
+    def test_unparseable_urls(self):
+        for url in ("http://example.com:99999/", "http://example.com:port/", "http://[::1/x"):
+            self.assertIsNone(normalize_url(url), url)
+
+class SiteCrawlerTest(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _SiteHandler)
+        cls.server.requests = []
+        cls.port = cls.server.server_address[1]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests.clear()
+        # Fetched pages land in the blob store's scratch directory
+        blobs_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, blobs_dir)
+        patcher = mock.patch.object(storage, "BLOBS_DIR", pathlib.Path(blobs_dir))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def url(self, path: str, host: str = "127.0.0.1") -> str:
+        return f"http://{host}:{self.port}{path}"
+
+    async def crawl(self, path: str = "/", **options) -> dict[str, int]:
+        crawler = SiteCrawler(self.url(path), fetcher=UrlFetcher(host_interval=0), **options)
+        pages = await crawler.crawl()
+        for page in pages:
+            self.assertTrue(os.path.exists(page.fetched.file_path))
+        return {urlsplit(page.url).path: page.depth for page in pages}
+
+    async def test_depth_and_dedup(self):
+        pages = await self.crawl(max_depth=2, use_sitemap=False)
+        # /old redirects to /about, crawled already; /moved leaves the site; a.html is linked twice
+        self.assertEqual(pages, {"/": 0, "/docs/": 1, "/about": 1, "/docs/a.html": 2, "/docs/b.html": 2})
+        self.assertNotIn("127.0.0.1/docs/deep/c.html", self.server.requests)
+        self.assertEqual(self.server.requests.count("127.0.0.1/docs/a.html"), 1)
+        self.assertFalse(any(request.startswith("127.0.0.2") for request in self.server.requests))
+
+    async def test_max_pages(self):
+        pages = await self.crawl(max_depth=5, max_pages=3, use_sitemap=False)
+        self.assertEqual(len(pages), 3)
+
+    async def test_sitemap(self):
+        pages = await self.crawl(max_depth=1)
+        # /about has the same content as /mirror, listed in the sitemap
+        self.assertEqual(pages, {"/": 0, "/only-in-sitemap": 0, "/mirror": 0, "/docs/": 1})
+        self.assertIn("127.0.0.1/sitemap-pages.xml", self.server.requests)
+
+    async def test_off_domain_redirect(self):
+        pages = await self.crawl(max_depth=1, use_sitemap=False)
+        self.assertNotIn("/moved", pages)
+        self.assertIn("localhost/elsewhere", self.server.requests)
+
+        pages = await self.crawl(max_depth=1, use_sitemap=False, same_domain=False)
+        self.assertEqual(pages["/moved"], 1)
+
+    async def test_start_page_redirect_moves_the_site(self):
+        crawler = SiteCrawler(self.url("/start-moved"), max_depth=1, use_sitemap=False, fetcher=UrlFetcher(host_interval=0))
+        pages = await crawler.crawl()
+        self.assertEqual(pages[0].fetched.final_url, self.url("/", host="localhost"))
+        # Links of the start page are followed on the site it redirected to
+        self.assertEqual(
+            {(urlsplit(page.url).hostname, urlsplit(page.url).path) for page in pages[1:]},
+            {("localhost", "/docs/"), ("localhost", "/about"), ("localhost", "/moved")},
+        )
+
+if __name__ == "__main__":
+    unittest.main()
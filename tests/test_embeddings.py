@@ -0,0 +1,197 @@
+"""
+Embedding client tests against a fake provider that counts its requests,
+with the rate limiter's clock replaced by one the tests advance.
+
+    python -m unittest tests.test_embeddings
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from src import embeddings
+from src.embeddings import BatchedEmbeddings, RateLimitedEmbeddings, TokenBucket
+from src.embedding_cache import EmbeddingCache
+
+class FakeProvider:
+    def __init__(self):
+        self.requests = []
+
+    def embed(self, text: str) -> list[float]:
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        self.requests.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+class ProviderError(Exception):
+    def __init__(self, status_code: int, retry_after: str = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after else {})
+
+class FailingProvider(FakeProvider):
+    """Raises the given errors, one per request, before answering."""
+
+    def __init__(self, *errors):
+        super().__init__()
+        self.errors = list(errors)
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        self.requests.append(list(texts))
+        if self.errors:
+            raise self.errors.pop(0)
+        return [[float(len(text))] for text in texts]
+
+class FakeClock:
+    """Stands in for the time module; sleeping advances the clock at once."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class ClockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(embeddings, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+class BatchedEmbeddingsTest(unittest.TestCase):
+    def setUp(self):
+        self.provider = FakeProvider()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.cache = EmbeddingCache(os.path.join(cache_dir, "embeddings.sqlite3"))
+        self.model = BatchedEmbeddings(self.provider, model_name="fake:model", cache=self.cache)
+
+    def test_prefetched_vectors_serve_embed_and_embed_batch(self):
+        self.model.prefetch(["a", "bb", "a"])
+        self.assertEqual(self.provider.requests, [["a", "bb"]])
+        self.assertEqual(self.model.embed("bb"), [2.0])
+        self.assertEqual(self.model.embed_batch(["bb", "a", "bb"]), [[2.0], [1.0], [2.0]])
+        self.assertEqual(len(self.provider.requests), 1)
+
+    def test_embed_batch_fetches_only_the_misses(self):
+        self.model.hold({"a": [9.0]})
+        self.assertEqual(self.model.embed_batch(["a", "ccc", "ccc"]), [[9.0], [3.0], [3.0]])
+        self.assertEqual(self.provider.requests, [["ccc"]])
+
+    def test_cached_vectors_skip_the_provider(self):
+        self.model.embed_batch(["a", "bb"])
+        self.model.release()
+        other = BatchedEmbeddings(self.provider, model_name="fake:model", cache=self.cache)
+        self.assertEqual(other.embed_batch(["bb", "a"]), [[2.0], [1.0]])
+        self.assertEqual(len(self.provider.requests), 1)
+
+    def test_release_drops_held_vectors(self):
+        self.model.hold({"a": [9.0]})
+        self.model.release()
+        self.assertEqual(self.model.embed_batch(["a"]), [[1.0]])
+
+class TokenBucketTest(ClockTestCase):
+    def test_bursts_up_to_a_second_then_waits(self):
+        bucket = TokenBucket(120)
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5])
+
+    def test_large_request_waits_for_a_full_bucket_and_leaves_debt(self):
+        bucket = TokenBucket(60)
+        self.clock.now += 10
+        bucket.acquire(5)
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertEqual(bucket.available, -4)
+        bucket.acquire(1)
+        self.assertEqual(sum(self.clock.sleeps), 5)
+
+    def test_take_charges_without_waiting(self):
+        bucket = TokenBucket(60)
+        bucket.take(3)
+        self.assertEqual(self.clock.sleeps, [])
+        bucket.acquire(1)
+        self.assertEqual(sum(self.clock.sleeps), 3)
+
+    def test_zero_rate_disables_the_limit(self):
+        bucket = TokenBucket(0)
+        for _ in range(3):
+            bucket.acquire(1_000_000)
+            bucket.take(1_000_000)
+        self.assertEqual(self.clock.sleeps, [])
+
+class RateLimitedEmbeddingsTest(ClockTestCase):
+    def model(self, provider, **options):
+        options = {"requests_per_minute": 0, "tokens_per_minute": 0, "backoff_seconds": 1, "max_backoff_seconds": 8, **options}
+        return RateLimitedEmbeddings(provider, count_tokens=len, **options)
+
+    def test_retries_rate_limits_and_server_errors(self):
+        provider = FailingProvider(ProviderError(429), ProviderError(503))
+        model = self.model(provider)
+        with self.assertLogs("kb_service", "WARNING") as logs:
+            self.assertEqual(model.embed_batch(["a", "bb"]), [[1.0], [2.0]])
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(len(provider.requests), 3)
+        self.assertEqual(model.retries, 2)
+        # Full jitter: each delay is at most the exponential backoff of its attempt
+        self.assertEqual(len(self.clock.sleeps), 2)
+        for attempt, delay in enumerate(self.clock.sleeps):
+            self.assertLessEqual(delay, 2 ** attempt)
+
+    def test_client_errors_are_not_retried(self):
+        provider = FailingProvider(ProviderError(400))
+        model = self.model(provider)
+        with self.assertRaises(ProviderError):
+            model.embed_batch(["a"])
+        self.assertEqual(len(provider.requests), 1)
+        self.assertEqual(model.retries, 0)
+
+    def test_gives_up_after_max_retries(self):
+        provider = FailingProvider(*(ProviderError(503) for _ in range(5)))
+        model = self.model(provider, max_retries=2)
+        with self.assertRaises(ProviderError), self.assertLogs("kb_service", "WARNING"):
+            model.embed_batch(["a"])
+        self.assertEqual(len(provider.requests), 3)
+        self.assertEqual(model.retries, 2)
+
+    def test_retry_after_pauses_every_caller(self):
+        provider = FailingProvider(ProviderError(429, retry_after="7"))
+        model = self.model(provider)
+        with self.assertLogs("kb_service", "WARNING"):
+            model.embed_batch(["a"])
+        self.assertEqual(self.clock.sleeps, [7.0])
+
+        # A query that arrived 3 seconds into the pause waits for the rest of it
+        self.clock.sleeps.clear()
+        self.clock.now -= 3
+        model.embed("a")
+        self.assertEqual(self.clock.sleeps, [3.0])
+
+    def test_batches_wait_for_the_token_bucket(self):
+        model = self.model(FakeProvider(), tokens_per_minute=600)
+        self.assertEqual(model.max_request_tokens, 10)
+        model.embed_batch(["a" * 10])
+        self.assertEqual(self.clock.sleeps, [])
+        model.embed_batch(["a" * 5])
+        self.assertEqual(sum(self.clock.sleeps), 0.5)
+
+    def test_queries_are_charged_without_waiting(self):
+        model = self.model(FakeProvider(), requests_per_minute=60)
+        for _ in range(3):
+            model.embed("a")
+        self.assertEqual(self.clock.sleeps, [])
+        # The queries' debt is paid by the next batch
+        model.embed_batch(["a"])
+        self.assertEqual(sum(self.clock.sleeps), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Sync job queue tests, with the sync itself replaced by a function the test controls.
+
+    python -m unittest tests.test_jobs
+"""
+import time
+import threading
+import unittest
+from unittest import mock
+from src import jobs
+from src.jobs import JobStatus, SyncJob, SyncJobQueue
+
+class SyncJobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = []
+
+        def sync(db, kb_id, progress):
+            self.calls.append(kb_id)
+            self.started.set()
+            self.release.wait(5)
+            return {"status": "success", "kb_id": kb_id}
+
+        for name, value in (("sync_knowledge_base", sync), ("SessionLocal", mock.MagicMock)):
+            patcher = mock.patch.object(jobs, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.queue = SyncJobQueue(max_workers=2)
+        self.addCleanup(self.release.set)
+
+    def test_one_active_job_per_kb(self):
+        first = self.queue.submit("kb_1")
+        self.assertTrue(self.started.wait(5))
+        self.assertIs(self.queue.submit("kb_1"), first)
+        other = self.queue.submit("kb_2")
+        self.assertIsNot(other, first)
+
+        self.release.set()
+        self.assertTrue(first.wait(5))
+        self.assertTrue(other.wait(5))
+        self.assertEqual(first.status, JobStatus.COMPLETED)
+        self.assertEqual(first.result, {"status": "success", "kb_id": "kb_1"})
+        self.assertEqual(sorted(self.calls), ["kb_1", "kb_2"])
+
+        # Once finished, the next submit starts a new sync
+        again = self.queue.submit("kb_1")
+        self.assertIsNot(again, first)
+        self.assertTrue(again.wait(5))
+        self.assertEqual(self.calls.count("kb_1"), 2)
+
+    def test_failed_sync(self):
+        self.release.set()
+        with mock.patch.object(jobs, "sync_knowledge_base", side_effect=RuntimeError("boom")):
+            job = self.queue.submit("kb_1")
+            self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertEqual(job.result["status"], "error")
+        self.assertIsNotNone(job.finished_at)
+
+    def test_finished_jobs_are_pruned_after_retention(self):
+        self.release.set()
+        job = self.queue.submit("kb_1")
+        self.assertTrue(job.wait(5))
+        self.assertIs(self.queue.get(job.job_id), job)
+
+        with mock.patch.object(jobs, "SYNC_JOB_RETENTION_SECONDS", 60):
+            self.queue.submit("kb_2").wait(5)
+            self.assertIs(self.queue.get(job.job_id), job)
+            job.finished_at = time.time() - 120
+            self.queue.submit("kb_3").wait(5)
+        self.assertIsNone(self.queue.get(job.job_id))
+
+    def test_prune_skips_jobs_still_being_finished(self):
+        # A status published before finished_at must not break submit
+        job = SyncJob(kb_id="kb_1", status=JobStatus.COMPLETED)
+        self.queue._jobs[job.job_id] = job
+        with mock.patch.object(jobs, "SYNC_JOB_RETENTION_SECONDS", 0):
+            self.queue._prune()
+        self.assertIs(self.queue.get(job.job_id), job)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Keyset pagination tests on an in-memory SQLite database, walking every page
+of listings sorted by columns that hold NULLs.
+
+    python -m unittest tests.test_listing
+"""
+import unittest
+from datetime import datetime
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import Session
+from src import models
+from src.listing import ListQueryError, decode_cursor, encode_cursor, next_cursor, page_query, parse_fields
+
+# kb_id -> (description, last_updated_at); equal and missing values on both columns
+KNOWLEDGE_BASES = {
+    "kb_1": ("beta", datetime(2025, 1, 2, 9, 30)),
+    "kb_2": (None, None),
+    "kb_3": ("alpha", datetime(2025, 1, 1, 12, 0, 0, 500)),
+    "kb_4": ("beta", None),
+    "kb_5": (None, datetime(2025, 1, 2, 9, 30)),
+    "kb_6": ("alpha", datetime(2025, 1, 3)),
+    "kb_7": (None, datetime(2025, 1, 1, 12, 0, 0, 500)),
+}
+
+class PageQueryTest(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        self.addCleanup(engine.dispose)
+        models.Base.metadata.create_all(engine)
+        self.db = Session(engine)
+        self.addCleanup(self.db.close)
+        self.db.add(models.User(username="u", email="u@example.com", hashed_password="h"))
+        for kb_id, (description, last_updated_at) in KNOWLEDGE_BASES.items():
+            self.db.add(models.KnowledgeBase(
+                kb_id=kb_id,
+                name=kb_id,
+                description=description,
+                last_updated_at=last_updated_at,
+                created_by="u",
+            ))
+        self.db.flush()
+        # None is left to the server default on insert
+        missing = [kb_id for kb_id, (_, last_updated_at) in KNOWLEDGE_BASES.items() if last_updated_at is None]
+        self.db.execute(
+            update(models.KnowledgeBase).where(models.KnowledgeBase.kb_id.in_(missing)).values(last_updated_at=None)
+        )
+        self.db.commit()
+
+    def walk(self, sort: str, order: str, limit: int) -> list[str]:
+        seen, cursor = [], None
+        while True:
+            query = page_query(select(models.KnowledgeBase), models.KnowledgeBase, sort, order, "kb_id", limit, cursor)
+            rows = self.db.scalars(query).all()
+            seen.extend(row.kb_id for row in rows[:limit])
+            cursor = next_cursor(rows, sort, order, "kb_id", limit)
+            if cursor is None:
+                return seen
+            self.assertLessEqual(len(seen), len(KNOWLEDGE_BASES), "pagination doesn't end")
+
+    def expected(self, sort: str, order: str) -> list[str]:
+        # NULLs last ascending and first descending, ties in kb_id order
+        column = 0 if sort == "description" else 1
+        present = sorted((kb for kb in KNOWLEDGE_BASES if KNOWLEDGE_BASES[kb][column] is not None),
+                         key=lambda kb: (KNOWLEDGE_BASES[kb][column], kb))
+        missing = sorted(kb for kb in KNOWLEDGE_BASES if KNOWLEDGE_BASES[kb][column] is None)
+        if order == "desc":
+            return missing[::-1] + present[::-1]
+        return present + missing
+
+    def test_walks_every_row_once_in_order(self):
+        for sort in ("description", "last_updated_at"):
+            for order in ("asc", "desc"):
+                for limit in (1, 2, 3, 10):
+                    with self.subTest(sort=sort, order=order, limit=limit):
+                        self.assertEqual(self.walk(sort, order, limit), self.expected(sort, order))
+
+    def test_sorting_by_the_key(self):
+        kb_ids = sorted(KNOWLEDGE_BASES)
+        self.assertEqual(self.walk("kb_id", "asc", 3), kb_ids)
+        self.assertEqual(self.walk("kb_id", "desc", 3), kb_ids[::-1])
+
+    def test_cursor_round_trips_datetimes_and_nulls(self):
+        columns = [models.KnowledgeBase.last_updated_at, models.KnowledgeBase.kb_id]
+        for values in ([datetime(2025, 1, 1, 12, 0, 0, 500), "kb_3"], [None, "kb_2"]):
+            cursor = encode_cursor("last_updated_at", "asc", values)
+            self.assertEqual(decode_cursor(cursor, "last_updated_at", "asc", columns), values)
+
+    def test_invalid_cursors(self):
+        columns = [models.KnowledgeBase.description, models.KnowledgeBase.kb_id]
+        cursor = encode_cursor("description", "asc", ["alpha", "kb_3"])
+        with self.assertRaisesRegex(ListQueryError, "different sort order"):
+            decode_cursor(cursor, "description", "desc", columns)
+        with self.assertRaisesRegex(ListQueryError, "different sort order"):
+            decode_cursor(cursor, "name", "asc", columns)
+        for bad in ("not a cursor", cursor[:-4], encode_cursor("description", "asc", ["alpha"])):
+            with self.subTest(cursor=bad), self.assertRaisesRegex(ListQueryError, "Invalid cursor"):
+                decode_cursor(bad, "description", "asc", columns)
+
+class ParseFieldsTest(unittest.TestCase):
+    def test_fields(self):
+        allowed = {"kb_id", "name", "status"}
+        self.assertIsNone(parse_fields(None, allowed))
+        self.assertIsNone(parse_fields("", allowed))
+        self.assertEqual(parse_fields(" name, kb_id,,name ", allowed), ["name", "kb_id"])
+        with self.assertRaisesRegex(ListQueryError, "Unknown fields: secret"):
+            parse_fields("name,secret", allowed)
+
+if __name__ == "__main__":
+    unittest.main()
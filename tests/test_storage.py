@@ -0,0 +1,159 @@
+"""
+Blob store tests on a SQLite database in a temporary directory. Needs the
+aiosqlite driver for the async session.
+
+    python -m unittest tests.test_storage
+"""
+import os
+import shutil
+import pathlib
+import hashlib
+import tempfile
+import unittest
+import importlib.util
+from unittest import mock
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from src import models, storage
+
+@unittest.skipUnless(importlib.util.find_spec("aiosqlite"), "aiosqlite is not installed")
+class BlobStoreTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.root = pathlib.Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        patcher = mock.patch.object(storage, "BLOBS_DIR", self.root / "blobs")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sources_dir = self.root / "sources"
+        self.sources_dir.mkdir()
+
+        engine = create_async_engine(f"sqlite+aiosqlite:///{self.root / 'kb.db'}")
+        self.addAsyncCleanup(engine.dispose)
+        async with engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+        self.Session = async_sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
+
+    async def stage(self, content: bytes) -> tuple[str, int, str]:
+        tmp_path = await storage.new_tmp_path()
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        return tmp_path, len(content), hashlib.sha256(content).hexdigest()
+
+    async def add_source(self, db, file_id: str, content: bytes) -> models.FileMetadata:
+        tmp_path, file_size, content_hash = await self.stage(content)
+        file_path = str(self.sources_dir / f"{file_id}.txt")
+        async with storage.source_savepoint(db, file_path):
+            await storage.store_file(db, tmp_path, file_size, content_hash, file_path)
+            file_metadata = models.FileMetadata(
+                file_id=file_id,
+                filename=f"{file_id}.txt",
+                file_size=file_size,
+                content_hash=content_hash,
+                file_type="txt",
+                kb_id="kb_1",
+                file_path=file_path,
+                uploaded_by="u",
+            )
+            db.add(file_metadata)
+        return file_metadata
+
+    async def ref_count(self, content_hash: str) -> int | None:
+        async with self.Session() as db:
+            blob = await db.get(models.SourceBlob, content_hash)
+            return blob.ref_count if blob else None
+
+    async def test_identical_content_is_stored_once(self):
+        async with self.Session() as db:
+            first = await self.add_source(db, "file_a", b"same content")
+            second = await self.add_source(db, "file_b", b"same content")
+            await db.commit()
+
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(await self.ref_count(first.content_hash), 2)
+        path = storage.blob_path(first.content_hash)
+        self.assertEqual(path.read_bytes(), b"same content")
+        self.assertEqual(pathlib.Path(first.file_path).read_bytes(), b"same content")
+        self.assertEqual(os.listdir(storage.BLOBS_DIR / "tmp"), [])
+
+    async def test_failed_source_rolls_back_its_reference_and_link(self):
+        async with self.Session() as db:
+            kept = await self.add_source(db, "file_a", b"same content")
+            tmp_path, file_size, content_hash = await self.stage(b"same content")
+            file_path = str(self.sources_dir / "file_b.txt")
+            with self.assertRaises(RuntimeError):
+                async with storage.source_savepoint(db, file_path):
+                    await storage.store_file(db, tmp_path, file_size, content_hash, file_path)
+                    self.assertTrue(os.path.exists(file_path))
+                    raise RuntimeError("boom")
+            await db.commit()
+
+        self.assertFalse(os.path.lexists(file_path))
+        self.assertFalse(os.path.exists(tmp_path))
+        self.assertTrue(os.path.exists(kept.file_path))
+        self.assertEqual(await self.ref_count(content_hash), 1)
+
+    async def test_released_blob_is_deleted_after_commit(self):
+        async with self.Session() as db:
+            source = await self.add_source(db, "file_a", b"content")
+            await db.commit()
+        path = storage.blob_path(source.content_hash)
+
+        async with self.Session() as db:
+            await db.delete(await db.get(models.FileMetadata, "file_a"))
+            await storage.release_blob(db, source.content_hash)
+            # Still readable until the transaction commits
+            self.assertTrue(path.exists())
+            await db.commit()
+
+        self.assertFalse(path.exists())
+        self.assertIsNone(await self.ref_count(source.content_hash))
+
+    async def test_released_blob_is_kept_after_rollback(self):
+        async with self.Session() as db:
+            source = await self.add_source(db, "file_a", b"content")
+            await db.commit()
+        path = storage.blob_path(source.content_hash)
+
+        async with self.Session() as db:
+            await db.delete(await db.get(models.FileMetadata, "file_a"))
+            await storage.release_blob(db, source.content_hash)
+            await db.rollback()
+            # The session's next commit doesn't delete it either
+            await db.commit()
+
+        self.assertTrue(path.exists())
+        self.assertEqual(await self.ref_count(source.content_hash), 1)
+
+    async def test_released_blob_is_kept_after_savepoint_rollback(self):
+        async with self.Session() as db:
+            source = await self.add_source(db, "file_a", b"content")
+            await db.commit()
+        path = storage.blob_path(source.content_hash)
+
+        async with self.Session() as db:
+            with self.assertRaises(RuntimeError):
+                async with db.begin_nested():
+                    await db.delete(await db.get(models.FileMetadata, "file_a"))
+                    await storage.release_blob(db, source.content_hash)
+                    raise RuntimeError("boom")
+            await db.commit()
+
+        self.assertTrue(path.exists())
+        self.assertEqual(await self.ref_count(source.content_hash), 1)
+
+    async def test_blob_referenced_again_before_commit_is_kept(self):
+        async with self.Session() as db:
+            source = await self.add_source(db, "file_a", b"content")
+            await db.commit()
+        path = storage.blob_path(source.content_hash)
+
+        async with self.Session() as db:
+            await db.delete(await db.get(models.FileMetadata, "file_a"))
+            await storage.release_blob(db, source.content_hash)
+            await self.add_source(db, "file_b", b"content")
+            await db.commit()
+
+        self.assertTrue(path.exists())
+        self.assertEqual(await self.ref_count(source.content_hash), 1)
+
+if __name__ == "__main__":
+    unittest.main()
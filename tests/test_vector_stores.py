@@ -0,0 +1,107 @@
+"""
+VectorStoreWriter tests against an in-memory store that embeds what it
+inserts, like the real stores do.
+
+    python -m unittest tests.test_vector_stores
+"""
+import time
+import unittest
+from langchain_core.documents import Document
+from src.embeddings import BatchedEmbeddings
+from src.tokens import EmbeddingLimits
+from src.vector_stores import VectorStoreWriter
+
+class FakeProvider:
+    def embed(self, text: str) -> list[float]:
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        return [[float(len(text))] for text in texts]
+
+class FakeStore:
+    def __init__(self, embedding_model, fail_on: str = None, delay: float = 0):
+        self.embedding_model = embedding_model
+        self.fail_on = fail_on
+        self.delay = delay
+        self.operations = []
+        self.vectors = {}
+
+    def insert(self, data: str, metadata: dict, workspace_id: str):
+        if data == self.fail_on:
+            raise RuntimeError(f"cannot insert {data}")
+        time.sleep(self.delay)
+        vector = self.embedding_model.embed(data)
+        self.operations.append(("insert", metadata["file_id"], data))
+        self.vectors.setdefault(metadata["file_id"], []).append((data, vector))
+
+    def delete(self, metadata: dict, workspace_id: str):
+        self.operations.append(("delete", metadata["file_id"]))
+        self.vectors.pop(metadata["file_id"], None)
+
+def chunks(file_id: str, *texts: str) -> list[Document]:
+    return [Document(page_content=text, metadata={"file_id": file_id}) for text in texts]
+
+class VectorStoreWriterTest(unittest.TestCase):
+    def writer(self, store: FakeStore, **options) -> VectorStoreWriter:
+        self.done = []
+        self.batches = []
+        # Two chunks per batch, so a file's chunks span several writes
+        limits = EmbeddingLimits(max_input_tokens=0, max_batch_tokens=float("inf"), max_batch_size=2)
+        return VectorStoreWriter(
+            store,
+            store.embedding_model,
+            "w",
+            limits=limits,
+            count_tokens=len,
+            on_batch=self.batches.append,
+            on_done=lambda: self.done.append(True),
+            **options,
+        )
+
+    def test_replace_deletes_the_old_vectors_first(self):
+        store = FakeStore(BatchedEmbeddings(FakeProvider()))
+        store.vectors["file_a"] = [("old", [3.0])]
+        writer = self.writer(store)
+        writer.add("file_b", chunks("file_b", "b1", "b2", "b3"))
+        writer.add("file_a", chunks("file_a", "new 1", "new 2", "new 3"), replace=True)
+        writer.close()
+
+        self.assertEqual(store.vectors["file_a"], [("new 1", [5.0]), ("new 2", [5.0]), ("new 3", [5.0])])
+        self.assertEqual(store.vectors["file_b"], [("b1", [2.0]), ("b2", [2.0]), ("b3", [2.0])])
+        delete = store.operations.index(("delete", "file_a"))
+        first_insert = min(i for i, operation in enumerate(store.operations) if operation[:2] == ("insert", "file_a"))
+        self.assertLess(delete, first_insert)
+
+    def test_close_waits_for_every_write(self):
+        store = FakeStore(BatchedEmbeddings(FakeProvider()), delay=0.01)
+        writer = self.writer(store, queue_size=2)
+        texts = [f"chunk {i}" for i in range(9)]
+        writer.add("file_a", chunks("file_a", *texts))
+        writer.close()
+
+        self.assertEqual(self.done, [True])
+        self.assertEqual([data for _, _, data in store.operations], texts)
+        self.assertEqual(writer.chunks_written, 9)
+        self.assertEqual(sum(self.batches), 9)
+        self.assertTrue(all(size <= 2 for size in self.batches))
+
+    def test_store_error_is_raised_and_the_producer_released(self):
+        store = FakeStore(BatchedEmbeddings(FakeProvider()), fail_on="chunk 1")
+        writer = self.writer(store, queue_size=1)
+        # More chunks than the queue holds: add must not block after the failure
+        try:
+            for i in range(20):
+                writer.add("file_a", chunks("file_a", f"chunk {i}"))
+        except RuntimeError:
+            pass
+        with self.assertRaises(RuntimeError):
+            writer.close()
+        # The store is released once, and closing again reports the same error
+        with self.assertRaises(RuntimeError):
+            writer.close()
+        self.assertEqual(self.done, [True])
+        with self.assertRaises(RuntimeError):
+            writer.add("file_b", chunks("file_b", "b"))
+
+if __name__ == "__main__":
+    unittest.main()